@@ -1,4 +1,5 @@
-import re
+import re, math
+import numpy as np
 
 class General:
     
@@ -6,37 +7,70 @@ class General:
     
     kmer=re.compile(r"[ATCGN]+")
     
+    complement=str.maketrans("ACGTN","TGCAN")
+    
+    complements=np.zeros(256, dtype="uint8")
+    complements[[ord(base) for base in map.keys()]] = [ord(base) for base in map.values()]
+    complements=complements.tobytes()
+    
     def reverse_complement(kmer: str) -> str: 
         """Return the reverse complement of the provided k-mer"""
         try:
-            rckmer = ""
-            for base in kmer:
-                rckmer += General.map[base]
-            rckmer = rckmer[::-1]
-            return rckmer[:]
+            if len(kmer)==0 or re.fullmatch(General.kmer, kmer):
+                return kmer.translate(General.complement)[::-1]
         except Exception as e:
-            raise Exception("invalid k-mer: "+str(kmer))
+            pass
+        raise Exception("invalid k-mer: "+str(kmer))
 
     def canonical(kmer: str) -> str:
         """Return the canonical form of the provided k-mer"""
-        if not re.fullmatch(General.kmer, kmer):
-            raise Exception("invalid k-mer: "+str(kmer))
+        try:
+            if re.fullmatch(General.kmer, kmer):
+                return min(kmer,kmer.translate(General.complement)[::-1])
+        except Exception as e:
+            pass
+        raise Exception("invalid k-mer: "+str(kmer))
+    
+    def _many(kmers, method, scalarMethod):
+        #fixed-width byte arrays, or lists with k-mers of equal length
+        if isinstance(kmers,np.ndarray):
+            if len(kmers)==0:
+                return kmers
+            data = np.ascontiguousarray(kmers).view("uint8").reshape(len(kmers),-1)
+            result = method(data)
+            return result.view(kmers.dtype).ravel()
+        elif len(kmers)==0:
+            return []
+        elif len(set([len(kmer) for kmer in kmers]))>1:
+            return [scalarMethod(kmer) for kmer in kmers]
         else:
-            try:
-                rckmer = ""
-                do_check=True
-                for (base,rcbase) in zip(kmer,kmer[::-1]):
-                    rcbase = General.map[rcbase]
-                    if do_check:
-                        if base<rcbase:
-                            return kmer
-                        elif rcbase<base:
-                            do_check = False
-                    rckmer += rcbase
-                return rckmer[:]
-            except Exception as e:
-                raise Exception("invalid k-mer: "+str(kmer))
+            data = np.array(kmers, dtype="S").view("uint8").reshape(len(kmers),-1)
+            result = method(data)
+            return [kmer.decode() for kmer in result.view("S{}".format(data.shape[1])).ravel()]
+    
+    def _reverse_complement_many(data):
+        result = data.tobytes().translate(General.complements)
+        if 0 in result:
+            row = result.index(0)//data.shape[1]
+            raise Exception("invalid k-mer: "+str(data[row].tobytes().decode()))
+        return np.frombuffer(result, dtype="uint8").reshape(data.shape)[:,::-1].copy()
+
+    def _canonical_many(data):
+        result = General._reverse_complement_many(data)
+        kmers = data.view("S{}".format(data.shape[1])).ravel()
+        rkmers = result.view("S{}".format(data.shape[1])).ravel()
+        selection = kmers<rkmers
+        result[selection] = data[selection]
+        return result
         
+    def reverse_complement_many(kmers):
+        """Return the reverse complements for a list or fixed-width byte array of k-mers"""
+        return General._many(kmers, General._reverse_complement_many, General.reverse_complement)
+    
+    def canonical_many(kmers):
+        """Return the canonical forms for a list or fixed-width byte array of k-mers"""
+        return General._many(kmers, General._canonical_many, General.canonical)
+
     def is_canonical(kmer: str) -> str:
         """Test if provided k-mer is canonical"""
         try:
@@ -48,4 +82,75 @@ class General:
                     return False
             return True
         except Exception as e:
-            raise Exception("invalid k-mer: "+str(kmer))
\ No newline at end of file
+            raise Exception("invalid k-mer: "+str(kmer))
+
+    code={"A" : 0, "C" : 1, "G" : 2, "T" : 3}
+    
+    codes=np.full(256, 255, dtype="uint8")
+    codes[[ord(base) for base in code.keys()]] = list(code.values())
+            
+    def encode(kmer: str) -> int:
+        """Return the order preserving 2-bit packed integer for the provided k-mer"""
+        try:
+            value = 0
+            for base in kmer:
+                value = (value<<2) | General.code[base]
+            return value
+        except Exception as e:
+            raise Exception("invalid k-mer: "+str(kmer))
+            
+    def decode(value, k: int) -> str:
+        """Return the k-mer for the provided 2-bit packed integer or words"""
+        if not isinstance(value,int):
+            words = np.atleast_1d(value)
+            value = 0
+            for word in words:
+                value = (value<<64) | int(word)
+        return "".join(["ACGT"[(value>>(2*(k-1-i))) & 3] for i in range(k)])
+    
+    def encode_many(kmers) -> np.ndarray:
+        """Return order preserving 2-bit packed integers for a list or array of k-mers, 
+        with two or more words per k-mer if k>32"""
+        if isinstance(kmers,np.ndarray) and kmers.dtype.kind=="u" and kmers.ndim==2:
+            data = kmers
+        else:
+            if not isinstance(kmers,np.ndarray):
+                kmers = np.array(kmers, dtype="S")
+            if len(kmers)==0:
+                return np.zeros(0, dtype="uint64")
+            data = np.ascontiguousarray(kmers).view("uint8").reshape(len(kmers),-1)
+        codes = General.codes[data]
+        if (codes==255).any():
+            raise Exception("invalid k-mer: "+str(kmers[np.flatnonzero((codes==255).any(axis=1))[0]]))
+        words = General.encode_codes(codes)
+        return words[:,0] if words.shape[1]==1 else words
+    
+    def decode_many(values: np.ndarray, k: int) -> np.ndarray:
+        """Return an array of k-mers for 2-bit packed integers"""
+        codes = General.decode_codes(values.reshape(len(values),-1), k)
+        return np.frombuffer(b"ACGT",dtype="uint8")[codes].view("S{}".format(k)).ravel()
+
+    def encode_codes(codes: np.ndarray) -> np.ndarray:
+        """Return order preserving packed words for an array of 2-bit codes with one row per k-mer"""
+        k = codes.shape[1]
+        numberOfWords = math.ceil(k/32)
+        words = np.zeros((len(codes),numberOfWords), dtype="uint64")
+        start = 0
+        for w in range(numberOfWords):
+            end = k - 32*(numberOfWords-w-1)
+            for i in range(start,end):
+                words[:,w] = (words[:,w]<<np.uint64(2)) | codes[:,i].astype("uint64")
+            start = end
+        return words
+
+    def decode_codes(words: np.ndarray, k: int) -> np.ndarray:
+        """Return an array of 2-bit codes with one row per k-mer for packed words"""
+        numberOfWords = words.shape[1]
+        codes = np.zeros((len(words),k), dtype="uint8")
+        end = k
+        for w in range(numberOfWords-1,-1,-1):
+            start = max(0,end-32)
+            for i in range(start,end):
+                codes[:,i] = (words[:,w] >> np.uint64(2*(end-1-i))) & np.uint64(3)
+            end = start
+        return codes
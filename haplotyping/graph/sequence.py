@@ -89,9 +89,11 @@ class SequenceGraph(APIGraph):
             endCandidate = None
             dataIndex = {item["ckmer"]: item for item in data}
             #create initial k-mers
-            for i in range(len(self._sequence)-(self._k-1)):
-                kmer = self._sequence[i:i+self._k]
-                ckmer = haplotyping.General.canonical(kmer)
+            kmers = [self._sequence[i:i+self._k] for i in range(len(self._sequence)-(self._k-1))]
+            ckmers = haplotyping.General.canonical_many(kmers)
+            for i in range(len(kmers)):
+                kmer = kmers[i]
+                ckmer = ckmers[i]
                 if kmer==ckmer:
                     if ckmer in forward_positions.keys():
                         forward_positions[ckmer].append(i)
@@ -1,11 +1,13 @@
 import logging, h5py, tables, gzip, time
-import os, sys, math, signal, psutil
+import os, sys, math, signal, psutil, pickle, ahocorasick
 import re, haplotyping
 import numpy as np
 import haplotyping.index.storage
 import haplotyping.index.splits
 import haplotyping.index.database
+import haplotyping.index.fastq
 import multiprocessing as mp
+import threading
 from threading import Event
 from queue import Empty
 
@@ -16,9 +18,17 @@ class Connections:
     """
     
     stepSizeStorage = 1000000
+    calibrationReads = 200000
+    ringSampleReads = 10000
+    ringSlotsPerWorker = 4
+    schedulerInterval = 5
+    schedulerBacklog = 4
+    schedulerCooldown = 3
+    sparseDirectFraction = 0.25
     
     def __init__(self, unpairedReadFiles, pairedReadFiles, h5file, filenameBase, 
-                 indexType=None, debug=False, keepTemporaryFiles=False):
+                 indexType=None, debug=False, keepTemporaryFiles=False,
+                 artifactCache=None, artifactCacheSize=0, scratchDirectory=None):
         
         """
         Internal use only: initialize
@@ -33,16 +43,35 @@ class Connections:
                     
         self.debug = debug
         self.keepTemporaryFiles = keepTemporaryFiles
+        self.artifactCache = artifactCache
+        self.artifactCacheSize = artifactCacheSize
         self.indexType = indexType
         self.filenameBase = filenameBase
+        #temporary files in the scratch directory if provided
+        self.temporaryBase = (filenameBase if scratchDirectory==None 
+                              else os.path.join(scratchDirectory,os.path.basename(filenameBase)))
+        if not scratchDirectory==None:
+            os.makedirs(scratchDirectory, exist_ok=True)
         
         #set variables
         self.k = h5file["/config"].attrs["k"]
         self.automatonKmerSize = h5file["/config"].attrs["automatonKmerSize"]
+        self.calibrateAutomaton = h5file["/config"].attrs.get("calibrateAutomaton",False)
         self.maximumFrequency = h5file["/config"].attrs["maximumCanonicalSplitFrequency"]
         self.minimumFrequency = h5file["/config"].attrs["minimumCanonicalSplitFrequency"]
         self.maximumMemory = h5file["/config"].attrs["maximumMemory"]
         self.maximumProcesses = h5file["/config"].attrs["maximumProcesses"]
+        self.packedKmers = h5file["/config"].attrs.get("packedKmers",False)
+        self.matchEngine = h5file["/config"].attrs.get("matchEngine",haplotyping.index.database.Database.AUTOMATON)
+        self.readBatchSize = h5file["/config"].attrs.get("readBatchSize",1000)
+        self.readTransport = h5file["/config"].attrs.get("readTransport",haplotyping.index.database.Database.QUEUE)
+        self.readerProcesses = h5file["/config"].attrs.get("readerProcesses",1)
+        self.adaptiveWorkers = h5file["/config"].attrs.get("adaptiveWorkers",False)
+        self.directAccumulator = h5file["/config"].attrs.get("directAccumulator",
+                                                             haplotyping.index.database.Database.DENSE)
+        self.partitioner = h5file["/config"].attrs.get("partitioner",haplotyping.index.database.Database.METIS)
+        self.maximumPartitions = h5file["/config"].attrs.get("maximumPartitions",0)
+        self.partitionSize = h5file["/config"].attrs.get("partitionSize",0)
         self.numberOfKmers = h5file["/split/ckmer"].shape[0]
         self.totalNumberOfKmers = h5file["/config"].attrs["numberKmers"]
         self.h5file = h5file
@@ -82,13 +111,22 @@ class Connections:
             #process
             try:                                                
                 #create automaton and index
-                automatonKmerSize = (math.ceil((self.k+1)/2) 
-                                     if self.automatonKmerSize==0 else min(self.k,self.automatonKmerSize))  
-                self.automatonKmerSize = automatonKmerSize
-                (automatonMemory,indexFile, automatonFile) = haplotyping.index.splits.Splits.createAutomatonWithIndex(
-                    self.h5file, filenameBase, automatonKmerSize)
+                if self.matchEngine==haplotyping.index.database.Database.SEARCHSORTED:
+                    automatonKmerSize = None
+                    (automatonMemory,indexFile, automatonFile) = (0,None,None,)
+                else:
+                    if not self.automatonKmerSize==0:
+                        automatonKmerSize = min(self.k,self.automatonKmerSize)
+                    elif self.calibrateAutomaton:
+                        automatonKmerSize = self._calibrateAutomatonKmerSize(filenameBase)
+                    else:
+                        automatonKmerSize = math.ceil((self.k+1)/2)
+                    self.automatonKmerSize = automatonKmerSize
+                    (automatonMemory,indexFile, automatonFile) = haplotyping.index.splits.Splits.createAutomatonWithIndex(
+                        self.h5file, filenameBase, automatonKmerSize, 
+                        self.artifactCache, self.artifactCacheSize, self._numberOfProcesses())
                 #process
-                pytablesFile = filenameBase+"_tmp_connections_merge.h5"
+                pytablesFile = self.temporaryBase+"_tmp_connections_merge.h5"
                 if os.path.exists(pytablesFile):
                     os.remove(pytablesFile)
                 self._logger.debug("store temporary in "+pytablesFile)    
@@ -101,13 +139,16 @@ class Connections:
                         self._processReads(pytablesStorage)
                         self._storeReads(pytablesStorage)
                         self.h5file.flush()     
+                    pytablesStorage.flush()
+                    self._reportTemporary("connections",[pytablesFile])
             #except Exception as e:
             #   self._logger.error("problem occurred while processing reads: "+str(e))
             finally:
                 try:
                     if not self.keepTemporaryFiles:
                         os.remove(pytablesFile)
-                        haplotyping.index.splits.Splits.deleteAutomatonWithIndex(filenameBase, automatonKmerSize)
+                        if not automatonKmerSize==None:
+                            haplotyping.index.splits.Splits.deleteAutomatonWithIndex(filenameBase, automatonKmerSize)
                 except:
                     self._logger.error("problem removing files")
 
@@ -149,6 +190,24 @@ class Connections:
 # Handle Memory
 #---------------
 
+    def _numberOfProcesses(self):
+        return max(1,(mp.cpu_count() if self.maximumProcesses==0 else self.maximumProcesses)-1)
+
+    def _createRing(self, numberOfSlots, slotSize):
+        shm = mp.shared_memory.SharedMemory(create=True, size=numberOfSlots*slotSize)
+        queue_slots = mp.Queue()
+        for slot in range(numberOfSlots):
+            queue_slots.put(slot)
+        return (shm, slotSize, queue_slots,)
+
+    def _releaseRing(self, ring):
+        if not ring==None:
+            ring[0].close()
+            try:
+                ring[0].unlink()
+            except Exception as e:
+                self._logger.debug("problem unlinking shared memory ({})".format(e))
+            
     def _processMemory():
         process = psutil.Process(os.getpid())
         memory = process.memory_info().rss
@@ -156,18 +215,193 @@ class Connections:
             memory += child.memory_info().rss
         return memory
     
+#------------------------
+# Calibrate Automaton
+#------------------------
+
+    def _sampleReads(self, numberOfReads: int):
+        """
+        Sample reads from the start of all read files
+        """
+        readFiles = list(self.unpairedReadFiles)
+        for pairedReadFile in self.pairedReadFiles:
+            readFiles.extend(pairedReadFile)
+        reads = []
+        if len(readFiles)>0:
+            readsPerFile = math.ceil(numberOfReads/len(readFiles))
+            for filename in readFiles:
+                open_fn = gzip.open if filename.endswith(".gz") else open
+                with open_fn(filename, "rt") as f:
+                    for i, line in enumerate(f):
+                        if i%4==1:
+                            reads.append(line.rstrip())
+                        elif i>=4*readsPerFile:
+                            break
+        return reads
+
+    def _calibrateAutomatonKmerSize(self, filenameBase):
+        """
+        Select automaton k-mer size with the highest expected read throughput within the available memory
+        """
+        defaultKmerSize = math.ceil((self.k+1)/2)
+        candidates = sorted(set([min(self.k,max(8,round(self.k*f))) for f in [0.375,0.625,0.75]]+[defaultKmerSize]))
+        reads = self._sampleReads(Connections.calibrationReads)
+        if len(reads)==0:
+            self._logger.debug("no reads to calibrate automaton, use k' = {}".format(defaultKmerSize))
+            return defaultKmerSize
+        self._logger.info("calibrate automaton on {} reads for k' in {}".format(len(reads),candidates))
+        #available memory and processes
+        process = psutil.Process(os.getpid())
+        if self.maximumMemory>0:
+            maximumMemory = min(psutil.virtual_memory().available + process.memory_info().rss, self.maximumMemory)
+        else:
+            maximumMemory = round(0.95*psutil.virtual_memory().available) + process.memory_info().rss
+        nWorkers = max(3,mp.cpu_count()-1) if self.maximumProcesses==0 else self.maximumProcesses - 1
+        #splitting k-mers to verify candidates
+        index = self.h5file["/split/ckmer"].fields("ckmer")[:]
+        if self.packedKmers:
+            index = index.reshape(len(index),-1)
+        indexSize = index.nbytes
+        results = []
+        for automatonKmerSize in candidates:
+            (automatonMemory,indexFile,automatonFile) = haplotyping.index.splits.Splits.createAutomatonWithIndex(
+                self.h5file, filenameBase, automatonKmerSize, 
+                self.artifactCache, self.artifactCacheSize, self._numberOfProcesses())
+            automatonSplits = ahocorasick.load(automatonFile,pickle.loads)
+            numberOfPositions = 0
+            numberOfCandidates = 0
+            numberOfChecks = 0
+            numberOfMatches = 0
+            startTime = time.time()
+            for i in range(0,len(reads),self.readBatchSize):
+                batch = [(sequence,haplotyping.index.storage.Storage.automaton_matches(
+                             sequence,automatonSplits,self.k,automatonKmerSize),) 
+                         for sequence in reads[i:i+self.readBatchSize]]
+                (found,checks) = haplotyping.index.storage.Storage.verify_matches(
+                    batch,index,self.k,self.packedKmers)
+                numberOfPositions += sum([max(0,len(sequence)-self.k+1) for (sequence,clist) in batch])
+                numberOfCandidates += sum([len(clist) for (sequence,clist) in batch])
+                numberOfChecks += checks
+                numberOfMatches += sum([len(matches) for matches in found])
+            processTime = max(time.time()-startTime,1e-6)
+            automatonSplits.clear()
+            del automatonSplits
+            #parallel automaton workers if the shared automaton fits in memory
+            if indexSize+automatonMemory<=maximumMemory:
+                nWorkersAutomaton = max(1,math.floor(nWorkers/3))
+            else:
+                nWorkersAutomaton = 0
+            throughput = nWorkersAutomaton*len(reads)/processTime
+            results.append((automatonKmerSize,automatonMemory,numberOfCandidates/max(1,numberOfPositions),
+                            numberOfChecks/max(1,numberOfCandidates),numberOfMatches/max(1,numberOfCandidates),
+                            throughput,))
+            self._logger.debug("automaton k' = {}: {} MB, {} candidates, {} checks, {} matches, {} reads/s".format(
+                automatonKmerSize,math.ceil(automatonMemory/1048576),numberOfCandidates,numberOfChecks,
+                numberOfMatches,round(throughput)))
+        #select
+        selection = max(results, key=lambda result: (result[5],-result[0]))
+        if selection[5]<=0:
+            selection = min(results, key=lambda result: result[1])
+        automatonKmerSize = selection[0]
+        self._logger.info("selected automaton with k' = {}".format(automatonKmerSize))
+        if not self.keepTemporaryFiles:
+            for result in results:
+                if not result[0]==automatonKmerSize:
+                    haplotyping.index.splits.Splits.deleteAutomatonWithIndex(filenameBase, result[0])
+        #register
+        dtypeList = [("automatonKmerSize","uint16"),("memory","uint64"),("matchRate","float32"),
+                     ("checkRate","float32"),("verificationRate","float32"),("throughput","float32")]
+        if "automatonCalibration" in self.h5file["/config/"].keys():
+            del self.h5file["/config/automatonCalibration"]
+        dt=np.dtype(dtypeList)
+        options=haplotyping.index.Database.getStorageOptions(self.h5file,(len(results),),dt)
+        ds = self.h5file["/config/"].create_dataset("automatonCalibration",(len(results),),
+                                          dtype=dt, 
+                                          **options)
+        ds[0:len(results)] = results
+        self.h5file["/config/"].attrs["automatonCalibrationReads"] = len(reads)
+        self.h5file["/config/"].attrs["automatonKmerSizeCalibrated"] = automatonKmerSize
+        return automatonKmerSize
+
 #-----------------------------------
 # Main functions Direct Connections
 #-----------------------------------
 
+    def _estimateIndexMemory(nWorkersAutomaton,workerAutomatonMemory,nWorkersMatches,
+                             workerMatchesMemory,nWorkersIndex,workerIndexMemory):
+        return ((nWorkersAutomaton*workerAutomatonMemory) + 
+                (nWorkersMatches*workerMatchesMemory) + 
+                (nWorkersIndex*workerIndexMemory))
+    
+    def _workerMatchesMemory(numberOfKmers,maximumFrequency,estimatedMaximumReadLength,numberDirectArray,
+                             directAccumulator):
+        """
+        Estimated memory for a matches worker, and the maximum number of direct connections in memory if sparse
+        """
+        if directAccumulator==haplotyping.index.database.Database.SPARSE:
+            #only occurring connections, keep a fraction in memory and write more as sorted runs
+            sparseMaximum = max(1,math.ceil(Connections.sparseDirectFraction*numberOfKmers))
+            workerMatchesMemory = haplotyping.index.storage.Storage.worker_sparse_memory(
+                sparseMaximum,numberOfKmers,estimatedMaximumReadLength)
+        else:
+            sparseMaximum = 0
+            workerMatchesDtypeEntry = haplotyping.index.storage.Storage.worker_matches_dtype(
+                numberOfKmers,maximumFrequency,estimatedMaximumReadLength,numberDirectArray)
+            workerMatchesMemory = numberOfKmers * np.dtype(workerMatchesDtypeEntry).itemsize
+        return (workerMatchesMemory,sparseMaximum,)
+    
+    def _distributeWorkers(nWorkers,matchEngine,maximumMemory,workerSharedMemory,
+                           workerAutomatonMemory,workerMatchesMemory,workerIndexMemory):
+        """
+        Number of automaton, matches and index workers within the memory limit, and the estimated memory
+        """
+        #compute number of automaton workers, the automaton itself is shared
+        #assume that ideal ratio workers is 1:2:4 (to be verified/computed?)
+        if matchEngine==haplotyping.index.database.Database.SEARCHSORTED:
+            minimumWorkersAutomaton = 0
+            nWorkersAutomaton = 0
+        else:
+            minimumWorkersAutomaton = 1
+            nWorkersAutomaton = max(1,math.floor(nWorkers/3))
+        #auto distribute other workers within limits
+        nWorkersMatches = math.floor((nWorkers - nWorkersAutomaton)/2)
+        nWorkersIndex = nWorkers - nWorkersAutomaton - nWorkersMatches        
+        #increment if processes available
+        nWorkersLeft = nWorkers - nWorkersAutomaton - nWorkersMatches - nWorkersIndex
+        while(nWorkersLeft>0):
+            if(nWorkersLeft>0):
+                nWorkersMatches+=1
+                nWorkersLeft-=1
+            if(nWorkersLeft>0):
+                nWorkersIndex+=1
+                nWorkersLeft-=1                                         
+        if nWorkersMatches<1 or nWorkersIndex<1:
+            raise Exception("not enough processes available, maximum: {}".format(nWorkers+1))
+        #reduce to fit memory requirements, never below one worker for each stage
+        while (estimatedMemory := Connections._estimateIndexMemory(nWorkersAutomaton,workerAutomatonMemory,
+                             nWorkersMatches,workerMatchesMemory,
+                             nWorkersIndex,workerIndexMemory)) + workerSharedMemory > maximumMemory:
+            if (nWorkersMatches>1) and ((nWorkersMatches>nWorkersAutomaton) or 
+                                        (nWorkersAutomaton<=minimumWorkersAutomaton)):
+                nWorkersMatches -= 1
+                nWorkersIndex = nWorkersIndex+1
+            elif nWorkersAutomaton>minimumWorkersAutomaton:
+                nWorkersAutomaton-=1
+                nWorkersIndex = nWorkersIndex+1
+            elif nWorkersIndex>1:
+                nWorkersIndex -= 1
+            else:
+                raise Exception("not enough memory available, required: {} MB".format(
+                    round((estimatedMemory+workerSharedMemory)/1048576)))
+        #don't oversize the index workers, maximum two times matches workers
+        nWorkersIndex = min(nWorkersIndex,2*nWorkersMatches)
+        #final calculation memory estimation
+        estimatedMemory = Connections._estimateIndexMemory(nWorkersAutomaton,workerAutomatonMemory,
+                             nWorkersMatches,workerMatchesMemory,nWorkersIndex,workerIndexMemory) + workerSharedMemory
+        return (nWorkersAutomaton,nWorkersMatches,nWorkersIndex,estimatedMemory,)
+
     def _processReadFiles(self, indexFile, automatonFile, automatonMemory, pytablesStorage):
           
-        def estimateIndexMemory(nWorkersAutomaton,workerAutomatonMemory,nWorkersMatches,
-                           workerMatchesMemory,nWorkersIndex,workerIndexMemory):
-            return ((nWorkersAutomaton*workerAutomatonMemory) + 
-                    (nWorkersMatches*workerMatchesMemory) + 
-                    (nWorkersIndex*workerIndexMemory))
-                
         #get method
         self._logger.debug("using method '{}' for multiprocessing".format(mp.get_start_method()))
         process = psutil.Process(os.getpid())
@@ -176,7 +410,10 @@ class Connections:
         self._logger.debug("memory info: {}".format(psutil.Process(os.getpid()).memory_info()))
         
         #compute size shared memory k-mer index (to confirm results from automaton)
-        shm_index_size = os.path.getsize(indexFile)
+        if self.matchEngine==haplotyping.index.database.Database.SEARCHSORTED:
+            shm_index_size = self.numberOfKmers*8*math.ceil(self.k/32)
+        else:
+            shm_index_size = os.path.getsize(indexFile)
         self._logger.debug("size shared memory {} MB k-mer index".format(math.ceil(shm_index_size/1048576)))
                     
         #compute size shared memory k-mer type, number and bases
@@ -194,18 +431,20 @@ class Connections:
         queue_index = mp.JoinableQueue(qsize)
         queue_matches = mp.JoinableQueue(qsize)
         queue_finished = mp.Queue()
+        #number of reads in the automaton, index and matches queues, and total number of reads taken from them
+        queue_sizes = mp.Array("q",6)
         queue_storageDirect = mp.Queue()
         queue_storageReads = mp.Queue()
         
-        #estimate worker automaton memory
-        workerAutomatonMemory = automatonMemory
+        #estimate worker automaton memory (shared copy-on-write)
+        workerAutomatonMemory = 0
         #estimate worker matches memory
-        workerMatchesDtypeEntry = haplotyping.index.storage.Storage.worker_matches_dtype(
-            self.numberOfKmers,self.maximumFrequency,self.estimatedMaximumReadLength,self.numberDirectArray)
-        workerMatchesMemory = self.numberOfKmers * np.dtype(workerMatchesDtypeEntry).itemsize
+        (workerMatchesMemory,sparseMaximum,) = Connections._workerMatchesMemory(
+            self.numberOfKmers,self.maximumFrequency,self.estimatedMaximumReadLength,self.numberDirectArray,
+            self.directAccumulator)
         #estimate worker index memory (shared)
         workerIndexMemory = 0
-        workerSharedMemory = (shm_kmer_size+shm_index_size)
+        workerSharedMemory = (shm_kmer_size+shm_index_size+automatonMemory)
         
         self._logger.debug("estimated shared memory: {} MB".format(math.ceil(workerSharedMemory/1048576)))
         self._logger.debug("estimated memory automaton worker: {} MB".format(math.ceil(workerAutomatonMemory/1048576)))
@@ -222,75 +461,66 @@ class Connections:
             maximumMemory = round(0.95*psutil.virtual_memory().available) + process.memory_info().rss    
             
             
-        #compute maximum number of automaton workers (high memory usage)
-        #assume that ideal ratio workers is 1:2:4 (to be verified/computed?)
-        nWorkersAutomaton = max(1,min(math.floor(nWorkers/3),
-                                      math.floor((maximumMemory-workerSharedMemory)/
-                                             estimateIndexMemory(1,workerAutomatonMemory,
-                                                                 2,workerMatchesMemory,
-                                                                 4,workerIndexMemory))))
-        #auto distribute other workers within limits
-        nWorkersMatches = math.floor((nWorkers - nWorkersAutomaton)/2)
-        nWorkersIndex = nWorkers - nWorkersAutomaton - nWorkersMatches        
-        #increment if processes available
-        nWorkersLeft = nWorkers - nWorkersAutomaton - nWorkersMatches - nWorkersIndex
-        while(nWorkersLeft>0):
-            if(nWorkersLeft>0):
-                nWorkersMatches+=1
-                nWorkersLeft-=1
-            if(nWorkersLeft>0):
-                nWorkersIndex+=1
-                nWorkersLeft-=1                                         
-        #reduce to fit memory requirements   
-        while (estimatedMemory := estimateIndexMemory(nWorkersAutomaton,workerAutomatonMemory,
-                             nWorkersMatches,workerMatchesMemory,
-                             nWorkersIndex,workerIndexMemory)) + workerSharedMemory > maximumMemory:
-            if (nWorkersAutomaton==1) and (nWorkersMatches==1) and (nWorkersIndex==1):
-                raise Exception("not enough memory available, required: {} MB".format(round(estimatedMemory/1048576)))
-            elif (nWorkersAutomaton==1) and (nWorkersMatches==1):
-                nWorkersIndex -= 1
-            elif (nWorkersMatches>nWorkersAutomaton):
-                nWorkersMatches -= 1
-                nWorkersIndex = nWorkersIndex+1
-            else:
-                nWorkersAutomaton-=1
-                nWorkersIndex = nWorkersIndex+1
-        #don't oversize the index workers, maximum two times matches workers
-        nWorkersIndex = min(nWorkersIndex,2*nWorkersMatches)
-        #final calculation memory estimation
-        estimatedMemory = estimateIndexMemory(nWorkersAutomaton,workerAutomatonMemory,
-                             nWorkersMatches,workerMatchesMemory,nWorkersIndex,workerIndexMemory) + workerSharedMemory
+        (nWorkersAutomaton,nWorkersMatches,nWorkersIndex,estimatedMemory,) = Connections._distributeWorkers(
+            nWorkers,self.matchEngine,maximumMemory,workerSharedMemory,
+            workerAutomatonMemory,workerMatchesMemory,workerIndexMemory)
         
         self._logger.debug("start {} processes to parse reads with reduced automaton".format(nWorkersAutomaton))
         self._logger.debug("start {} processes to check index".format(nWorkersIndex))
         self._logger.debug("start {} processes to process matches".format(nWorkersMatches))
         self._logger.debug("estimated total memory usage: {} MB".format(math.ceil(estimatedMemory/1048576)))
+        
+        #optionally pass reads and matches through slots in shared memory, only slot numbers are queued
+        if self.readTransport==haplotyping.index.database.Database.SHAREDMEMORY:
+            reads = self._sampleReads(Connections.ringSampleReads)
+            slotSize = 32+self.readBatchSize*(16+2*max([len(read) for read in reads]+[self.k]))
+            ring_reads = self._createRing(Connections.ringSlotsPerWorker*(nWorkersAutomaton+nWorkersIndex),slotSize)
+            #matches are stored as three integers, larger batches will be queued
+            ring_matches = self._createRing(Connections.ringSlotsPerWorker*nWorkersMatches,8*slotSize)
+            self._logger.debug("created shared memory rings with {} and {} slots of {} and {} KB".format(
+                ring_reads[0].size//ring_reads[1],ring_matches[0].size//ring_matches[1],
+                math.ceil(ring_reads[1]/1024),math.ceil(ring_matches[1]/1024)))
+            worker_ring_reads = (ring_reads[0].name,ring_reads[1],ring_reads[2],)
+            worker_ring_matches = (ring_matches[0].name,ring_matches[1],ring_matches[2],)
+        else:
+            (ring_reads,ring_matches,worker_ring_reads,worker_ring_matches,) = (None,None,None,None,)
                 
         original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
-        pool_automaton = mp.get_context("spawn").Pool(nWorkersAutomaton, haplotyping.index.storage.Storage.workerAutomaton, 
-                             (shutdown_event,queue_start,queue_automaton,queue_index,queue_finished,
-                              self.k,self.automatonKmerSize,automatonFile,))
-        #first start automatons, one at a time, because of memory peak
+        #automaton is loaded once, the workers are forked from this process
+        if nWorkersAutomaton>0:
+            process_automaton = mp.get_context("spawn").Process(target=haplotyping.index.storage.Storage.workerAutomaton, 
+                                 args=(shutdown_event,queue_start,queue_automaton,queue_index,queue_finished,
+                                  self.k,self.automatonKmerSize,automatonFile,nWorkersAutomaton,queue_sizes,
+                                  worker_ring_reads,))
+            process_automaton.start()
+            queue_start.put("automaton")
+        else:
+            process_automaton = None
         startedAutomaton = 0
-        queue_start.put("automaton")
-        while not (startedAutomaton==nWorkersAutomaton):
+        while startedAutomaton<nWorkersAutomaton:
             try:
                 item = queue_finished.get(block=True, timeout=1)
                 if item=="automaton:started":
                     startedAutomaton+=1
                     self._logger.debug("{} of {} automatons started".format(startedAutomaton,nWorkersAutomaton))
-                    if startedAutomaton<nWorkersAutomaton:
-                        queue_start.put("automaton")
                 else:
                     self._logger.error("unexpected start value in finished queue: {}".format(item))
             except:
                 pass
             time.sleep(1)
             
-        #create shared memory k-mer index (to confirm results from automaton)
+        #create shared memory k-mer index (to confirm results from automaton, or as sorted table)
         shm_index = mp.shared_memory.SharedMemory(create=True, size=shm_index_size)
-        with open(indexFile, "r") as f:
-            shm_index.buf[0:shm_index_size] = bytes(f.read(),"utf-8")
+        if self.matchEngine==haplotyping.index.database.Database.SEARCHSORTED:
+            table = haplotyping.index.storage.Storage.search_table(shm_index.buf,self.numberOfKmers,self.k)
+            for i in range(0,self.numberOfKmers,Connections.stepSizeStorage):
+                ckmers = self.h5file["/split/ckmer"].fields("ckmer")[i:min(self.numberOfKmers,i+Connections.stepSizeStorage)]
+                words = ckmers if self.packedKmers else haplotyping.General.encode_many(ckmers)
+                table[i:i+len(ckmers)] = haplotyping.index.storage.Storage.search_table_keys(words)
+            del table
+        else:
+            with open(indexFile, "rb") as f:
+                shm_index.buf[0:shm_index_size] = f.read()
         self._logger.debug("created shared memory {} MB k-mer index".format(math.ceil(shm_index_size/1048576)))
         
         #create shared memory k-mer type, number and bases
@@ -306,67 +536,179 @@ class Connections:
             del stepData
         self._logger.debug("created shared memory {} MB k-mer properties".format(math.ceil(shm_kmer_size/1048576)))
 
-        #now start other workers
-        pool_index = mp.get_context("spawn").Pool(nWorkersIndex, haplotyping.index.storage.Storage.workerIndex, 
-                             (shutdown_event,queue_index,queue_matches,queue_storageReads,queue_finished,
-                              self.filenameBase,self.numberOfKmers,self.k,
-                              self.indexType,shm_index.name))
-        pool_matches = mp.get_context("spawn").Pool(nWorkersMatches, haplotyping.index.storage.Storage.workerMatches, 
-                               (shutdown_event,queue_matches,queue_storageDirect,queue_finished,
-                                self.filenameBase,self.numberOfKmers,self.maximumFrequency,
+        #now start other workers, separate processes to allow adding or retiring workers
+        #(workers started by the scheduler thread ignore SIGINT themselves)
+        processes_index = []
+        processes_matches = []
+        workers = {"index": 0, "matches": 0}
+        def startIndexWorker():
+            processes_index.append(mp.get_context("spawn").Process(
+                             target=haplotyping.index.storage.Storage.workerIndex, 
+                             args=(shutdown_event,queue_index,queue_matches,queue_storageReads,queue_finished,
+                              self.temporaryBase,self.numberOfKmers,self.k,
+                              self.indexType,shm_index.name,self.packedKmers,self.matchEngine,queue_sizes,
+                              worker_ring_reads,worker_ring_matches,)))
+            processes_index[-1].start()
+            workers["index"]+=1
+        def startMatchesWorker():
+            processes_matches.append(mp.get_context("spawn").Process(
+                               target=haplotyping.index.storage.Storage.workerMatches, 
+                               args=(shutdown_event,queue_matches,queue_storageDirect,queue_finished,
+                                self.temporaryBase,self.numberOfKmers,self.maximumFrequency,
                                 self.estimatedMaximumReadLength,self.numberDirectArray,
-                                self.indexType,shm_kmer.name))
+                                self.indexType,shm_kmer.name,queue_sizes,worker_ring_matches,
+                                self.directAccumulator,sparseMaximum,)))
+            processes_matches[-1].start()
+            workers["matches"]+=1
+        for i in range(nWorkersIndex):
+            startIndexWorker()
+        for i in range(nWorkersMatches):
+            startMatchesWorker()
         signal.signal(signal.SIGINT, original_sigint_handler)
+        
+        #move workers to the bottleneck stage, based on queue depth and throughput
+        def scheduleWorkers(scheduler_event):
+            previousTaken = queue_sizes[3:6]
+            previousTime = time.time()
+            cooldown = 0
+            while not scheduler_event.wait(Connections.schedulerInterval):
+                currentTime = time.time()
+                depth = queue_sizes[0:3]
+                taken = queue_sizes[3:6]
+                rates = [round((taken[i]-previousTaken[i])/(currentTime-previousTime)) for i in range(3)]
+                (previousTaken,previousTime,) = (taken,currentTime,)
+                #wait for started workers, and only consider stages that are processing
+                if cooldown>0:
+                    cooldown-=1
+                    continue
+                available = nWorkers - nWorkersAutomaton - workers["index"] - workers["matches"]
+                memory = Connections._estimateIndexMemory(nWorkersAutomaton,workerAutomatonMemory,
+                             workers["matches"],workerMatchesMemory,workers["index"],workerIndexMemory) + workerSharedMemory
+                decision = None
+                #started workers must fit in memory, a moved worker replaces a retired one
+                if depth[1]>Connections.schedulerBacklog*self.readBatchSize*workers["index"] and rates[1]>0:
+                    if available>0 and memory+workerIndexMemory<=maximumMemory:
+                        startIndexWorker()
+                        decision = "start index worker"
+                    elif (depth[2]<self.readBatchSize and workers["matches"]>1
+                          and memory-workerMatchesMemory+workerIndexMemory<=maximumMemory):
+                        #retire idle matches worker
+                        queue_matches.put(None)
+                        workers["matches"]-=1
+                        startIndexWorker()
+                        decision = "move worker from matches to index"
+                elif depth[2]>Connections.schedulerBacklog*self.readBatchSize*workers["matches"] and rates[2]>0:
+                    if available>0 and memory+workerMatchesMemory<=maximumMemory:
+                        startMatchesWorker()
+                        decision = "start matches worker"
+                    elif (depth[1]<self.readBatchSize and workers["index"]>1
+                          and memory-workerIndexMemory+workerMatchesMemory<=maximumMemory):
+                        #retire idle index worker
+                        queue_index.put(None)
+                        workers["index"]-=1
+                        startMatchesWorker()
+                        decision = "move worker from index to matches"
+                if not decision==None:
+                    cooldown = Connections.schedulerCooldown
+                    self._logger.info(("scheduler: {}, queues {},{},{} reads, "+
+                                       "throughput {},{},{} reads/s, now {} index and {} matches workers").format(
+                        decision,*depth,*rates,workers["index"],workers["matches"]))
+        scheduler_event = Event()
+        scheduler = threading.Thread(target=scheduleWorkers, args=(scheduler_event,), daemon=True)
+        if self.adaptiveWorkers:
+            scheduler.start()
+        
+        #without automaton, reads are directly queued for the index workers
+        queue_reads = queue_automaton if nWorkersAutomaton>0 else queue_index
+        queue_position = 0 if nWorkersAutomaton>0 else 1
+        processes_reads = []
 
         try:
+            readFiles = []
             #process and register unpaired read files
             if not "unpairedReads" in self.h5file["/config/"].keys():
                 dtypeList = [("file","S255"),("readLength","uint64"),
-                     ("readNumber","uint64"),("totalReadLength","uint64"),("processTime","uint32")]
+                     ("readNumber","uint64"),("totalReadLength","uint64"),("processTime","uint32"),
+                     ("reader","S16"),("throughput","float32")]
             
-                ds = self.h5file["/config/"].create_dataset("unpairedReads",(len(self.unpairedReadFiles),),
-                                                  dtype=np.dtype(dtypeList),chunks=None, 
-                                                  compression="gzip", compression_opts=9)
-                for i in range(len(self.unpairedReadFiles)):
-                    self._logger.debug("process {}".format(os.path.basename(self.unpairedReadFiles[i])))
-                    (readLength,readNumber,totalReadLength,processTime) = self._processReadFile(
-                                                                   self.unpairedReadFiles[i], 
-                                                                   queue_automaton, queue_index, queue_matches)
-                    ds[i] = (self.unpairedReadFiles[i],
-                             readLength,readNumber,totalReadLength,int(processTime))
+                dtUnpaired=np.dtype(dtypeList)
+                optionsUnpaired=haplotyping.index.Database.getStorageOptions(
+                    self.h5file,(len(self.unpairedReadFiles),),dtUnpaired)
+                dsUnpaired = self.h5file["/config/"].create_dataset("unpairedReads",(len(self.unpairedReadFiles),),
+                                                  dtype=dtUnpaired, 
+                                                  **optionsUnpaired)
+                readFiles.extend([(False,i,(self.unpairedReadFiles[i],),) for i in range(len(self.unpairedReadFiles))])
             else:
                 self._logger.error("unpairedReads already (partly) processed")
 
             #process and register paired read files
             if not "pairedReads" in self.h5file["/config/"].keys():
                 dtypeList = [("file0","S255"),("file1","S255"),("readLength","uint64"),
-                         ("readNumber","uint64"),("totalReadLength","uint64"),("processTime","uint32")]
-                ds = self.h5file["/config/"].create_dataset("pairedReads",(len(self.pairedReadFiles),),
-                                                  dtype=np.dtype(dtypeList),chunks=None, 
-                                                  compression="gzip", compression_opts=9)
-                for i in range(len(self.pairedReadFiles)):
-                    self._logger.debug("process {} and {}".format(os.path.basename(self.pairedReadFiles[i][0]),
-                                                           os.path.basename(self.pairedReadFiles[i][1])))
-                    (readLength,readNumber,totalReadLength,processTime) = self._processPairedReadFiles(
-                                                                     self.pairedReadFiles[i][0],
-                                                                     self.pairedReadFiles[i][1], 
-                                                                     queue_automaton, queue_index, queue_matches)
-                    ds[i] = (self.pairedReadFiles[i][0],self.pairedReadFiles[i][1],
-                             readLength,readNumber,totalReadLength,int(processTime))
+                         ("readNumber","uint64"),("totalReadLength","uint64"),("processTime","uint32"),
+                         ("reader","S16"),("throughput","float32")]
+                dtPaired=np.dtype(dtypeList)
+                optionsPaired=haplotyping.index.Database.getStorageOptions(
+                    self.h5file,(len(self.pairedReadFiles),),dtPaired)
+                dsPaired = self.h5file["/config/"].create_dataset("pairedReads",(len(self.pairedReadFiles),),
+                                                  dtype=dtPaired, 
+                                                  **optionsPaired)
+                readFiles.extend([(True,i,tuple(self.pairedReadFiles[i]),) for i in range(len(self.pairedReadFiles))])
             else:
                 self._logger.error("pairedReads already (partly) processed")                    
             
+            #read files directly, or take whole files (or pairs of files) from a queue in reader processes
+            nReaders = min(self.readerProcesses,len(readFiles))
+            if nReaders>1:
+                self._logger.debug("start {} processes to read {} files".format(nReaders,len(readFiles)))
+                queue_readFiles = mp.Queue()
+                queue_readStats = mp.Queue()
+                for readFile in readFiles:
+                    queue_readFiles.put(readFile)
+                for i in range(nReaders):
+                    queue_readFiles.put(None)
+                for i in range(nReaders):
+                    processes_reads.append(mp.get_context("spawn").Process(target=Connections.workerReads, 
+                                 args=(queue_readFiles,queue_readStats,queue_reads,queue_sizes,queue_position,
+                                       worker_ring_reads,self.k,self.readBatchSize,)))
+                    processes_reads[-1].start()
+                for i in range(len(readFiles)):
+                    while True:
+                        try:
+                            (paired,index,filenames,stats) = queue_readStats.get(block=True, timeout=1)
+                            break
+                        except Empty:
+                            if not any([process.is_alive() for process in processes_reads]):
+                                raise Exception("reader processes stopped unexpectedly")
+                    self._registerReadFile(dsPaired if paired else dsUnpaired, paired, index, filenames, stats)
+                for process in processes_reads:
+                    process.join()
+            else:
+                for (paired,index,filenames) in readFiles:
+                    self._logger.debug("process {}".format(" and ".join([os.path.basename(filename) for filename in filenames])))
+                    if paired:
+                        stats = Connections._processPairedReadFiles(filenames[0], filenames[1], self.k, self.readBatchSize,
+                                                                    queue_reads, queue_sizes, queue_position, ring_reads)
+                    else:
+                        stats = Connections._processReadFile(filenames[0], self.k, self.readBatchSize,
+                                                             queue_reads, queue_sizes, queue_position, ring_reads)
+                    self._registerReadFile(dsPaired if paired else dsUnpaired, paired, index, filenames, stats)
+            
             #now wait until queues are empty
             queue_automaton.join()
             queue_index.join()
             queue_matches.join()
                 
+            #stop scheduling
+            scheduler_event.set()
+            if scheduler.is_alive():
+                scheduler.join()
+                
             #then trigger stopping by sending enough Nones
-            for i in range(pool_automaton._processes):
+            for i in range(nWorkersAutomaton):
                 queue_automaton.put(None)
-            for i in range(pool_index._processes):
+            for i in range(workers["index"]):
                 queue_index.put(None)
-            for i in range(pool_matches._processes):
+            for i in range(workers["matches"]):
                 queue_matches.put(None)
                 
             #now wait until everyone is finished
@@ -374,8 +716,8 @@ class Connections:
             finishedIndex=0
             finishedMatches=0
             totalCanonicalSplitFrequencies=0
-            while not (finishedAutomaton==nWorkersAutomaton and finishedIndex==nWorkersIndex
-                       and finishedMatches==nWorkersMatches):
+            while not (finishedAutomaton==nWorkersAutomaton and finishedIndex==len(processes_index)
+                       and finishedMatches==len(processes_matches)):
                 try:
                     item = queue_finished.get(block=True, timeout=1)
                     if item.startswith("automaton:ended"):
@@ -407,22 +749,32 @@ class Connections:
             shm_kmer.close()
             shm_index.unlink()
             shm_kmer.unlink()
+            self._releaseRing(ring_reads)
+            self._releaseRing(ring_matches)
             sys.exit()
         finally:
             #shutdown
             shutdown_event.set()
-            #terminate pools
-            pool_automaton.terminate()
-            pool_index.terminate()
-            pool_matches.terminate()
+            scheduler_event.set()
+            #terminate workers, automaton workers stop on the shutdown event
+            for process in processes_reads:
+                if process.is_alive():
+                    process.terminate()
+            if not process_automaton==None:
+                process_automaton.join(10)
+                process_automaton.terminate()
+            for process in processes_index+processes_matches:
+                if process.is_alive():
+                    process.terminate()
             #close queus workers
             Connections._close_queue(queue_automaton)
             Connections._close_queue(queue_index)
             Connections._close_queue(queue_matches)
-            #join pools
-            pool_automaton.join()
-            pool_index.join()
-            pool_matches.join()
+            #join workers
+            if not process_automaton==None:
+                process_automaton.join()
+            for process in processes_index+processes_matches:
+                process.join()
             #release memory
             shm_index.close()
             try:
@@ -430,6 +782,8 @@ class Connections:
                 self._logger.debug("unlink shared memory index")
             except Exception as e:
                 self._logger.debug("problem unlinking shared memory ({})".format(e))
+            self._releaseRing(ring_reads)
+            self._releaseRing(ring_matches)
             #collect created files 
             storageDirectFiles = Connections._collect_and_close_queue(queue_storageDirect)
             self.storageReadFiles = Connections._collect_and_close_queue(queue_storageReads)            
@@ -450,7 +804,7 @@ class Connections:
         pool_merges = mp.get_context("spawn").Pool(nWorkersMerges, haplotyping.index.storage.Storage.workerMergeDirect, 
                                (shutdown_event,queue_ranges,queue_merges,
                                 storageDirectFiles,
-                                self.filenameBase,self.numberOfKmers,
+                                self.temporaryBase,self.numberOfKmers,
                                 self.maximumFrequency,self.minimumFrequency,
                                 shm_kmer.name))
         signal.signal(signal.SIGINT, original_sigint_handler)
@@ -468,6 +822,7 @@ class Connections:
             #now wait    
             queue_ranges.join()
             #clean
+            self._reportTemporary("direct/workers",storageDirectFiles)
             if not self.keepTemporaryFiles:
                 for item in storageDirectFiles:
                     os.remove(item)
@@ -493,6 +848,7 @@ class Connections:
                 mergeFiles, pytablesStorage, self.numberOfKmers, self.maximumFrequency)                        
             
             #clean
+            self._reportTemporary("direct/merge",mergeFiles)
             if not self.keepTemporaryFiles:
                 for item in mergeFiles:
                     os.remove(item)
@@ -525,119 +881,168 @@ class Connections:
         
         self._logger.debug("process {} files with read information".format(len(self.storageReadFiles)))        
             
-    def _processReadFile(self, filename: str, queue_automaton, queue_index, queue_matches):
+    def _registerReadFile(self, ds, paired, index, filenames, stats):
+        if stats==None:
+            self._logger.error("problem processing {}".format(" and ".join(filenames)))
+            return
+        (readLengthMinimum,readLengthMaximum,readNumber,totalReadLength,processTime,reader,throughput) = stats
+        ds[index] = (*filenames,(0 if readLengthMaximum==None else readLengthMaximum),
+                     readNumber,totalReadLength,int(processTime),reader,throughput)
+        if readNumber>0:
+            if readLengthMinimum>0:
+                self.readLengthMinimum=(readLengthMinimum if self.readLengthMinimum==None
+                                        else min(self.readLengthMinimum,readLengthMinimum))
+            self.readLengthMaximum=(readLengthMaximum if self.readLengthMaximum==None
+                                    else max(self.readLengthMaximum,readLengthMaximum))
+            if paired:
+                self.readPairedTotal+=readNumber
+            else:
+                self.readUnpairedTotal+=readNumber
+            self.readTotal+=readNumber
+            self.totalReadLength+=totalReadLength
+        self.processReadsTime+=processTime
+        self._logger.info("processed {} {}reads ({}, {} reads/s)".format(
+            readNumber,("paired " if paired else ""),reader,round(throughput)))
+
+    def workerReads(queue_readFiles, queue_readStats, queue_reads, queue_sizes, queue_position, ring_reads,
+                    k, readBatchSize):
+
+        #prevent garbage collecting for shared memory
+        haplotyping.index.storage.remove_shm_from_resource_tracker()
+
+        logger = logging.getLogger("{}.worker.reads".format(__name__))
+        ring_reads = haplotyping.index.storage.Storage.ring_attach(ring_reads)
+
+        while True:
+            item = queue_readFiles.get(block=True)
+            if item==None:
+                break
+            (paired,index,filenames) = item
+            logger.debug("reads ({}): process {}".format(os.getpid(),
+                " and ".join([os.path.basename(filename) for filename in filenames])))
+            try:
+                if paired:
+                    stats = Connections._processPairedReadFiles(filenames[0], filenames[1], k, readBatchSize,
+                                                                queue_reads, queue_sizes, queue_position, ring_reads)
+                else:
+                    stats = Connections._processReadFile(filenames[0], k, readBatchSize,
+                                                         queue_reads, queue_sizes, queue_position, ring_reads)
+            except Exception as ex:
+                logger.error("reads ({}): problem with worker: {}".format(os.getpid(),ex))
+                stats = None
+            queue_readStats.put((paired,index,filenames,stats,))
+
+        if not ring_reads==None:
+            ring_reads[0].close()
+
+    def _putReads(queue_reads, batch, queue_sizes, queue_position, ring_reads=None):
         startTime = time.time()
-        open_fn = gzip.open if filename.endswith(".gz") else open
-        with open_fn(filename, "rt") as f:
+        slot = haplotyping.index.storage.Storage.ring_put_reads(ring_reads,batch)
+        queue_reads.put(batch if slot==None else slot)
+        haplotyping.index.storage.Storage.count_queue(queue_sizes,queue_position,len(batch))
+        return time.time()-startTime
+
+    def _processReadFile(filename: str, k: int, readBatchSize: int, queue_reads, queue_sizes,
+                         queue_position=0, ring_reads=None):
+        logger = logging.getLogger(__name__)
+        startTime = time.time()
+        with haplotyping.index.fastq.Fastq(filename) as reader:
             readLengthMinimum=None
             readLengthMaximum=None
             readNumber=0
             totalReadLength=0
-            while True:               
-                identifier = f.readline().rstrip()
-                sequence = f.readline().rstrip()  
-                plusline = f.readline().rstrip()
-                quality = f.readline().rstrip()
-                if sequence:
-                    if not (identifier.startswith("@") and plusline.startswith("+") and len(sequence)==len(quality)):
-                        self._logger.error("invalid fastq-file {}, line {}".format(filename,4*readNumber))
-                        break
-                    else:
-                        readLengthMinimum=(len(sequence) if readLengthMinimum==None 
-                                           else min(readLengthMinimum,len(sequence)))
-                        readLengthMaximum=(len(sequence) if readLengthMaximum==None 
-                                           else max(readLengthMaximum,len(sequence)))
-                        readNumber+=1
-                        totalReadLength+=len(sequence)
-                        queue_automaton.put(sequence)
-                        if readNumber%1000000==0:
-                            self._logger.debug("- processed {} reads, queues: {},{},{}".format(
-                                readNumber, queue_automaton.qsize(), queue_index.qsize(), queue_matches.qsize())) 
-                else:
-                    break
+            waitTime=0
+            batch=[]
+            for sequences in reader.sequences():
+                lengths = list(map(len,sequences))
+                readLengthMinimum=(min(lengths) if readLengthMinimum==None
+                                   else min(readLengthMinimum,min(lengths)))
+                readLengthMaximum=(max(lengths) if readLengthMaximum==None
+                                   else max(readLengthMaximum,max(lengths)))
+                if (readNumber+len(sequences))//1000000>readNumber//1000000:
+                    logger.debug("- processed {} reads, queues: {},{},{} reads".format(
+                        readNumber+len(sequences), *queue_sizes[0:3]))
+                readNumber+=len(sequences)
+                totalReadLength+=sum(lengths)
+                batch.extend(sequences)
+                while len(batch)>=readBatchSize:
+                    waitTime+=Connections._putReads(queue_reads,batch[0:readBatchSize],
+                                                    queue_sizes,queue_position,ring_reads)
+                    batch=batch[readBatchSize:]
+            if not reader.invalidLine==None:
+                logger.error("invalid fastq-file {}, line {}".format(filename,reader.invalidLine))
+            if len(batch)>0:
+                waitTime+=Connections._putReads(queue_reads,batch,queue_sizes,queue_position,ring_reads)
             endTime = time.time()
-            if readNumber>0:
-                if readLengthMinimum>0:
-                    self.readLengthMinimum=(readLengthMinimum if self.readLengthMinimum==None 
-                                            else min(self.readLengthMinimum,readLengthMinimum))
-                self.readLengthMaximum=(readLengthMaximum if self.readLengthMaximum==None 
-                                        else max(self.readLengthMaximum,readLengthMaximum))
-                self.readUnpairedTotal+=readNumber
-                self.readTotal+=readNumber
-                self.totalReadLength+=totalReadLength
-            self.processReadsTime+=endTime-startTime
-        self._logger.info("processed {} reads".format(readNumber)) 
-        return (readLengthMaximum,readNumber,totalReadLength,endTime-startTime)
+            #reads per second, without waiting for the workers
+            throughput = readNumber/max(endTime-startTime-waitTime,1e-6)
+        return (readLengthMinimum,readLengthMaximum,readNumber,totalReadLength,endTime-startTime,
+                reader.method,throughput)
 
-    def _processPairedReadFiles(self, filename0: str, filename1: str, queue_automaton, queue_index, queue_matches):
+    def _processPairedReadFiles(filename0: str, filename1: str, k: int, readBatchSize: int, queue_reads, queue_sizes,
+                                queue_position=0, ring_reads=None):
+        logger = logging.getLogger(__name__)
         startTime = time.time()
-        open_fn0 = gzip.open if filename0.endswith(".gz") else open
-        open_fn1 = gzip.open if filename1.endswith(".gz") else open
-        with open_fn0(filename0, "rt") as f0, open_fn1(filename1, "rt") as f1:
+        with (haplotyping.index.fastq.Fastq(filename0) as reader0,
+              haplotyping.index.fastq.Fastq(filename1) as reader1):
             readLengthMinimum=None
             readLengthMaximum=None
             readNumber=0
             totalReadLength=0
-            while True:
-                #first of pair
-                identifier0 = f0.readline().rstrip() 
-                sequence0 = f0.readline().rstrip()  
-                plusline0 = f0.readline().rstrip() 
-                quality0 = f0.readline().rstrip() 
+            waitTime=0
+            batch=[]
+            for (sequences0,sequences1) in haplotyping.index.fastq.Fastq.paired_sequences(reader0,reader1):
                 #second of pair
-                identifier1 = f1.readline().rstrip() 
-                sequence1 = haplotyping.General.reverse_complement(f1.readline().rstrip())
-                plusline1 = f1.readline().rstrip() 
-                quality1 = f1.readline().rstrip() 
-                #process
-                if sequence0 and sequence1:
-                    if not (identifier0.startswith("@") and plusline0.startswith("+") and len(sequence0)==len(quality0)):
-                        self._logger.error("invalid fastq-file {}, line {}".format(filename0,2*readNumber))
-                        break
-                    elif not (identifier1.startswith("@") and plusline1.startswith("+") and len(sequence1)==len(quality1)):
-                        self._logger.error("invalid fastq-file {}, line {}".format(filename1,2*readNumber))
-                        break
-                    else:
-                        readLengthMinimum=(min(len(sequence0),len(sequence1)) if readLengthMinimum==None 
-                                               else min(readLengthMinimum,len(sequence0),len(sequence1)))
-                        readLengthMaximum=(max(len(sequence0),len(sequence1)) if readLengthMaximum==None 
-                                           else max(readLengthMaximum,len(sequence0),len(sequence1)))
-                        readNumber+=2  
-                        totalReadLength+=(len(sequence0)+len(sequence1))
-                        if sequence1[0:self.k] in sequence0:
-                            pos = sequence0.find(sequence1[0:self.k])
-                            rpos = sequence0.rfind(sequence1[0:self.k])
-                            if pos==rpos:
-                                match = sequence0[pos:]
-                                if sequence1[0:len(match)]==match:
-                                    #process as single read because of minimal glue match of size k
-                                    queue_automaton.put(sequence0[0:pos]+sequence1) 
-                                else:
-                                    queue_automaton.put((sequence0,sequence1,))                                
+                sequences1 = haplotyping.index.fastq.Fastq.reverse_complement(sequences1)
+                lengths = list(map(len,sequences0))+list(map(len,sequences1))
+                readLengthMinimum=(min(lengths) if readLengthMinimum==None
+                                   else min(readLengthMinimum,min(lengths)))
+                readLengthMaximum=(max(lengths) if readLengthMaximum==None
+                                   else max(readLengthMaximum,max(lengths)))
+                if (readNumber+2*len(sequences0))//1000000>readNumber//1000000:
+                    logger.debug("- processed {} paired reads, queues: {},{},{} reads".format(
+                        readNumber+2*len(sequences0), *queue_sizes[0:3]))
+                readNumber+=2*len(sequences0)
+                totalReadLength+=sum(lengths)
+                for (sequence0,sequence1) in zip(sequences0,sequences1):
+                    if sequence1[0:k] in sequence0:
+                        pos = sequence0.find(sequence1[0:k])
+                        rpos = sequence0.rfind(sequence1[0:k])
+                        if pos==rpos:
+                            match = sequence0[pos:]
+                            if sequence1[0:len(match)]==match:
+                                #process as single read because of minimal glue match of size k
+                                batch.append(sequence0[0:pos]+sequence1)
                             else:
-                                queue_automaton.put((sequence0,sequence1,))                            
+                                batch.append((sequence0,sequence1,))
                         else:
-                            queue_automaton.put((sequence0,sequence1,))                        
-                        if readNumber%1000000==0:
-                            self._logger.debug("- processed {} paired reads, queues: {},{},{}".format(
-                                readNumber, queue_automaton.qsize(), queue_index.qsize(), queue_matches.qsize()))                    
-                else:
-                    break
+                            batch.append((sequence0,sequence1,))
+                    else:
+                        batch.append((sequence0,sequence1,))
+                    if len(batch)>=readBatchSize:
+                        waitTime+=Connections._putReads(queue_reads,batch,queue_sizes,queue_position,ring_reads)
+                        batch=[]
+            if not reader0.invalidLine==None:
+                logger.error("invalid fastq-file {}, line {}".format(filename0,reader0.invalidLine))
+            if not reader1.invalidLine==None:
+                logger.error("invalid fastq-file {}, line {}".format(filename1,reader1.invalidLine))
+            if len(batch)>0:
+                waitTime+=Connections._putReads(queue_reads,batch,queue_sizes,queue_position,ring_reads)
             endTime = time.time()
-            if readNumber>0:
-                if readLengthMinimum>0:
-                    self.readLengthMinimum=(readLengthMinimum if self.readLengthMinimum==None 
-                                            else min(self.readLengthMinimum,readLengthMinimum))
-                self.readLengthMaximum=(readLengthMaximum if self.readLengthMaximum==None 
-                                        else max(self.readLengthMaximum,readLengthMaximum))
-                self.readPairedTotal+=readNumber
-                self.readTotal+=readNumber
-                self.totalReadLength+=totalReadLength
-            self._logger.info("processed {} paired reads".format(readNumber)) 
-            self.processReadsTime+=endTime-startTime
-        return (readLengthMaximum,readNumber,totalReadLength,endTime-startTime)
-        
-        
+            #reads per second, without waiting for the workers
+            throughput = readNumber/max(endTime-startTime-waitTime,1e-6)
+        return (readLengthMinimum,readLengthMaximum,readNumber,totalReadLength,endTime-startTime,
+                reader0.method,throughput)
+
+
+    def _reportTemporary(self, phase, filenames):
+        """
+        Report the space of the temporary files for the finished phase
+        """
+        size = sum([os.path.getsize(filename) for filename in filenames if os.path.exists(filename)])
+        self._logger.info("temporary storage {}: {} file(s), {} MB".format(
+            phase,len(filenames),round(size/1048576,1)))
+
     def _storeDirect(self, pytablesStorage):
         self.h5file["/config/"].attrs["minimumReadLength"]=self.readLengthMinimum
         self.h5file["/config/"].attrs["maximumReadLength"]=self.readLengthMaximum
@@ -664,9 +1069,14 @@ class Connections:
             shutdown_event = mp.Event()
         
             #partition k-mers based on direct connections
-            maxNumberOfPartitions = int(self.numberOfKmers ** (2/3))
+            if self.partitionSize>0:
+                maxNumberOfPartitions = max(1,round(self.numberOfKmers/self.partitionSize))
+            elif self.maximumPartitions>0:
+                maxNumberOfPartitions = self.maximumPartitions
+            else:
+                maxNumberOfPartitions = int(self.numberOfKmers ** (2/3))
             self.numberOfPartitions = haplotyping.index.storage.Storage.partitionKmers(self.h5file, pytablesStorage,
-                                                              maxNumberOfPartitions)
+                                                              maxNumberOfPartitions, self.partitioner)
             #prepare shared memory with k-mer properties and direct connections
             numberOfDirect = self.h5file["/relations/direct"].shape[0]
             shm_kmer_partition = np.dtype(haplotyping.index.Database.getUint(self.numberOfPartitions)).type
@@ -740,7 +1150,7 @@ class Connections:
             original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
             pool_reads = mp.get_context("spawn").Pool(nWorkersReads, haplotyping.index.storage.Storage.workerProcessReads, 
                                  (shutdown_event,queue_rawReads,queue_filteredReads,queue_finished,
-                                  self.filenameBase,self.numberOfKmers,
+                                  self.temporaryBase,self.numberOfKmers,
                                   self.numberOfPartitions,numberOfDirect,self.maximumFrequency,maximumReadLength,
                                   shm_kmer.name,shm_direct.name))
             signal.signal(signal.SIGINT, original_sigint_handler)
@@ -754,7 +1164,11 @@ class Connections:
                     queue_rawReads.put(None)
                 #now wait    
                 queue_rawReads.join()
+                #let workers finish, terminating may leave results or locks in the queues
+                pool_reads.close()
+                pool_reads.join()
                 #clean
+                self._reportTemporary("reads/workers",self.storageReadFiles)
                 if not self.keepTemporaryFiles:
                    for item in self.storageReadFiles:
                        os.remove(item)
@@ -820,7 +1234,7 @@ class Connections:
             original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
             pool_merges = mp.get_context("spawn").Pool(nWorkersMerges, haplotyping.index.storage.Storage.workerMergeReads, 
                                    (shutdown_event,queue_ranges,queue_merges,
-                                    storageFilteredReadFiles,partitionSizes,self.filenameBase,
+                                    storageFilteredReadFiles,partitionSizes,self.temporaryBase,
                                     self.numberOfKmers,self.numberOfPartitions,maximumReadLength))
             signal.signal(signal.SIGINT, original_sigint_handler)
         
@@ -864,6 +1278,7 @@ class Connections:
                     self.numberOfKmers,self.numberOfPartitions,maximumReadLength)
 
                 #clean mergeFiles
+                self._reportTemporary("reads/merge",mergeFiles)
                 if not self.keepTemporaryFiles:
                     for item in mergeFiles:
                         os.remove(item)
@@ -883,6 +1298,7 @@ class Connections:
                 pool_merges.join()               
                 
             #clean storageFilteredReadFiles
+            self._reportTemporary("reads/filtered",storageFilteredReadFiles)
             if not self.keepTemporaryFiles:
                 for item in storageFilteredReadFiles:
                     os.remove(item)
@@ -892,6 +1308,7 @@ class Connections:
         haplotyping.index.storage.Storage.storeMergedReads(
             self.h5file, pytablesStorage, 
             self.numberOfKmers,self.numberOfPartitions)
+        haplotyping.index.storage.Storage.storePartitionStatistics(self.h5file)
         
     
                 
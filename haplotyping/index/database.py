@@ -1,9 +1,14 @@
-import logging, h5py, os, sys, glob, re, math, shutil
+import logging, h5py, os, sys, stat, glob, re, math, shutil
 import numpy as np, tables, gzip, csv
 import multiprocessing as mp
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
 
 import haplotyping
 import haplotyping.index.splits
+import haplotyping.index.kmc
 import haplotyping.index.connections
 
 class Database:
@@ -14,7 +19,8 @@ class Database:
     Parameters
     ----------------------
     k : int
-        The used k-mer size, should correspond with the k-mer size of the sorted k-mer list
+        The used k-mer size, should correspond with the k-mer size of the sorted k-mer list;
+        use None to detect the k-mer size from the sorted k-mer list
 
     name : str
         Name of the variety
@@ -23,7 +29,9 @@ class Database:
         Base name and location for the splitting k-mer database and the temporary databases
 
     sortedIndexFile: str
-        Location of the sorted k-mer list
+        Location of the sorted k-mer list, or of a KMC database (.kmc_pre and .kmc_suf)
+        The sorted k-mer list can be gzip compressed or uncompressed, and can also be 
+        a named pipe or "-" to read an uncompressed list from stdin
         The k-mer size for k-mers in this list should correspond with the provided k parameter
 
     readFiles: optional, default is empty list
@@ -48,11 +56,79 @@ class Database:
     automatonKmerSize: int, optional, default is 0 (for automatically)
         The used reduced k-mer size, maximum is the k-mer size
         
+    calibrateAutomaton: bool, optional, default is False
+        If automatonKmerSize is 0, build automatons for a few reduced k-mer sizes and select the size
+        with the highest throughput on a sample of the reads, instead of using (k+1)/2
+        
     indexType: str, optional, default is None (for a full index)
         Possible values:
         - "onlySplittingKmers": Only the first step will be executed, using a single process.
         - "onlyDirectConnections": Only direct connections are extracted from the reads
         
+    storageProfile: str, optional, default is "archive"
+        Compression and chunk layout for the datasets in the final database
+        Possible values:
+        - "archive": gzip compression with maximum level, smallest database
+        - "fast": lzf compression with small chunks, faster to write and read
+        - "query": no compression and contiguous storage, fastest random lookups
+        - "blosc-zstd": blosc with zstd compression, requires hdf5plugin (otherwise "archive" is used)
+        
+    packedKmers: bool, optional, default is False
+        Store splitting k-mers and bases as 2-bit packed unsigned integers (two or more words for k>32)
+        instead of fixed-width strings, preserving the lexicographic order
+        
+    matchEngine: str, optional, default is "automaton"
+        Method to detect splitting k-mers in the reads
+        Possible values:
+        - "automaton": reduced k-mer automaton with verification in the k-mer index
+        - "searchsorted": binary search of 2-bit packed read k-mers in a sorted table in shared memory
+        
+    readBatchSize: int, optional, default is 1000
+        Number of reads (or pairs) passed at once between the processes parsing the reads
+        
+    readTransport: str, optional, default is "queue"
+        Transport of the batches of reads and matches between the processes parsing the reads
+        Possible values:
+        - "queue": batches are pickled through the queues
+        - "sharedMemory": batches are written into slots of shared memory rings, only slot numbers are queued
+        
+    readerProcesses: int, optional, default is 1
+        Number of processes reading the read files concurrently, each taking whole files (or pairs of files)
+        
+    adaptiveWorkers: bool, optional, default is False
+        Move workers between checking the index and processing the matches during the run,
+        based on queue depth and throughput within the memory and process limits
+        
+    directAccumulator: str, optional, default is "dense"
+        Storage of the direct connections in the processes handling the matches
+        Possible values:
+        - "dense": fixed number of entries for every splitting k-mer
+        - "sparse": only the occurring connections, aggregated in sorted arrays
+        
+    partitioner: str, optional, default is "metis"
+        Backend to partition the graph of splitting k-mers based on the direct connections
+        Possible values:
+        - "metis": multilevel k-way partitioning with METIS
+        - "networkit": balanced spectral partitioning with NetworKit
+        
+    maximumPartitions: int, optional, default is 0 (for the number of splitting k-mers to the power 2/3)
+        Maximum number of partitions of the splitting k-mers, fewer and larger partitions
+        reduce the edge-cut but increase the reads loaded by a query
+        
+    partitionSize: int, optional, default is 0 (for derived from the maximum number of partitions)
+        Target number of splitting k-mers in a partition, can't be combined with maximumPartitions
+        
+    artifactCache: str, optional, default is None (for no cache)
+        Directory to keep the automaton and index, identified by the content of the splitting k-mers,
+        for reuse by other runs with the same splitting k-mers
+        
+    artifactCacheSize: int, optional, default is 0 (for no maximum)
+        Maximum size of the artifact cache, least recently used artifacts are removed
+        
+    scratchDirectory: str, optional, default is None (for temporary pytables files next to the output)
+        Directory for the temporary files, e.g. on local NVMe or tmpfs; the temporary tables 
+        of the splitting k-mers are stored as raw memory-mapped records
+        
     debug: bool, optional, default is False
         Only use this when debugging or extending the code.      
         
@@ -65,6 +141,34 @@ class Database:
     FULLINDEX = "full"
     ONLYSPLITTINGKMERS = "onlySplittingKmers"
     ONLYDIRECTCONNECTIONS = "onlyDirectConnections"
+    
+    #define storage profiles
+    ARCHIVE = "archive"
+    FAST = "fast"
+    QUERY = "query"
+    BLOSCZSTD = "blosc-zstd"
+    storageProfiles = {
+        ARCHIVE: {"compression": "gzip", "compression_opts": 9},
+        FAST: {"compression": "lzf", "chunkSize": 65536},
+        QUERY: {},
+        BLOSCZSTD: {"compression": "blosc-zstd", "chunkSize": 262144},
+    }
+    
+    #define match engines
+    AUTOMATON = "automaton"
+    SEARCHSORTED = "searchsorted"
+    
+    #define read transports
+    QUEUE = "queue"
+    SHAREDMEMORY = "sharedMemory"
+    
+    #define direct connection accumulators
+    DENSE = "dense"
+    SPARSE = "sparse"
+    
+    #define partitioners
+    METIS = "metis"
+    NETWORKIT = "networkit"
 
     def __init__(self,
                  k: int, 
@@ -76,7 +180,22 @@ class Database:
                  maximumMemory: int = 0,
                  maximumProcesses: int = 0,
                  automatonKmerSize: int = 0,
+                 calibrateAutomaton: bool = False,
                  indexType: str = None,
+                 storageProfile: str = "archive",
+                 packedKmers: bool = False,
+                 matchEngine: str = "automaton",
+                 readBatchSize: int = 1000,
+                 readTransport: str = "queue",
+                 readerProcesses: int = 1,
+                 adaptiveWorkers: bool = False,
+                 directAccumulator: str = "dense",
+                 partitioner: str = "metis",
+                 maximumPartitions: int = 0,
+                 partitionSize: int = 0,
+                 artifactCache: str = None,
+                 artifactCacheSize: int = 0,
+                 scratchDirectory: str = None,
                  debug: bool = False,
                  keepTemporaryFiles: bool=False):  
         
@@ -107,7 +226,10 @@ class Database:
         self._logger.debug("haplotyping package version {}".format(haplotyping._version.__version__))
 
         #store variables
-        self.k=k
+        #a stream can only be read once, the first line is kept to detect the k-mer size
+        self.sortedStream = (Database.openStream(sortedIndexFile) 
+                             if (not k) and Database.isStream(sortedIndexFile) else None)
+        self.k=k if k else Database.detectKmerSize(sortedIndexFile,self.sortedStream)
         self.name=name
         self.debug = debug
         if indexType==self.ONLYSPLITTINGKMERS or indexType==self.ONLYDIRECTCONNECTIONS:
@@ -116,17 +238,55 @@ class Database:
             self.indexType = self.FULLINDEX
         else:
             raise Exception("unknown indexType '{}'".format(indexType))
+        if storageProfile in self.storageProfiles.keys():
+            self.storageProfile = storageProfile
+        else:
+            raise Exception("unknown storageProfile '{}'".format(storageProfile))
+        if self.storageProfile==self.BLOSCZSTD and hdf5plugin==None:
+            self._logger.warning("hdf5plugin not available, use storage profile '{}'".format(self.ARCHIVE))
+            self.storageProfile = self.ARCHIVE
+        if matchEngine==self.AUTOMATON or matchEngine==self.SEARCHSORTED:
+            self.matchEngine = matchEngine
+        else:
+            raise Exception("unknown matchEngine '{}'".format(matchEngine))
+        if readTransport==self.QUEUE or readTransport==self.SHAREDMEMORY:
+            self.readTransport = readTransport
+        else:
+            raise Exception("unknown readTransport '{}'".format(readTransport))
+        if directAccumulator==self.DENSE or directAccumulator==self.SPARSE:
+            self.directAccumulator = directAccumulator
+        else:
+            raise Exception("unknown directAccumulator '{}'".format(directAccumulator))
+        if partitioner==self.METIS or partitioner==self.NETWORKIT:
+            self.partitioner = partitioner
+        else:
+            raise Exception("unknown partitioner '{}'".format(partitioner))
         self.version = haplotyping._version.__version__
         self.automatonKmerSize = automatonKmerSize
+        self.calibrateAutomaton = calibrateAutomaton
         self.minimumFrequency = minimumFrequency
         self.keepTemporaryFiles = keepTemporaryFiles
         self.filenameBase = filenameBase
         self.maximumMemory = maximumMemory
         self.maximumProcesses = maximumProcesses
+        self.packedKmers = packedKmers
+        self.readBatchSize = readBatchSize
+        self.readerProcesses = readerProcesses
+        self.adaptiveWorkers = adaptiveWorkers
+        self.artifactCache = artifactCache
+        self.artifactCacheSize = artifactCacheSize
+        self.maximumPartitions = maximumPartitions
+        self.partitionSize = partitionSize
+        self.scratchDirectory = scratchDirectory
                 
         #check boundaries number of processes
         assert self.automatonKmerSize>=0 and self.automatonKmerSize<=self.k
         assert self.maximumMemory>=0
+        assert self.readBatchSize>0
+        assert self.readerProcesses>0
+        assert self.artifactCacheSize>=0
+        assert self.maximumPartitions>=0 and self.partitionSize>=0
+        assert self.maximumPartitions==0 or self.partitionSize==0
         assert self.maximumProcesses>=0
         
         if (not self.indexType == self.ONLYSPLITTINGKMERS) and (len(readFiles)==0) and (len(pairedReadFiles)==0):
@@ -156,6 +316,8 @@ class Database:
                     h5file["/config"].attrs["indexType"] = self.indexType
                     h5file["/config"].attrs["automatonKmerSize"] = self.automatonKmerSize
                     h5file["/config"].attrs["minimumCanonicalSplitFrequency"] = self.minimumFrequency
+                    h5file["/config"].attrs["packedKmers"] = self.packedKmers
+                    h5file["/config"].attrs["storageProfile"] = self.storageProfile
                     h5file.flush()
                 else:
                     assert h5file["/config"].attrs["k"] == self.k
@@ -163,27 +325,44 @@ class Database:
                     assert h5file["/config"].attrs["indexType"] == self.indexType
                     assert h5file["/config"].attrs["automatonKmerSize"] == self.automatonKmerSize
                     assert h5file["/config"].attrs["minimumCanonicalSplitFrequency"] == self.minimumFrequency
+                    assert h5file["/config"].attrs.get("packedKmers",False) == self.packedKmers
+                    assert h5file["/config"].attrs.get("storageProfile",self.ARCHIVE) == self.storageProfile
                     
                 #these settings are allowed to change in secondary runs
                 h5file["/config"].attrs["name"] = self.name
                 h5file["/config"].attrs["debug"] = self.debug
                 h5file["/config"].attrs["maximumMemory"] = self.maximumMemory
                 h5file["/config"].attrs["maximumProcesses"] = self.maximumProcesses
+                h5file["/config"].attrs["calibrateAutomaton"] = self.calibrateAutomaton
+                h5file["/config"].attrs["matchEngine"] = self.matchEngine
+                h5file["/config"].attrs["readBatchSize"] = self.readBatchSize
+                h5file["/config"].attrs["readTransport"] = self.readTransport
+                h5file["/config"].attrs["readerProcesses"] = self.readerProcesses
+                h5file["/config"].attrs["adaptiveWorkers"] = self.adaptiveWorkers
+                h5file["/config"].attrs["directAccumulator"] = self.directAccumulator
+                h5file["/config"].attrs["partitioner"] = self.partitioner
+                h5file["/config"].attrs["maximumPartitions"] = self.maximumPartitions
+                h5file["/config"].attrs["partitionSize"] = self.partitionSize
                 
                 #get splitting k-mers from index   
                 if not ("/split" in h5file and "/histogram" in h5file):
-                    if not os.path.exists(sortedIndexFile):
+                    if not (os.path.exists(sortedIndexFile) or Database.isStream(sortedIndexFile) or
+                            haplotyping.index.kmc.Kmc.detect(sortedIndexFile)):
                         self._logger.error("no sorted k-mer list provided")
                     else:
                         self._logger.debug("get splitting k-mers from the provided index")
                         haplotyping.index.splits.Splits(sortedIndexFile, h5file, 
-                                                        self.filenameBase, self.debug, self.keepTemporaryFiles)    
+                                                        self.filenameBase, self.debug, self.keepTemporaryFiles,
+                                                        self.scratchDirectory, self.sortedStream)    
                         h5file.flush()
                         #backup
                         if self.debug:
                             shutil.copyfile(filename, filename_splits)
                 else:
                     self._logger.debug("detected splitting k-mers from previous run")
+                if not self.sortedStream==None:
+                    Database.closeStream(self.sortedStream[0])
+                    self.sortedStream = None
                     
                 #parse read files and store distances
                 if (not self.indexType == self.ONLYSPLITTINGKMERS) and ("/split" in h5file) and ("/histogram" in h5file):
@@ -191,7 +370,9 @@ class Database:
                         self._logger.debug("parse read files and store distances in database")
                         haplotyping.index.connections.Connections(readFiles,pairedReadFiles, h5file, 
                                                       self.filenameBase, self.indexType, 
-                                                      self.debug, self.keepTemporaryFiles)
+                                                      self.debug, self.keepTemporaryFiles,
+                                                      self.artifactCache, self.artifactCacheSize,
+                                                      self.scratchDirectory)
                         h5file.flush()
                         #backup
                         if self.debug:
@@ -282,15 +463,62 @@ class Database:
 
         return (unpairedReadFiles, pairedReadFiles, allReadFiles)
     
-    def detectKmerSize(location: str):
+    def detectKmerSize(location: str, sortedStream=None):
         try:
-            with gzip.open(location, "rt") as f: 
-                reader = csv.reader(f, delimiter="\t")
-                for line in reader:
-                    return len(str(line[0]))
+            if haplotyping.index.kmc.Kmc.detect(location):
+                return haplotyping.index.kmc.Kmc(location).k
+            elif not sortedStream==None:
+                line = sortedStream[1]
+            elif Database.isStream(location):
+                (stream,line) = Database.openStream(location)
+                Database.closeStream(stream)
+            else:
+                with haplotyping.index.splits.Splits.openList(location) as f:
+                    line = f.readline()
+            return len(line.split(b"\t")[0].rstrip())
         except OSError as ex:
             raise Exception("problem with sorted list: {}".format(ex))
+        
+    def isStream(location: str):
+        """
+        Stdin or a named pipe
+        """
+        return location=="-" or (os.path.exists(location) and 
+                                 stat.S_ISFIFO(os.stat(location).st_mode))
     
+    def openStream(location: str):
+        """
+        Stream and its first buffered line, to allow detecting the k-mer size
+        """
+        stream = sys.stdin.buffer if location=="-" else open(location, "rb")
+        return (stream, stream.readline())
+    
+    def closeStream(stream):
+        """
+        Close a stream, except stdin
+        """
+        if not stream is sys.stdin.buffer:
+            stream.close()
+    
+    def getStorageOptions(h5file, shape, dtype):
+        """
+        Compression and chunk options for a final dataset, based on the configured storage profile
+        """
+        profile = Database.storageProfiles[h5file["/config"].attrs.get("storageProfile",Database.ARCHIVE)]
+        if not "compression" in profile:
+            return {"chunks": None}
+        elif profile["compression"]=="blosc-zstd":
+            options = dict(hdf5plugin.Blosc(cname="zstd", clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+        else:
+            options = {key: value for key,value in profile.items() if not key=="chunkSize"}
+        #chunks sized for random lookup
+        if "chunkSize" in profile and shape[0]>0:
+            rowSize = np.dtype(dtype).itemsize * math.prod(shape[1:])
+            options["chunks"] = (min(shape[0],max(1,profile["chunkSize"]//rowSize)),) + tuple(shape[1:])
+        else:
+            options["chunks"] = None
+        return options
+        
     def getTablesUint(maximumValue, position):
         if maximumValue<=np.iinfo(np.uint8).max:
             return tables.UInt8Col(pos=position)
@@ -0,0 +1,239 @@
+import logging, re, gzip, zlib, shutil, struct, subprocess, threading, queue
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+import haplotyping
+
+class Fastq:
+
+    """
+    Internal use, read sequences from a (compressed) FASTQ file in large blocks
+    """
+
+    stepSizeRead = 4194304
+    stepSizeBgzf = 64
+    numberOfBlocks = 8
+    numberOfThreads = 4
+    decompressors = ["igzip","pigz"]
+
+    PLAIN = "plain"
+    GZIP = "gzip"
+    BGZF = "bgzf"
+
+    sequencePattern = re.compile(r"[ATCGN\n]*")
+
+    def __init__(self, filename: str):
+
+        """
+        Internal use only: initialize
+        """
+
+        #logger
+        self._logger = logging.getLogger(__name__)
+
+        self.filename = filename
+        self.method = Fastq.detect(filename)
+        self.invalidLine = None
+        self.numberOfBytes = 0
+        self._process = None
+        self._thread = None
+        self._queue = queue.Queue(Fastq.numberOfBlocks)
+        self._stopped = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def detect(filename: str):
+        """
+        Method to decompress the file: external decompressor, BGZF blocks, gzip or plain
+        """
+        with open(filename, "rb") as f:
+            header = f.read(18)
+        if not header[0:2]==b"\x1f\x8b":
+            return Fastq.PLAIN
+        for decompressor in Fastq.decompressors:
+            if shutil.which(decompressor):
+                return decompressor
+        if header[3]&4 and header[12:14]==b"BC":
+            return Fastq.BGZF
+        else:
+            return Fastq.GZIP
+
+    def close(self):
+        self._stopped.set()
+        if not self._process==None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+        if not self._thread==None:
+            #free the queue for the decompressing thread
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self._thread.join()
+            self._thread = None
+
+    def _readChunks(self, f):
+        while not self._stopped.is_set():
+            chunk = f.read(Fastq.stepSizeRead)
+            if len(chunk)==0:
+                break
+            yield chunk
+
+    def _bgzfBlocks(self, f):
+        """
+        Raw deflate data of groups of BGZF blocks
+        """
+        data = b""
+        position = 0
+        blocks = []
+        for chunk in self._readChunks(f):
+            data = data[position:]+chunk
+            position = 0
+            while position+18<=len(data):
+                (xlen,) = struct.unpack("<H",data[position+10:position+12])
+                (bsize,) = struct.unpack("<H",data[position+16:position+18])
+                if position+bsize+1>len(data):
+                    break
+                blocks.append(data[position+12+xlen:position+bsize+1-8])
+                position+=bsize+1
+                if len(blocks)>=Fastq.stepSizeBgzf:
+                    yield blocks
+                    blocks = []
+        if position<len(data):
+            raise Exception("incomplete BGZF block in {}".format(self.filename))
+        if len(blocks)>0:
+            yield blocks
+
+    def _inflateBgzf(blocks):
+        return b"".join([zlib.decompress(block,-15) for block in blocks])
+
+    def _decompress(self, queue_blocks):
+        """
+        Decompress the file into blocks, runs in a separate thread (and process for external decompressors)
+        """
+        try:
+            if self.method==Fastq.PLAIN:
+                with open(self.filename, "rb") as f:
+                    for chunk in self._readChunks(f):
+                        queue_blocks.put(chunk)
+            elif self.method==Fastq.GZIP:
+                with gzip.open(self.filename, "rb") as f:
+                    for chunk in self._readChunks(f):
+                        queue_blocks.put(chunk)
+            elif self.method==Fastq.BGZF:
+                #zlib releases the GIL, so the blocks are inflated in parallel
+                with open(self.filename, "rb") as f, ThreadPoolExecutor(Fastq.numberOfThreads) as executor:
+                    futures = []
+                    for blocks in self._bgzfBlocks(f):
+                        futures.append(executor.submit(Fastq._inflateBgzf,blocks))
+                        if len(futures)>=Fastq.numberOfThreads:
+                            queue_blocks.put(futures.pop(0).result())
+                    for future in futures:
+                        queue_blocks.put(future.result())
+            else:
+                self._process = subprocess.Popen([self.method,"-dc",self.filename],
+                                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                for chunk in self._readChunks(self._process.stdout):
+                    queue_blocks.put(chunk)
+                if not self._process.wait()==0:
+                    raise Exception("{} failed on {}".format(self.method,self.filename))
+        except Exception as ex:
+            queue_blocks.put(ex)
+        queue_blocks.put(None)
+
+    def blocks(self):
+        """
+        Blocks of decompressed data, decompressed ahead in a separate thread
+        """
+        self._thread = threading.Thread(target=self._decompress, args=(self._queue,), daemon=True)
+        self._thread.start()
+        while True:
+            block = self._queue.get()
+            if block==None:
+                break
+            elif isinstance(block,Exception):
+                raise block
+            self.numberOfBytes+=len(block)
+            yield block
+
+    def _parse(self, lines, lineNumber):
+        """
+        Validate the structure of the records in bulk and return the sequences,
+        the line of the first invalid record is registered
+        """
+        identifiers = lines[0::4]
+        sequences = list(map(bytes.rstrip,lines[1::4]))
+        pluslines = lines[2::4]
+        qualities = list(map(bytes.rstrip,lines[3::4]))
+        if not (all(map(bytes.startswith,identifiers,repeat(b"@")))
+                and all(map(bytes.startswith,pluslines,repeat(b"+")))
+                and list(map(len,sequences))==list(map(len,qualities))
+                and all(sequences)):
+            for i in range(len(sequences)):
+                if len(sequences[i])==0:
+                    sequences = sequences[0:i]
+                    break
+                elif not (identifiers[i].startswith(b"@") and pluslines[i].startswith(b"+")
+                          and len(sequences[i])==len(qualities[i])):
+                    self.invalidLine = lineNumber+(4*i)
+                    sequences = sequences[0:i]
+                    break
+        if len(sequences)==0:
+            return []
+        else:
+            return b"\n".join(sequences).decode().split("\n")
+
+    def sequences(self):
+        """
+        Lists of sequences for the records in each block, stops at the first invalid record
+        """
+        remainder = b""
+        lineNumber = 0
+        for block in self.blocks():
+            lines = (remainder+block).split(b"\n")
+            n = 4*((len(lines)-1)//4)
+            remainder = b"\n".join(lines[n:])
+            sequences = self._parse(lines[0:n], lineNumber)
+            lineNumber+=n
+            if len(sequences)>0:
+                yield sequences
+            if not (self.invalidLine==None and len(sequences)==n//4):
+                return
+        remainder = remainder.rstrip()
+        if len(remainder)>0:
+            #incomplete records are invalid
+            lines = remainder.split(b"\n")
+            sequences = self._parse(lines+[b""]*(-len(lines)%4), lineNumber)
+            if len(sequences)>0:
+                yield sequences
+
+    def reverse_complement(sequences):
+        """
+        Reverse complement of a list of sequences
+        """
+        data = "\n".join(sequences)
+        if not re.fullmatch(Fastq.sequencePattern, data):
+            #raises for the invalid sequence
+            return [haplotyping.General.reverse_complement(sequence) for sequence in sequences]
+        return data.translate(haplotyping.General.complement)[::-1].split("\n")[::-1]
+
+    def paired_sequences(reader0, reader1):
+        """
+        Lists of sequences of equal length for both readers, stops if one of the readers is finished
+        """
+        iterators = [reader0.sequences(),reader1.sequences()]
+        pending = [[],[]]
+        while True:
+            for i in range(2):
+                if len(pending[i])==0:
+                    pending[i] = next(iterators[i],[])
+            n = min(len(pending[0]),len(pending[1]))
+            if n==0:
+                break
+            yield (pending[0][0:n],pending[1][0:n],)
+            pending = [pending[0][n:],pending[1][n:]]
@@ -0,0 +1,176 @@
+import logging, os, math, struct, tempfile, shutil
+import numpy as np
+import haplotyping
+
+class Kmc:
+
+    """
+    Internal use, read a KMC database (.kmc_pre and .kmc_suf) in lexicographic order
+    """
+
+    stepSizeRead = 4194304
+    stepSizeBucket = 16777216
+    stepSizeBlock = 1000000
+
+    def __init__(self, location: str):
+
+        """
+        Internal use only: initialize
+        """
+
+        #logger
+        self._logger = logging.getLogger(__name__)
+
+        self.location = Kmc.detect(location)
+        if self.location==None:
+            raise Exception("no KMC database at {}".format(location))
+        self.prefixFile = "{}.kmc_pre".format(self.location)
+        self.suffixFile = "{}.kmc_suf".format(self.location)
+
+        #parse header from prefix file
+        prefixFileSize = os.stat(self.prefixFile).st_size
+        with open(self.prefixFile, "rb") as f:
+            if not f.read(4)==b"KMCP":
+                raise Exception("no KMC prefix file: {}".format(self.prefixFile))
+            f.seek(prefixFileSize-12)
+            (self.version, headerOffset, marker) = struct.unpack("<II4s", f.read(12))
+            if not marker==b"KMCP":
+                raise Exception("incomplete KMC prefix file: {}".format(self.prefixFile))
+            if not self.version==0x200:
+                raise Exception("unsupported KMC database version {}".format(self.version))
+            f.seek(prefixFileSize-8-headerOffset)
+            (self.k, self.mode, self.counterSize, self.prefixLength, self.signatureLength,
+             self.minimumCount, self.maximumCount, self.numberOfKmers, strands) = struct.unpack(
+                "<7IQI", f.read(40))
+        #KMC stores canonical k-mers unless both strands were counted separately
+        self.canonical = (strands & 1)==0
+        if not self.mode==0:
+            raise Exception("unsupported KMC database mode {}".format(self.mode))
+        if not (self.k-self.prefixLength)%4==0:
+            raise Exception("unexpected KMC prefix length {}".format(self.prefixLength))
+
+        #memory map prefixes (lookup tables for all bins) and suffixes
+        signatureMapSize = ((4**self.signatureLength)+1)*4
+        lookupTableSize = (prefixFileSize-12) - signatureMapSize - headerOffset - 8
+        self.prefixes = np.memmap(self.prefixFile, dtype="<u8", mode="r", offset=4,
+                                  shape=(lookupTableSize//8,))
+        self.numberOfBins = len(self.prefixes)//(4**self.prefixLength)
+        self.suffixSize = (self.k-self.prefixLength)//4
+        self.recordSize = self.suffixSize + self.counterSize
+        if not os.stat(self.suffixFile).st_size==8+(self.numberOfKmers*self.recordSize):
+            raise Exception("unexpected size KMC suffix file: {}".format(self.suffixFile))
+        self.suffixes = np.memmap(self.suffixFile, dtype="uint8", mode="r", offset=4,
+                                  shape=(self.numberOfKmers,self.recordSize))
+        self.numberOfWords = math.ceil(self.k/32)
+
+    def detect(location: str):
+        """
+        Base location of a KMC database, or None
+        """
+        for extension in [".kmc_pre",".kmc_suf"]:
+            if location.endswith(extension):
+                location = location[:-len(extension)]
+                break
+        if os.path.isfile("{}.kmc_pre".format(location)) and os.path.isfile("{}.kmc_suf".format(location)):
+            return location
+        else:
+            return None
+
+    def _decode(self, start: int, end: int):
+        """
+        Decode records from the suffix file to 2-bit codes and frequencies
+        """
+        records = np.asarray(self.suffixes[start:end])
+        #prefix from lookup tables
+        positions = np.arange(start,end,dtype="uint64")
+        prefixes = ((np.searchsorted(self.prefixes,positions,side="right")-1)
+                    % (4**self.prefixLength)).astype("uint64")
+        codes = np.empty((end-start,self.k), dtype="uint8")
+        for i in range(self.prefixLength):
+            codes[:,i] = (prefixes >> np.uint64(2*(self.prefixLength-1-i))) & np.uint64(3)
+        for i in range(self.suffixSize):
+            for j in range(4):
+                codes[:,self.prefixLength+(4*i)+j] = (records[:,i] >> (6-(2*j))) & 3
+        #frequencies are stored little-endian
+        numbers = np.zeros(end-start, dtype="uint64")
+        for i in range(self.counterSize):
+            numbers |= records[:,self.suffixSize+i].astype("uint64") << np.uint64(8*i)
+        return (codes, numbers)
+
+    def kmers(self, temporaryDirectory=None):
+        """
+        Generate sorted blocks of k-mers and frequencies, including reverse complements for a canonical
+        database; k-mers sharing the first k-1 bases are never split over two blocks
+        """
+        #partition on the first bases, sort partitions in memory
+        estimatedNumber = self.numberOfKmers*(2 if self.canonical else 1)
+        bucketLength = 0
+        while (4**bucketLength)*Kmc.stepSizeBucket<estimatedNumber and bucketLength<min(5,self.k-1):
+            bucketLength+=1
+        numberOfBuckets = 4**bucketLength
+        dtypeBucket = np.dtype([("kmer","uint64",(self.numberOfWords,)),("number","uint32")])
+        self._logger.debug("partition {} k-mers from KMC database over {} buckets".format(
+            self.numberOfKmers,numberOfBuckets))
+        bucketDirectory = tempfile.mkdtemp(prefix="kmc_", dir=temporaryDirectory) if numberOfBuckets>1 else None
+        try:
+            buckets = [[] for b in range(numberOfBuckets)]
+            for i in range(0,self.numberOfKmers,Kmc.stepSizeRead):
+                (codes,numbers) = self._decode(i,min(self.numberOfKmers,i+Kmc.stepSizeRead))
+                selection = (numbers>=self.minimumCount) & (numbers<=self.maximumCount)
+                codes = codes[selection]
+                numbers = numbers[selection]
+                if self.canonical:
+                    reverseCodes = 3 - codes[:,::-1]
+                    #palindromes only once
+                    selection = (reverseCodes!=codes).any(axis=1)
+                    codes = np.concatenate((codes,reverseCodes[selection]))
+                    numbers = np.concatenate((numbers,numbers[selection]))
+                data = np.empty(len(numbers), dtype=dtypeBucket)
+                data["kmer"] = haplotyping.General.encode_codes(codes)
+                data["number"] = numbers
+                if bucketDirectory==None:
+                    buckets[0].append(data)
+                else:
+                    bucketIds = np.zeros(len(data), dtype="uint32")
+                    for j in range(bucketLength):
+                        bucketIds = (bucketIds<<2) | codes[:,j]
+                    order = np.argsort(bucketIds, kind="stable")
+                    boundaries = np.cumsum(np.bincount(bucketIds, minlength=numberOfBuckets))
+                    data = data[order]
+                    start = 0
+                    for b in range(numberOfBuckets):
+                        if boundaries[b]>start:
+                            with open(os.path.join(bucketDirectory,str(b)),"ab") as f:
+                                data[start:boundaries[b]].tofile(f)
+                        start = boundaries[b]
+            #sort and generate blocks
+            for b in range(numberOfBuckets):
+                if bucketDirectory==None:
+                    data = np.concatenate(buckets[b]) if len(buckets[b])>0 else np.zeros(0, dtype=dtypeBucket)
+                    buckets[b] = None
+                else:
+                    filename = os.path.join(bucketDirectory,str(b))
+                    if not os.path.exists(filename):
+                        continue
+                    data = np.fromfile(filename, dtype=dtypeBucket)
+                    os.remove(filename)
+                if len(data)==0:
+                    continue
+                keys = data["kmer"]
+                order = np.lexsort(tuple(keys[:,w] for w in range(self.numberOfWords-1,-1,-1)))
+                data = data[order]
+                kmers = haplotyping.General.decode_many(data["kmer"],self.k)
+                numbers = data["number"]
+                del data
+                bases = kmers.view("uint8").reshape(-1,self.k)[:,:self.k-1]
+                start = 0
+                while start<len(kmers):
+                    end = min(len(kmers),start+Kmc.stepSizeBlock)
+                    while end<len(kmers) and (bases[end]==bases[end-1]).all():
+                        end+=1
+                    yield (kmers[start:end],numbers[start:end])
+                    start = end
+        finally:
+            if not bucketDirectory==None:
+                shutil.rmtree(bucketDirectory, ignore_errors=True)
+
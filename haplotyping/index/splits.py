@@ -1,9 +1,11 @@
 import logging, h5py, tables, gzip, time
-import os, sys, shutil, psutil, numpy as np
-import re, haplotyping, ahocorasick, pickle, signal
+import os, sys, shutil, psutil, math, numpy as np
+import re, haplotyping, ahocorasick, pickle, signal, threading, hashlib
 import haplotyping.index.database
+import haplotyping.index.kmc
+import haplotyping.index.storage
 import multiprocessing as mp
-from queue import Empty
+from queue import Empty, Full
 
 class Splits:
     
@@ -12,8 +14,10 @@ class Splits:
     """
     
     stepSizeStorage = 1000000
+    stepSizeList = 16777216
     
-    def __init__(self, sortedIndexFile: str, h5file, filenameBase, debug=False, keepTemporaryFiles=False):
+    def __init__(self, sortedIndexFile: str, h5file, filenameBase, debug=False, keepTemporaryFiles=False,
+                 scratchDirectory=None, sortedStream=None):
         
         """
         Internal use only: initialize
@@ -27,10 +31,19 @@ class Splits:
         self.k = h5file["/config"].attrs["k"]
         self.automatonKmerSize = h5file["/config"].attrs["automatonKmerSize"]
         self.minimumFrequency = h5file["/config"].attrs["minimumCanonicalSplitFrequency"]
+        self.maximumProcesses = h5file["/config"].attrs.get("maximumProcesses",0)
+        self.maximumMemory = h5file["/config"].attrs.get("maximumMemory",0)
         self.h5file = h5file
+        self.filenameBase = filenameBase
         self.maximumNumber = 0
         self.debug = debug
         self.keepTemporaryFiles = keepTemporaryFiles
+        self.scratchDirectory = scratchDirectory
+        self.sortedStream = sortedStream
+        #temporary files in the scratch directory if provided
+        self.temporaryBase = (filenameBase if scratchDirectory==None 
+                              else os.path.join(scratchDirectory,os.path.basename(filenameBase)))
+        self.packedKmers = h5file["/config"].attrs.get("packedKmers",False)
         
         
         #check existence group
@@ -50,26 +63,35 @@ class Splits:
             self._logger.warning("histogram splitting k-mer bases dataset already in hdf5 storage")
         else:
         
+            pytablesFile = None
             try:                                                
-                pytablesFile = filenameBase+"_tmp_split.h5"
-                if os.path.exists(pytablesFile):
-                    os.remove(pytablesFile)
-                self._logger.debug("store temporary in "+pytablesFile)    
+                if self.scratchDirectory==None:
+                    pytablesFile = filenameBase+"_tmp_split.h5"
+                    if os.path.exists(pytablesFile):
+                        os.remove(pytablesFile)
+                    self._logger.debug("store temporary in "+pytablesFile)    
+                    temporaryStorage = tables.open_file(pytablesFile, mode="w", title="Temporary storage")
+                else:
+                    self._logger.debug("store temporary in "+self.scratchDirectory)    
+                    temporaryStorage = haplotyping.index.storage.Scratch(self.scratchDirectory,
+                                            os.path.basename(filenameBase)+"_tmp_split", self.keepTemporaryFiles)
                 
                 #create datasets
-                with tables.open_file(pytablesFile, mode="w", 
-                                      title="Temporary storage") as pytablesStorage:
+                with temporaryStorage as pytablesStorage:
                     #get k-mers
                     self._parseIndex(sortedIndexFile, pytablesStorage)
+                    self._reportTemporary(pytablesStorage, "parse")
                     self._sort(pytablesStorage)
+                    self._reportTemporary(pytablesStorage, "sort")
                     self._store(pytablesStorage)                    
+                    self._reportTemporary(pytablesStorage, "store")
                     #flush
                     self.h5file.flush()                    
             except Exception as e:
                 self._logger.error("problem occurred while constructing splits: "+str(e))
             finally:
                 try:
-                    if not self.keepTemporaryFiles:
+                    if not (self.keepTemporaryFiles or pytablesFile==None):
                         os.remove(pytablesFile)
                 except:
                     self._logger.error("problem removing "+pytablesFile)    
@@ -106,20 +128,34 @@ class Splits:
             minimumAllKmerFrequencies = mp.Value("L",2**32)
             maximumAllKmerFrequencies = mp.Value("L",0)
             histogramKmer = manager.dict()
+            #parse ranges of the sorted list in parallel if possible (main and list process excluded)
+            numberOfListWorkers = (self.maximumProcesses if self.maximumProcesses>0 else mp.cpu_count()) - 2
+            numberOfListWorkers = max(0,numberOfListWorkers)
+            #a stream can only be read from this process, blocks are passed to the list process
+            if haplotyping.index.Database.isStream(filename):
+                queue_blocks = mp.Queue(2+(2*numberOfListWorkers))
+                thread_stream = threading.Thread(target=Splits._readStream, daemon=True,
+                                                 args=(shutdown_event,filename,self.sortedStream,self.k,queue_blocks,))
+            else:
+                queue_blocks = None
+                thread_stream = None
             original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
             process_list = mp.Process(target=haplotyping.index.splits.Splits.workerList, 
-                                      args=(shutdown_event,filename,self.k,self.minimumFrequency,
+                                      args=(shutdown_event,filename,self.filenameBase,self.k,self.minimumFrequency,
                                             totalNumberOfKmers,totalSumOfKmerFrequencies,
                                             minimumAllKmerFrequencies,maximumAllKmerFrequencies,histogramKmer,
-                                            queue_splits, ))
+                                            queue_splits,numberOfListWorkers,queue_blocks, ))
             signal.signal(signal.SIGINT, original_sigint_handler)
 
             try:
                 #start
                 process_list.start()
+                if not thread_stream==None:
+                    thread_stream.start()
                 #init
                 rightSplitBases = 0
                 rightSplitKmers = 0
+                dumpRows = []
                 self.frequencyHistogram = {"kmer": {}, "ckmer": {}, "base": {}}
                 #process queue
                 while True:
@@ -130,24 +166,22 @@ class Splits:
                         else:
                             rightSplitBases+=1
                             for key,value in item[1].items():
-                                kmer = item[0]+key
-                                ckmer = haplotyping.General.canonical(kmer)
-                                #assume right splitting if k-mer equals rc
-                                #todo: can this (in theory) cause problematic situations?
-                                ckmerType = "r" if kmer==ckmer else "l"
-                                ckmerRow = tableDumpKmers.row            
-                                ckmerRow["ckmer"] = ckmer
-                                ckmerRow["type"] = ckmerType
-                                ckmerRow["number"] = value
-                                ckmerRow.append()
+                                dumpRows.append((item[0]+key,value,))
                                 rightSplitKmers+=1 
-                                self.frequencyHistogram["ckmer"][value] = (
-                                    self.frequencyHistogram["ckmer"].get(value,0)+1)
+                            if len(dumpRows)>=Splits.stepSizeStorage:
+                                dumpData = Splits._dumpKmers(tableDumpKmers,dumpRows)
+                                Splits._addHistogram(self.frequencyHistogram["ckmer"],dumpData["number"])
+                                dumpRows = []
                             if (rightSplitBases%1000000)==0:
                                 self._logger.debug("processed {} bases and {} k-mers".format(
                                     rightSplitBases,rightSplitKmers))
                     except Empty:
+                        if not process_list.is_alive():
+                            raise Exception("parsing sorted list stopped unexpectedly")
                         continue
+                if len(dumpRows)>0:
+                    dumpData = Splits._dumpKmers(tableDumpKmers,dumpRows)
+                    Splits._addHistogram(self.frequencyHistogram["ckmer"],dumpData["number"])
                 tableDumpKmers.flush()
                 self._logger.debug("found {} rightSplitBases and {} rightSplitKmers".format(
                     rightSplitBases,rightSplitKmers))
@@ -163,6 +197,8 @@ class Splits:
             finally:
                 #close queus workers
                 close_queue(queue_splits)
+                if not queue_blocks==None:
+                    close_queue(queue_blocks)
                 #shutdown
                 shutdown_event.set()
                 #join
@@ -175,119 +211,245 @@ class Splits:
             self.h5file["/config/"].attrs["minimumKmerFrequencies"]=minimumAllKmerFrequencies.value
             self.h5file["/config/"].attrs["maximumKmerFrequencies"]=maximumAllKmerFrequencies.value
             
-    def workerList(shutdown_event,filename,k,minimumFrequency,totalNumberOfKmers,totalSumOfKmerFrequencies,
+    def workerList(shutdown_event,filename,filenameBase,k,minimumFrequency,totalNumberOfKmers,totalSumOfKmerFrequencies,
                                         minimumAllKmerFrequencies,maximumAllKmerFrequencies,histogramKmer,
-                                        queue_splits):
+                                        queue_splits,numberOfWorkers=0,queue_blocks=None):
         logger = logging.getLogger("{}.worker.list".format(__name__))
         try:
-            with gzip.open(filename, "rt") as f: 
-                logger.debug("parse sorted list to detect right splitting k-mers")
-                previousBase = ""
-                previousBranch = ""
-                previousKmer = ""
-                previousNumber = 0                 
-                #administration
-                rightSplitBases = 0
-                rightSplitKmers = 0
-                stored={}
-                errorNumber = 0
-                _totalNumberOfKmers=0
-                _totalSumOfKmerFrequencies=0
-                _minimumAllKmerFrequencies=2**32
-                _maximumAllKmerFrequencies=0
-                _histogramKmer = {}
-                while (row := f.readline()):
-                    line = row.strip().split("\t") 
-                    currentBase = line[0][:-1]
-                    currentBranch = line[0][-1]
-                    currentKmer = line[0]
-                    _totalNumberOfKmers+=1
-                    if (_totalNumberOfKmers%10000000)==0 and (_totalNumberOfKmers>0):
-                        logger.debug("processed {} k-mers".format(_totalNumberOfKmers))
-                    currentNumber = int(line[1])
-                    _totalSumOfKmerFrequencies += currentNumber
-                    _minimumAllKmerFrequencies = min(_minimumAllKmerFrequencies,currentNumber)
-                    _maximumAllKmerFrequencies = max(_maximumAllKmerFrequencies,currentNumber)
-                    _histogramKmer[currentNumber] = (_histogramKmer.get(currentNumber,0)+1)
-                    if currentNumber < minimumFrequency:
-                        pass
-                    else:
-                        if currentBase==previousBase:
-                            stored[previousBranch]=previousNumber
-                            stored[currentBranch]=currentNumber
-                        else:
-                            if len(stored)>1:
-                                queue_splits.put((previousBase,stored,))
-                                stored={}                                        
-                        previousBase = currentBase
-                        previousBranch = currentBranch
-                        previousKmer = currentKmer
-                        previousNumber = currentNumber
-                if len(stored)>1:
-                    queue_splits.put((previousBase,stored,)) 
-                #store stats
-                totalNumberOfKmers.value=_totalNumberOfKmers
-                totalSumOfKmerFrequencies.value=_totalSumOfKmerFrequencies
-                minimumAllKmerFrequencies.value=_minimumAllKmerFrequencies
-                maximumAllKmerFrequencies.value=_maximumAllKmerFrequencies
-                for key in _histogramKmer.keys():
-                    histogramKmer[key] = _histogramKmer[key]
-                #close queue
-                queue_splits.put(None)
-                #warning
-                if errorNumber>0:
-                    logger.warning("skipped {} items in sorted list".format(errorNumber))
-                #stats
-                minimumAllKmerFrequencies.value=min(minimumAllKmerFrequencies.value,maximumAllKmerFrequencies.value)
-                logger.debug("checked {} k-mers with {} total frequency".format(
-                    totalNumberOfKmers.value,totalSumOfKmerFrequencies.value))
-                logger.debug("frequency k-mers between {} and {}".format(
-                    minimumAllKmerFrequencies.value,maximumAllKmerFrequencies.value))
+            logger.debug("parse sorted list with {} workers to detect right splitting k-mers".format(
+                max(1,numberOfWorkers)))
+            #administration
+            errorNumber = 0
+            _totalNumberOfKmers=0
+            _totalSumOfKmerFrequencies=0
+            _minimumAllKmerFrequencies=2**32
+            _maximumAllKmerFrequencies=0
+            _histogramKmer = {}
+            def processResult(result):
+                nonlocal errorNumber,_totalNumberOfKmers,_totalSumOfKmerFrequencies
+                nonlocal _minimumAllKmerFrequencies,_maximumAllKmerFrequencies
+                (number,frequencies,minimum,maximum,histogram,splits,errors) = result
+                errorNumber+=errors
+                _totalNumberOfKmers+=number
+                _totalSumOfKmerFrequencies+=frequencies
+                _minimumAllKmerFrequencies = min(_minimumAllKmerFrequencies,minimum)
+                _maximumAllKmerFrequencies = max(_maximumAllKmerFrequencies,maximum)
+                for key,value in histogram.items():
+                    _histogramKmer[key] = (_histogramKmer.get(key,0)+value)
+                for item in splits:
+                    queue_splits.put(item)
+                logger.debug("processed {} k-mers".format(_totalNumberOfKmers))
+            if numberOfWorkers>0:
+                #ranges are processed in parallel, results are handled in the original order
+                with mp.Pool(numberOfWorkers) as pool:
+                    results = []
+                    for block in Splits._readBlocks(filename,filenameBase,k,queue_blocks):
+                        results.append(pool.apply_async(haplotyping.index.splits.Splits.workerListBlock,
+                                                        (block,k,minimumFrequency,)))
+                        while len(results)>2*numberOfWorkers:
+                            processResult(results.pop(0).get())
+                    while len(results)>0:
+                        processResult(results.pop(0).get())
+            else:
+                for block in Splits._readBlocks(filename,filenameBase,k,queue_blocks):
+                    processResult(Splits.workerListBlock(block,k,minimumFrequency))
+            #store stats
+            totalNumberOfKmers.value=_totalNumberOfKmers
+            totalSumOfKmerFrequencies.value=_totalSumOfKmerFrequencies
+            minimumAllKmerFrequencies.value=_minimumAllKmerFrequencies
+            maximumAllKmerFrequencies.value=_maximumAllKmerFrequencies
+            for key in _histogramKmer.keys():
+                histogramKmer[key] = _histogramKmer[key]
+            #close queue
+            queue_splits.put(None)
+            #warning
+            if errorNumber>0:
+                logger.warning("skipped {} items in sorted list".format(errorNumber))
+            #stats
+            minimumAllKmerFrequencies.value=min(minimumAllKmerFrequencies.value,maximumAllKmerFrequencies.value)
+            logger.debug("checked {} k-mers with {} total frequency".format(
+                totalNumberOfKmers.value,totalSumOfKmerFrequencies.value))
+            logger.debug("frequency k-mers between {} and {}".format(
+                minimumAllKmerFrequencies.value,maximumAllKmerFrequencies.value))
         except Exception as ex:
             logger.error("problem with sorted list: "+str(ex))
-    
+
+    def _readBlocks(filename,filenameBase,k,queue_blocks=None):
+        """
+        Read blocks from the sorted list or sorted blocks of k-mers and frequencies from a KMC database
+        """
+        if not queue_blocks==None:
+            #blocks from a stream read by the main process
+            while True:
+                block = queue_blocks.get(block=True)
+                if block==None:
+                    break
+                elif isinstance(block,Exception):
+                    raise block
+                yield block
+            return
+        location = haplotyping.index.kmc.Kmc.detect(filename)
+        if location==None:
+            with Splits.openList(filename) as f:
+                yield from Splits._readListBlocks(f,k)
+        else:
+            kmc = haplotyping.index.kmc.Kmc(location)
+            if not kmc.k==k:
+                raise Exception("k-mer size {} for KMC database, expected {}".format(kmc.k,k))
+            yield from kmc.kmers(os.path.dirname(os.path.abspath(filenameBase)))
+
+    def _readStream(shutdown_event,filename,sortedStream,k,queue_blocks):
+        """
+        Read blocks from a stream with the sorted list, opened with its first line or opened here
+        """
+        logger = logging.getLogger("{}.stream".format(__name__))
+        def put(item):
+            while not shutdown_event.is_set():
+                try:
+                    queue_blocks.put(item, block=True, timeout=1)
+                    return True
+                except Full:
+                    pass
+            return False
+        (stream,line) = (None,None)
+        try:
+            (stream,line) = (haplotyping.index.Database.openStream(filename) if sortedStream==None 
+                             else sortedStream)
+            if not len(line.split(b"\t")[0].rstrip())==k:
+                raise Exception("unexpected k-mer size in stream {}".format(filename))
+            for block in Splits._readListBlocks(stream,k,line):
+                if not put(block):
+                    return
+            put(None)
+        except Exception as ex:
+            logger.error("problem reading stream {}: {}".format(filename,ex))
+            put(Exception("problem reading stream: {}".format(ex)))
+        finally:
+            if not stream==None:
+                haplotyping.index.Database.closeStream(stream)
+
+    def openList(filename):
+        """
+        Open the sorted list, gzip compressed or uncompressed
+        """
+        with open(filename, "rb") as f:
+            compressed = f.read(2)==b"\x1f\x8b"
+        return gzip.open(filename, "rb") if compressed else open(filename, "rb")
+
+    def _readListBlocks(f,k,remainder=b""):
+        """
+        Read blocks from the sorted list, never splitting lines with the same base over two blocks
+        """
+        while True:
+            data = f.read(Splits.stepSizeList)
+            if not data:
+                if len(remainder)>0:
+                    yield remainder
+                break
+            block = remainder + data
+            #start of the last complete line
+            end = block.rfind(b"\n")
+            if end<0:
+                remainder = block
+                continue
+            position = block.rfind(b"\n",0,end)+1
+            base = block[position:position+k-1]
+            #move all lines with this base to the next block
+            while position>0:
+                previousPosition = block.rfind(b"\n",0,position-1)+1
+                if block[previousPosition:previousPosition+k-1]==base:
+                    position = previousPosition
+                else:
+                    break
+            if position==0:
+                remainder = block
+            else:
+                yield block[:position]
+                remainder = block[position:]
+
+    def _parseListBlock(block,k):
+        """
+        Parse a block from the sorted list into fixed-width k-mers and a frequency column
+        """
+        data = np.frombuffer(block, dtype=np.uint8)
+        if len(data)==0:
+            return (np.zeros(0,dtype="S{}".format(k)), np.zeros(0,dtype="uint32"), 0)
+        ends = np.flatnonzero(data==10)
+        if not data[-1]==10:
+            ends = np.append(ends,len(data))
+        starts = np.concatenate(([0],ends[:-1]+1))
+        #ignore carriage returns and empty lines
+        ends = ends - ((ends>starts) & (data[np.maximum(ends-1,0)]==13))
+        selection = ends>starts
+        starts = starts[selection]
+        ends = ends[selection]
+        #check k-mer size, separator and number of digits
+        digits = ends-starts-k-1
+        selection = (digits>0) & (digits<=10)
+        selection[selection] = data[starts[selection]+k]==9
+        errors = len(selection) - np.count_nonzero(selection)
+        starts = starts[selection]
+        digits = digits[selection]
+        if len(starts)==0:
+            return (np.zeros(0,dtype="S{}".format(k)), np.zeros(0,dtype="uint32"), errors)
+        #frequencies
+        maximumDigits = digits.max()
+        positions = np.arange(maximumDigits)
+        mask = positions<digits[:,None]
+        values = data[np.minimum(starts[:,None]+k+1+positions,len(data)-1)].astype("int64")-48
+        values[~mask] = 0
+        factors = np.where(mask,10**np.maximum(digits[:,None]-1-positions,0),0)
+        numbers = (values*factors).sum(axis=1)
+        selection = ~(((values<0)|(values>9)).any(axis=1)) & (numbers<=np.iinfo(np.uint32).max)
+        if not selection.all():
+            errors += len(selection) - np.count_nonzero(selection)
+            starts = starts[selection]
+            numbers = numbers[selection]
+        #k-mers
+        kmers = data[starts[:,None]+np.arange(k)].view("S{}".format(k)).ravel()
+        return (kmers, numbers.astype("uint32"), errors)
+
+    def _processListBlock(kmers,numbers,k,minimumFrequency):
+        """
+        Histogram and right splitting k-mers for sorted k-mers and frequencies without groups crossing boundaries
+        """
+        if len(numbers)==0:
+            return (0,0,2**32,0,{},[])
+        frequencies,frequencyCounts = np.unique(numbers, return_counts=True)
+        histogram = dict(zip(frequencies.tolist(),frequencyCounts.tolist()))
+        stats = (len(numbers),int(numbers.sum(dtype="uint64")),int(frequencies[0]),int(frequencies[-1]),)
+        #only frequent k-mers
+        selection = numbers>=minimumFrequency
+        kmers = kmers[selection]
+        numbers = numbers[selection]
+        splits = []
+        if len(kmers)>1:
+            #compare bases of neighbouring k-mers
+            bases = kmers.view(np.uint8).reshape(-1,k)[:,:k-1]
+            boundaries = np.flatnonzero((bases[1:]!=bases[:-1]).any(axis=1))+1
+            groupStarts = np.concatenate(([0],boundaries))
+            groupEnds = np.concatenate((boundaries,[len(kmers)]))
+            selection = (groupEnds-groupStarts)>1
+            for start,end in zip(groupStarts[selection].tolist(),groupEnds[selection].tolist()):
+                groupKmers = kmers[start:end].tolist()
+                groupNumbers = numbers[start:end].tolist()
+                base = groupKmers[0][:-1].decode()
+                splits.append((base,{groupKmers[i][-1:].decode(): groupNumbers[i] 
+                                     for i in range(len(groupKmers))},))
+        return stats+(histogram,splits,)
+
+    def workerListBlock(block,k,minimumFrequency):
+        """
+        Detect right splitting k-mers in a block from the sorted list
+        """
+        if isinstance(block,bytes):
+            (kmers,numbers,errors) = Splits._parseListBlock(block,k)
+        else:
+            (kmers,numbers) = block
+            errors = 0
+        return Splits._processListBlock(kmers,numbers,k,minimumFrequency)+(errors,)
 
     def _sort(self, pytablesStorage):                        
-        
-        def saveToSortedCkmerStorage(ckmer,ckmerType,number,numberOfCkmers):
-            ckmerRow = tableSortedKmers.row            
-            ckmerRow["ckmer"] = ckmer
-            ckmerRow["type"] = ckmerType
-            ckmerRow["number"] = number
-            ckmerRow.append()
-            if ckmerType=="r" or ckmerType=="b":
-                saveToDumpBaseStorage(ckmer[:-1],ckmer[-1],number,numberOfCkmers)
-            if ckmerType=="l" or ckmerType=="b":
-                rkmer=haplotyping.General.reverse_complement(ckmer)
-                saveToDumpBaseStorage(rkmer[:-1],rkmer[-1],number,numberOfCkmers)
-            return numberOfCkmers+1
-        
-        def saveToSortedBaseStorage(base,branches,number,numberOfBases):
-            baseRow = tableSortedBases.row    
-            baseRow["base"] = base
-            baseRow["number"] = number
-            self.frequencyHistogram["base"][number] = (
-                                self.frequencyHistogram["base"].get(number,0)+1)
-            for letter in branches.keys():
-                baseRow["branches/"+str(letter)+"/number"] = branches[letter][0]
-                baseRow["branches/"+str(letter)+"/ckmerLink"] = branches[letter][1]
-                ckmerRow = tableSortedKmers[branches[letter][1]]
-                ckmer = ckmerRow["ckmer"].decode()
-                rkmer=haplotyping.General.reverse_complement(ckmer)
-                if ckmer == base+letter:
-                    baseReferences[branches[letter][1]][1] = numberOfBases
-                if rkmer == base+letter:
-                    baseReferences[branches[letter][1]][0] = numberOfBases
-            baseRow.append()
-            return numberOfBases+1
-            
-        def saveToDumpBaseStorage(base,branch,number,ckmerLink):   
-            baseRow = tableDumpRightSplitBases.row
-            baseRow["base"] = base
-            baseRow["branch"] = branch
-            baseRow["number"] = number
-            baseRow["ckmerLink"] = ckmerLink
-            baseRow.append()
             
         tableDumpKmers = pytablesStorage.root.dumpCkmer
         
@@ -310,12 +472,13 @@ class Splits:
                                         "sortedCkmer",tableCkmerDef, "Temporary to store sorted canonical k-mers",
                                         expectedrows=numberOfSplittingKmers)  
             
-            #create dump table for bases
+            #create dump table for bases, side defines if the base is for a right (1) and/or left (2) split
             tableDumpBaseDef = {
                 "base": tables.StringCol(self.k-1,pos=0),
                 "branch": tables.StringCol(1,pos=1),
                 "number": tables.UInt32Col(pos=2,dflt=0),
                 "ckmerLink": haplotyping.index.Database.getTablesUint(numberOfSplittingKmers,3),
+                "side": tables.UInt8Col(pos=4,dflt=0),
             }
             tableDumpRightSplitBases = pytablesStorage.create_table(pytablesStorage.root,
                                                                    "dumpRightSplitBase",tableDumpBaseDef, 
@@ -324,35 +487,38 @@ class Splits:
             
             #store sorted k-mers
             self._logger.debug("sort and group "+str(numberOfSplittingKmers)+" splitting k-mers")
-            tableDumpKmers.cols.ckmer.create_csindex()
-            tableDumpKmers.flush()
-            self._logger.debug("created index to sort k-mers")
-            previousCkmer=None
-            previousType=None
-            previousN=None
             self.maximumNumber = 0
             numberOfCkmers = 0
-            for row in tableDumpKmers.itersorted("ckmer",checkCSI=True):
-                currentCkmer=row["ckmer"]
-                currentType=row["type"]
-                currentN=row["number"]
-                if previousCkmer and not previousCkmer==currentCkmer:
-                    numberOfCkmers = saveToSortedCkmerStorage(previousCkmer.decode(),previousType,
-                                                         previousN,numberOfCkmers)
-                    self.maximumNumber=max(self.maximumNumber,previousN)
-                    previousType=currentType.decode()
-                elif previousCkmer and not previousType==currentType:
-                    previousType="b"
-                else:
-                    previousType=currentType.decode()
-                previousCkmer=currentCkmer
-                previousN=currentN
-                if (numberOfCkmers%1000000)==0 and (numberOfCkmers>0):
-                    self._logger.debug("processed {} k-mers".format(numberOfCkmers))
-            if previousCkmer:        
-                numberOfCkmers = saveToSortedCkmerStorage(previousCkmer.decode(),previousType,
-                                                     previousN,numberOfCkmers) 
-                self.maximumNumber=max(self.maximumNumber,previousN)
+            for data in Splits._completeGroups(self._sortRecords(tableDumpKmers,"ckmer",self.k),"ckmer"):
+                #detect groups of identical canonical k-mers
+                boundaries = np.flatnonzero(data["ckmer"][1:]!=data["ckmer"][:-1])+1
+                groupStarts = np.concatenate(([0],boundaries))
+                groupEnds = np.concatenate((boundaries,[len(data)]))
+                right = np.add.reduceat((data["type"]==b"r").astype("uint32"),groupStarts)>0
+                left = np.add.reduceat((data["type"]==b"l").astype("uint32"),groupStarts)>0
+                sortedData = np.zeros(len(groupStarts), dtype=tableSortedKmers.dtype)
+                sortedData["ckmer"] = data["ckmer"][groupStarts]
+                sortedData["type"] = np.where(right & left, b"b", np.where(right, b"r", b"l"))
+                sortedData["number"] = data["number"][groupEnds-1]
+                tableSortedKmers.append(sortedData)
+                self.maximumNumber = max(self.maximumNumber,int(sortedData["number"].max()))
+                #dump bases
+                ckmers = np.ascontiguousarray(sortedData["ckmer"]).view("uint8").reshape(-1,self.k)
+                rkmers = haplotyping.General.reverse_complement_many(
+                    sortedData["ckmer"]).view("uint8").reshape(-1,self.k)
+                palindromes = (ckmers==rkmers).all(axis=1)
+                links = np.arange(numberOfCkmers,numberOfCkmers+len(sortedData))
+                for kmers,selection,side in [(ckmers,right,1,),(rkmers,left,2,)]:
+                    dumpData = np.zeros(np.count_nonzero(selection), dtype=tableDumpRightSplitBases.dtype)
+                    kmers = np.ascontiguousarray(kmers[selection])
+                    dumpData["base"] = np.ascontiguousarray(kmers[:,:-1]).view("S{}".format(self.k-1)).ravel()
+                    dumpData["branch"] = kmers[:,-1].view("S1")
+                    dumpData["number"] = sortedData["number"][selection]
+                    dumpData["ckmerLink"] = links[selection]
+                    dumpData["side"] = np.where(palindromes[selection],3,side)
+                    tableDumpRightSplitBases.append(dumpData)
+                numberOfCkmers+=len(sortedData)
+                self._logger.debug("processed {} k-mers".format(numberOfCkmers))
             self._logger.debug("in total processed {} k-mers".format(numberOfCkmers))
             
             tableDumpRightSplitBases.flush()                
@@ -378,35 +544,38 @@ class Splits:
             
             #store sorted bases
             self._logger.debug("sort and group {} bases".format(numberOfBases))
-            tableDumpRightSplitBases.cols.base.create_csindex()
-            tableDumpRightSplitBases.flush()
-            self._logger.debug("created index to sort bases")
-            previousBase=None
-            previousBranches={}
-            previousNumber=0
             numberOfBases = 0
             #reserve memory for links in ckmer table
             ckmerLinkType = np.dtype(haplotyping.index.Database.getUint(numberOfKmers)).type
             baseReferences = np.full((numberOfKmers,2), 0, dtype=ckmerLinkType)
-            for row in tableDumpRightSplitBases.itersorted("base",checkCSI=True):
-                currentBase=row[0]
-                currentBranch=row[1]
-                currentNumber=row[2]
-                currentCkmerLink=row[3]
-                if previousBase and not previousBase==currentBase:
-                    numberOfBases = saveToSortedBaseStorage(previousBase.decode(),previousBranches,
-                                                            previousNumber,numberOfBases)
-                    previousBase=None
-                    previousBranches={}
-                    previousNumber=0
-                    if (numberOfBases%1000000)==0 and (numberOfBases>0):
-                        self._logger.debug("processed {} bases".format(numberOfBases))
-                previousBase=currentBase
-                previousBranches[currentBranch.decode()] = (currentNumber, currentCkmerLink,)
-                previousNumber+=currentNumber                    
-            if previousBase:
-                    numberOfBases = saveToSortedBaseStorage(previousBase.decode(),previousBranches,
-                                                            previousNumber,numberOfBases)  
+            letters = np.full(256, 0, dtype="uint8")
+            for i in range(len(haplotyping.index.Database.letters)):
+                letters[ord(haplotyping.index.Database.letters[i])] = i
+            for data in Splits._completeGroups(self._sortRecords(tableDumpRightSplitBases,"base",self.k-1),"base"):
+                #detect groups of identical bases
+                boundaries = np.flatnonzero(data["base"][1:]!=data["base"][:-1])+1
+                groupStarts = np.concatenate(([0],boundaries))
+                groups = np.repeat(np.arange(len(groupStarts)),np.diff(np.append(groupStarts,len(data))))
+                branches = letters[np.ascontiguousarray(data["branch"]).view("uint8")]
+                sortedData = np.zeros(len(groupStarts), dtype=tableSortedBases.dtype)
+                sortedData["base"] = data["base"][groupStarts]
+                sortedData["number"] = np.add.reduceat(data["number"].astype("uint64"),groupStarts)
+                for i in range(len(haplotyping.index.Database.letters)):
+                    selection = branches==i
+                    letter = haplotyping.index.Database.letters[i]
+                    sortedData["branches"][letter]["number"][groups[selection]] = data["number"][selection]
+                    sortedData["branches"][letter]["ckmerLink"][groups[selection]] = data["ckmerLink"][selection]
+                tableSortedBases.append(sortedData)
+                #references from k-mers to bases
+                groups = groups + numberOfBases
+                selection = (data["side"] & 1)>0
+                baseReferences[data["ckmerLink"][selection],1] = groups[selection]
+                selection = (data["side"] & 2)>0
+                baseReferences[data["ckmerLink"][selection],0] = groups[selection]
+                #histogram
+                Splits._addHistogram(self.frequencyHistogram["base"],sortedData["number"])
+                numberOfBases+=len(sortedData)
+                self._logger.debug("processed {} bases".format(numberOfBases))
             self._logger.debug("in total processed {} bases".format(numberOfBases))
             #update ckmers
             tableSortedKmers.modify_columns(columns=baseReferences,
@@ -414,6 +583,147 @@ class Splits:
                 
         else:
             self._logger.warning("no splitting k-mers to sort and group")
+
+            
+    def _reportTemporary(self, pytablesStorage, phase):
+        """
+        Report temporary storage for the finished phase
+        """
+        if isinstance(pytablesStorage,haplotyping.index.storage.Scratch):
+            pytablesStorage.report("splits/{}".format(phase))
+        else:
+            pytablesStorage.flush()
+            self._logger.info("temporary storage splits/{}: {} MB".format(
+                phase,round(os.path.getsize(pytablesStorage.filename)/1048576,1)))
+            
+    def _dumpKmers(table, rows):
+        """
+        Append k-mers with frequencies as canonical k-mers to temporary table
+        """
+        kmers = np.array([row[0] for row in rows], dtype="S")
+        ckmers = haplotyping.General.canonical_many(kmers)
+        dumpData = np.zeros(len(rows), dtype=table.dtype)
+        dumpData["ckmer"] = ckmers
+        #assume right splitting if k-mer equals rc
+        #todo: can this (in theory) cause problematic situations?
+        dumpData["type"] = np.where(kmers==ckmers, b"r", b"l")
+        dumpData["number"] = [row[1] for row in rows]
+        table.append(dumpData)
+        return dumpData
+
+    def _addHistogram(histogram, values):
+        """
+        Add the counted values to the frequency histogram
+        """
+        values = np.asarray(values).astype("int64")
+        if len(values)==0:
+            return
+        #bincount for a compact range of values, otherwise count unique values
+        if int(values.max())<=Splits.stepSizeStorage:
+            counts = np.bincount(values)
+            frequencies = np.flatnonzero(counts)
+            frequencyCounts = counts[frequencies]
+        else:
+            frequencies,frequencyCounts = np.unique(values, return_counts=True)
+        for frequency,frequencyCount in zip(frequencies.tolist(),frequencyCounts.tolist()):
+            histogram[frequency] = histogram.get(frequency,0)+frequencyCount
+            
+    def _sortRecords(self, table, field, length):
+        """
+        Sort records from temporary table on k-mer field in memory, or with sorted runs on disk 
+        if this exceeds the maximum memory
+        """
+        numberOfWords = math.ceil(length/32)
+        def sortRecords(data):
+            keys = haplotyping.General.encode_many(data[field])
+            if numberOfWords==1:
+                return data[np.argsort(keys, kind="stable")]
+            else:
+                return data[np.lexsort(keys.T[::-1])]
+        numberOfRecords = table.shape[0]
+        #memory for records, keys, codes and order
+        recordSize = table.dtype.itemsize + (8*length) + (8*numberOfWords) + 8
+        if self.maximumMemory>0:
+            runSize = max(Splits.stepSizeStorage,int(self.maximumMemory/(2*recordSize)))
+        else:
+            runSize = numberOfRecords
+        if runSize>=numberOfRecords:
+            data = sortRecords(table.read())
+            for i in range(0,numberOfRecords,Splits.stepSizeStorage):
+                yield data[i:i+Splits.stepSizeStorage]
+        else:
+            runs = []
+            with haplotyping.index.storage.Scratch(os.path.dirname(os.path.abspath(self.temporaryBase)),
+                    "{}_tmp_split_{}".format(os.path.basename(self.temporaryBase),table.name)) as runStorage:
+                for i in range(0,numberOfRecords,runSize):
+                    run = runStorage.create_table(runStorage.root,"run{}".format(len(runs)),table.dtype)
+                    run.append(sortRecords(table.read(i,i+runSize)))
+                    runs.append(run)
+                self._logger.debug("merge {} sorted runs for {} records".format(len(runs),numberOfRecords))
+                #k-way merge, only process records up to the smallest last key in the loaded blocks
+                positions = [0]*len(runs)
+                blockSize = max(1,int(runSize/len(runs)))
+                while True:
+                    blocks = [runs[r].read(positions[r],positions[r]+blockSize) for r in range(len(runs))]
+                    bound = None
+                    for r in range(len(runs)):
+                        if positions[r]+len(blocks[r])<runs[r].nrows:
+                            last = blocks[r][field][-1]
+                            bound = last if bound==None else min(bound,last)
+                    for r in range(len(runs)):
+                        if not bound==None:
+                            blocks[r] = blocks[r][:np.searchsorted(blocks[r][field],bound,side="right")]
+                        positions[r]+=len(blocks[r])
+                    data = np.concatenate(blocks)
+                    if len(data)==0:
+                        break
+                    yield sortRecords(data)
+                runStorage.report("splits/sort/{}".format(table.name))
+
+    def _completeGroups(blocks, field):
+        """
+        Adjust sorted blocks to prevent records with identical field value in different blocks
+        """
+        remainder = None
+        for data in blocks:
+            if not remainder is None:
+                data = np.concatenate((remainder,data))
+            position = np.searchsorted(data[field],data[field][-1],side="left")
+            if position==0:
+                remainder = data
+            else:
+                yield data[:position]
+                remainder = data[position:]
+        if not remainder is None and len(remainder)>0:
+            yield remainder
+            
+    def _kmerType(k, packed):
+        """
+        Type for a fixed-width or 2-bit packed k-mer field
+        """
+        if not packed:
+            return "S"+str(k)
+        elif k<=32:
+            return "uint64"
+        else:
+            return ("uint64",(math.ceil(k/32),))
+            
+    def _packRecords(data, field, packed):
+        """
+        Records with the k-mer field replaced by 2-bit packed words if required
+        """
+        if not packed:
+            return data
+        dtypeList = [(name,data.dtype[name]) for name in data.dtype.names]
+        k = data.dtype[field].itemsize
+        dtypeList[data.dtype.names.index(field)] = (field,Splits._kmerType(k,packed))
+        packedData = np.zeros(len(data), dtype=dtypeList)
+        for name in data.dtype.names:
+            if name==field:
+                packedData[name] = haplotyping.General.encode_many(data[name])
+            else:
+                packedData[name] = data[name]
+        return packedData
             
     def _store(self, pytablesStorage):
         canonicalSplitKmers = 0
@@ -428,7 +738,7 @@ class Splits:
         numberOfKmers=tableSortedKmers.shape[0]
         numberOfBases=tableSortedBases.shape[0]
         # CKMER STORAGE - don't make the structure unnecessary big
-        dtypeCkmerList=[("ckmer","S"+str(self.k)),
+        dtypeCkmerList=[("ckmer",Splits._kmerType(self.k,self.packedKmers)),
                    ("type","S1"),
                    ("number",haplotyping.index.Database.getUint(self.maximumNumber)),
                    ("rightSplitBaseLink",[("leftSplit",haplotyping.index.Database.getUint(numberOfBases)),
@@ -447,24 +757,24 @@ class Splits:
                    ("paired",[("link",haplotyping.index.Database.getUint(numberOfKmers)),
                               ("number",haplotyping.index.Database.getUint(self.maximumNumber))])]
         dtCkmer=np.dtype(dtypeCkmerList)
-        dsCkmer=self.h5file["/split/"].create_dataset("ckmer",(numberOfKmers,), dtype=dtCkmer, chunks=None, 
-                                                      compression="gzip", compression_opts=9)
+        optionsCkmer=haplotyping.index.Database.getStorageOptions(self.h5file,(numberOfKmers,),dtCkmer)
+        dsCkmer=self.h5file["/split/"].create_dataset("ckmer",(numberOfKmers,), dtype=dtCkmer, 
+                                                      **optionsCkmer)
         self._logger.info("store {} splitting k-mers".format(numberOfKmers))
         #add stored and grouped kmers to the final unchunked storage
         for i in range(0,numberOfKmers,Splits.stepSizeStorage):
-            stepData = tableSortedKmers[i:i+Splits.stepSizeStorage]
-            dsCkmer[i:i+Splits.stepSizeStorage] = stepData
-            for row in stepData:
-                canonicalSplitKmers+=1
-                if row[1].decode()=="l":
-                    canonicalSplitKmersLeft+=1
-                elif row[1].decode()=="b":
-                    canonicalSplitKmersBoth+=1
-                elif row[1].decode()=="r":
-                    canonicalSplitKmersRight+=1
+            stepData = tableSortedKmers.read(i,min(numberOfKmers,i+Splits.stepSizeStorage))
+            dsCkmer[i:i+len(stepData)] = Splits._packRecords(stepData,"ckmer",self.packedKmers)
+            #count split types
+            types,typeCounts = np.unique(stepData["type"], return_counts=True)
+            typeCounts = dict(zip(types.tolist(),typeCounts.tolist()))
+            canonicalSplitKmers+=len(stepData)
+            canonicalSplitKmersLeft+=typeCounts.get(b"l",0)
+            canonicalSplitKmersBoth+=typeCounts.get(b"b",0)
+            canonicalSplitKmersRight+=typeCounts.get(b"r",0)
         dsCkmer.flush()
         # BASE STORAGE - don't make the structure unnecessary big
-        dtypeBaseList=[("base","S"+str(self.k-1)),
+        dtypeBaseList=[("base",Splits._kmerType(self.k-1,self.packedKmers)),
                    ("number",haplotyping.index.Database.getUint(self.maximumNumber)),
                    ("branches",[])]
         for i in range(len(haplotyping.index.Database.letters)):
@@ -472,13 +782,14 @@ class Splits:
             dtypeBaseList[2][1].append((letter,[("number",haplotyping.index.Database.getUint(self.maximumNumber)),
                                                 ("ckmerLink",numberOfKmers)]))
         dtBase=np.dtype(dtypeBaseList)
-        dsBase=self.h5file["/split/"].create_dataset("base",(numberOfBases,), dtype=dtBase, chunks=None,
-                                                     compression="gzip", compression_opts=9)
+        optionsBase=haplotyping.index.Database.getStorageOptions(self.h5file,(numberOfBases,),dtBase)
+        dsBase=self.h5file["/split/"].create_dataset("base",(numberOfBases,), dtype=dtBase,
+                                                     **optionsBase)
         self._logger.info("store {} bases".format(numberOfBases))
         #add stored and grouped bases to the final unchunked storage
         for i in range(0,numberOfBases,Splits.stepSizeStorage):
-            stepData = tableSortedBases[i:i+Splits.stepSizeStorage]
-            dsBase[i:i+Splits.stepSizeStorage] = stepData
+            stepData = tableSortedBases.read(i,min(numberOfBases,i+Splits.stepSizeStorage))
+            dsBase[i:i+len(stepData)] = Splits._packRecords(stepData,"base",self.packedKmers)
         # HISTOGRAM K-MER STORAGE - don't make the structure unnecessary big
         maximumFrequency = max(self.frequencyHistogram["kmer"].keys())
         maximumNumber = max(self.frequencyHistogram["kmer"].values())
@@ -486,9 +797,11 @@ class Splits:
                     ("frequency",haplotyping.index.Database.getUint(maximumFrequency)),
                     ("number",haplotyping.index.Database.getUint(maximumNumber)),]
         dtFrequencyHistogramKmer=np.dtype(dtypeFrequencyHistogramKmerList)
+        optionsFrequencyHistogramKmer=haplotyping.index.Database.getStorageOptions(
+            self.h5file,(len(self.frequencyHistogram["kmer"]),),dtFrequencyHistogramKmer)
         dsFrequencyHistogramKmer=self.h5file["/histogram/"].create_dataset("kmer",(len(self.frequencyHistogram["kmer"]),), 
-                                                                  dtype=dtFrequencyHistogramKmer, chunks=None, 
-                                                                  compression="gzip", compression_opts=9)
+                                                                  dtype=dtFrequencyHistogramKmer, 
+                                                                  **optionsFrequencyHistogramKmer)
         self._logger.info("store {} entries k-mer histogram".format(len(self.frequencyHistogram["kmer"])))
         #store histogram
         dsFrequencyHistogramKmer[0:len(self.frequencyHistogram["kmer"])] = list(
@@ -500,9 +813,11 @@ class Splits:
                     ("frequency",haplotyping.index.Database.getUint(maximumFrequency)),
                     ("number",haplotyping.index.Database.getUint(maximumNumber)),]
         dtFrequencyHistogramCkmer=np.dtype(dtypeFrequencyHistogramCkmerList)
+        optionsFrequencyHistogramCkmer=haplotyping.index.Database.getStorageOptions(
+            self.h5file,(len(self.frequencyHistogram["ckmer"]),),dtFrequencyHistogramCkmer)
         dsFrequencyHistogramCkmer=self.h5file["/histogram/"].create_dataset("ckmer",(len(self.frequencyHistogram["ckmer"]),), 
-                                                                  dtype=dtFrequencyHistogramCkmer, chunks=None, 
-                                                                  compression="gzip", compression_opts=9)
+                                                                  dtype=dtFrequencyHistogramCkmer, 
+                                                                  **optionsFrequencyHistogramCkmer)
         self._logger.info("store {} entries splitting k-mer histogram".format(len(self.frequencyHistogram["ckmer"])))
         #store histogram
         dsFrequencyHistogramCkmer[0:len(self.frequencyHistogram["ckmer"])] = list(
@@ -514,9 +829,11 @@ class Splits:
                     ("frequency",haplotyping.index.Database.getUint(maximumFrequency)),
                     ("number",haplotyping.index.Database.getUint(maximumNumber)),]
         dtFrequencyHistogramBase=np.dtype(dtypeFrequencyHistogramBaseList)
+        optionsFrequencyHistogramBase=haplotyping.index.Database.getStorageOptions(
+            self.h5file,(len(self.frequencyHistogram["base"]),),dtFrequencyHistogramBase)
         dsFrequencyHistogramBase=self.h5file["/histogram/"].create_dataset("base",(len(self.frequencyHistogram["base"]),), 
-                                                                  dtype=dtFrequencyHistogramBase, chunks=None, 
-                                                                  compression="gzip", compression_opts=9)
+                                                                  dtype=dtFrequencyHistogramBase, 
+                                                                  **optionsFrequencyHistogramBase)
         self._logger.info("store {} entries splitting k-mer bases histogram".format(len(self.frequencyHistogram["base"])))
         #store histogram
         dsFrequencyHistogramBase[0:len(self.frequencyHistogram["base"])] = list(
@@ -545,14 +862,78 @@ class Splits:
             os.remove(automatonFile)
         if os.path.exists(automatonStatsFile):
             os.remove(automatonStatsFile)
+            
+    def ckmerHash(h5file):
+        """
+        Content hash of the splitting k-mers, stored in the configuration
+        """
+        if not "ckmerHash" in h5file["/config"].attrs.keys():
+            hash = hashlib.sha256()
+            hash.update("{}:{}".format(h5file["/config"].attrs["k"],
+                                       h5file["/config"].attrs.get("packedKmers",False)).encode())
+            numberOfKmers = h5file["/split/ckmer"].shape[0]
+            for i in range(0,numberOfKmers,Splits.stepSizeStorage):
+                hash.update(np.ascontiguousarray(
+                    h5file["/split/ckmer"].fields("ckmer")[i:i+Splits.stepSizeStorage]).tobytes())
+            h5file["/config"].attrs["ckmerHash"] = hash.hexdigest()
+        return h5file["/config"].attrs["ckmerHash"]
+    
+    def evictArtifacts(artifactCache, maximumSize, keep):
+        """
+        Remove least recently used automaton and index artifacts until the cache fits the maximum size
+        """
+        logger = logging.getLogger(__name__)
+        artifacts = {}
+        for filename in os.listdir(artifactCache):
+            m = re.match(r"^(.+_[0-9]+)\.(index\.splits|automaton\.splits|automaton\.splits\.stats)$", filename)
+            if m:
+                location = os.path.join(artifactCache,filename)
+                size, used = artifacts.get(m.group(1),(0,0,))
+                artifacts[m.group(1)] = (size+os.path.getsize(location),max(used,os.path.getmtime(location)),)
+        totalSize = sum([artifact[0] for artifact in artifacts.values()])
+        for key in sorted(artifacts.keys(), key=lambda key: artifacts[key][1]):
+            if maximumSize==0 or totalSize<=maximumSize:
+                break
+            elif not key==keep:
+                logger.debug("evict {} from artifact cache".format(key))
+                Splits.deleteAutomatonWithIndex(os.path.join(artifactCache,key.rsplit("_",1)[0]),key.rsplit("_",1)[1])
+                totalSize-=artifacts[key][0]
+        
+    def _automatonRange(kmerSubset, i, k, automatonKmerSize, packedKmers):
+        """
+        Prepare automaton entries for a range of splitting k-mers: 
+        first index and number for prefixes, first index for other reverse complement suffixes
+        """
+        if packedKmers:
+            kmerSubset = haplotyping.General.decode_many(kmerSubset,k)
+        kmerSubset = np.ascontiguousarray(kmerSubset).view("uint8").reshape(len(kmerSubset),-1)
+        prefixes = np.ascontiguousarray(kmerSubset[:,:automatonKmerSize]).view(
+            "S{}".format(automatonKmerSize)).ravel()
+        rsuffixes = haplotyping.General.reverse_complement_many(
+            np.ascontiguousarray(kmerSubset[:,-automatonKmerSize:]).view("S{}".format(automatonKmerSize)).ravel())
+        #prefixes are sorted
+        starts = np.concatenate(([0],np.flatnonzero(prefixes[1:]!=prefixes[:-1])+1))
+        numbers = np.diff(np.append(starts,len(prefixes)))
+        #reverse complement suffixes not equal to the prefix of the same k-mer, first occurrence
+        selection = np.flatnonzero(prefixes!=rsuffixes)
+        rkmers, rstarts = np.unique(rsuffixes[selection], return_index=True)
+        rstarts = selection[rstarts]
+        return ([kmer.decode() for kmer in prefixes[starts].tolist()],(starts+i).tolist(),numbers.tolist(),
+                [kmer.decode() for kmer in rkmers.tolist()],(rstarts+i).tolist())
         
-    def createAutomatonWithIndex(h5file, filenameBase, k):
+    def createAutomatonWithIndex(h5file, filenameBase, k, artifactCache=None, artifactCacheSize=0, numberOfProcesses=1):
         k = min(h5file["/config"].attrs["k"],k)
         logger = logging.getLogger(__name__)
         logger.info("create automaton with k' = {}".format(k))
-        indexFile = "{}_{}.index.splits".format(filenameBase,k)
-        automatonFile = "{}_{}.automaton.splits".format(filenameBase,k)
-        automatonStatsFile = "{}_{}.automaton.splits.stats".format(filenameBase,k)
+        #artifacts in the cache are identified by the content of the splitting k-mers
+        if artifactCache:
+            os.makedirs(artifactCache, exist_ok=True)
+            artifactBase = os.path.join(artifactCache,Splits.ckmerHash(h5file))
+        else:
+            artifactBase = filenameBase
+        indexFile = "{}_{}.index.splits".format(artifactBase,k)
+        automatonFile = "{}_{}.automaton.splits".format(artifactBase,k)
+        automatonStatsFile = "{}_{}.automaton.splits.stats".format(artifactBase,k)
         if os.path.exists(indexFile) and os.path.exists(automatonFile)and os.path.exists(automatonStatsFile):
             logger.debug("detected previously generated automaton and index")
             with open(automatonStatsFile, "rb") as f:
@@ -560,44 +941,60 @@ class Splits:
             logger.debug("automaton with {} words, size {} MB".format(stats["words_count"],
                                                                           round(stats["real_size"]/1048576)))
             logger.debug("associated index filesize {} MB".format(round(os.stat(indexFile).st_size/1048576)))
+            #mark as recently used
+            if artifactCache:
+                for filename in [indexFile, automatonFile, automatonStatsFile]:
+                    os.utime(filename)
+                Splits.evictArtifacts(artifactCache, artifactCacheSize, os.path.basename("{}_{}".format(artifactBase,k)))
             return (max(stats["real_size"],stats["total_size"]),indexFile, automatonFile)
         else:
             logger.debug("generate automaton and index")
-            tmpAutomatonFile = "{}.tmp".format(automatonFile)
-            tmpIndexFile = "{}.tmp".format(indexFile)
+            tmpAutomatonFile = "{}.{}.tmp".format(automatonFile,os.getpid())
+            tmpIndexFile = "{}.{}.tmp".format(indexFile,os.getpid())
+            pool = None
             try:
                 process = psutil.Process(os.getpid())
                 memoryBefore = process.memory_info().rss
                 automatonSplits = ahocorasick.Automaton()
                 numberOfKmers = h5file["/split/ckmer"].shape[0]
                 kmers = h5file["/split/ckmer"]
-                with open(tmpIndexFile, "w") as f:
+                packedKmers = h5file["/config"].attrs.get("packedKmers",False)
+                def kmerRanges(f):
                     for i in range(0,numberOfKmers,Splits.stepSizeStorage):
-                        kmerSubset = kmers[i:i+Splits.stepSizeStorage]
-                        for j in range(len(kmerSubset)):
-                            id = i + j
-                            row = kmerSubset[j]                
-                            kmer = row[0].decode()
-                            #store in index
-                            f.write(kmer)
-                            #build automaton for k'-mers with k'<=k describing:
-                            #- number of canonical k-mers to check starting from the provided index-location
-                            #- index-location of the first matching canonical k-mer
-                            rkmer = haplotyping.General.reverse_complement(kmer[-k:])
-                            kmer = kmer[:k]
-                            if (not automatonSplits.exists(kmer)):
-                                automatonSplits.add_word(kmer,(1,id))
+                        kmerSubset = kmers.fields("ckmer")[i:i+Splits.stepSizeStorage]
+                        #store in index, packed k-mers as words
+                        f.write(np.ascontiguousarray(kmerSubset).tobytes())
+                        yield (kmerSubset,i,h5file["/config"].attrs["k"],k,packedKmers,)
+                def rangeResults(f):
+                    #ranges are prepared in parallel, results are handled in the original order
+                    if numberOfProcesses>1 and numberOfKmers>Splits.stepSizeStorage:
+                        results = []
+                        for item in kmerRanges(f):
+                            results.append(pool.apply_async(haplotyping.index.splits.Splits._automatonRange,item))
+                            while len(results)>2*numberOfProcesses:
+                                yield results.pop(0).get()
+                        while len(results)>0:
+                            yield results.pop(0).get()
+                    else:
+                        for item in kmerRanges(f):
+                            yield Splits._automatonRange(*item)
+                if numberOfProcesses>1 and numberOfKmers>Splits.stepSizeStorage:
+                    pool = mp.get_context("spawn").Pool(numberOfProcesses)
+                with open(tmpIndexFile, "wb") as f:
+                    #build automaton for k'-mers with k'<=k describing:
+                    #- number of canonical k-mers to check starting from the provided index-location
+                    #- index-location of the first matching canonical k-mer
+                    for (prefixes,starts,numbers,rkmers,rstarts) in rangeResults(f):
+                        for kmer,start,number in zip(prefixes,starts,numbers):
+                            value = automatonSplits.get(kmer,None)
+                            if value==None or value[0]==0:
+                                automatonSplits.add_word(kmer,(number,start))
                             else:
-                                value=list(automatonSplits.get(kmer))
-                                if value[0]==0:
-                                    value[1]=id
-                                    value[0]=1
-                                else:
-                                    value[0]=id-value[1]+1
-                                automatonSplits.add_word(kmer,tuple(value))
-                            if not kmer==rkmer:
-                                if (not automatonSplits.exists(rkmer)):
-                                    automatonSplits.add_word(rkmer,(0,id))
+                                #continuation from previous range
+                                automatonSplits.add_word(kmer,(value[0]+number,value[1]))
+                        for rkmer,rstart in zip(rkmers,rstarts):
+                            if not automatonSplits.exists(rkmer):
+                                automatonSplits.add_word(rkmer,(0,rstart))
                 #create and store automaton
                 automatonSplits.make_automaton()
                 memoryAfter = process.memory_info().rss
@@ -610,19 +1007,25 @@ class Splits:
                 #clear
                 automatonSplits.clear()
                 del automatonSplits
-                #copy all
-                shutil.copyfile(tmpAutomatonFile, automatonFile)
-                shutil.copyfile(tmpIndexFile, indexFile)
+                #move all
+                os.replace(tmpAutomatonFile, automatonFile)
+                os.replace(tmpIndexFile, indexFile)
                 #also store stats
                 with open(automatonStatsFile, "wb") as f:
                     pickle.dump(stats, f)
             except Exception as ex:
                 logger.debug("problem while creating automaton: {}".format(ex))
             finally:
+                if not pool==None:
+                    pool.terminate()
+                    pool.join()
                 if os.path.exists(tmpIndexFile):
                     os.remove(tmpIndexFile)
                 if os.path.exists(tmpAutomatonFile):
                     os.remove(tmpAutomatonFile)
+            #limit size cache
+            if artifactCache:
+                Splits.evictArtifacts(artifactCache, artifactCacheSize, os.path.basename("{}_{}".format(artifactBase,k)))
                     
                 
         return (max(stats["real_size"],stats["total_size"]),indexFile, automatonFile)
@@ -3,7 +3,8 @@ from multiprocessing import current_process, shared_memory, resource_tracker
 from statistics import multimode
 from queue import Empty
 import ahocorasick, metis, networkit as nk
-import os, re, pickle, tables, statistics, logging, time, psutil
+import os, sys, re, gc, signal, pickle, tables, statistics, logging, time, psutil
+import multiprocessing as mp
 import numpy as np, math
 from contextlib import ExitStack
 
@@ -35,6 +36,8 @@ class Storage:
     """
     
     stepSizeStorage = 1000000
+    stepSizeSparse = 100000
+    stepSizeReads = 100000
     
     def create_mergeDirect_storage(pytablesStorage, numberOfKmers, maximumFrequency,
                              nCycle=None, nReversal=None, nDirect=None, nPaired=None):
@@ -136,30 +139,288 @@ class Storage:
                       haplotyping.index.Database.getTablesUintAtom(numberOfPartitions), 
                       shape=(numberOfReads,), filters=filters)        
     
+    def automaton_matches(sequence,automatonSplits,k,automatonKmerSize):
+        """
+        Candidate splitting k-mer positions in sequence, with index ranges from the automaton
+        """
+        rsequence = haplotyping.General.reverse_complement(sequence)
+        boundary = len(sequence)-k+automatonKmerSize
+        correction_reverse = boundary - 1
+        correction_forward = automatonKmerSize - 1
+        #use automaton to check reverse complement sequence
+        rdict = {(correction_reverse - end_index): (number, startLinks,)
+                 for (end_index, (number,startLinks)) in automatonSplits.iter(rsequence,0,boundary)}
+        if len(rdict)>0:
+            flist = [(end_index - correction_forward, number, startLinks,)
+                     for (end_index, (number,startLinks)) in automatonSplits.iter(sequence,0,boundary)]
+            #combine results
+            clist = [(pos, (number, startLinks,) ,rdict[pos]) 
+                     for (pos, number, startLinks) in flist 
+                     if pos in rdict.keys()]
+        else:
+            clist = []
+        return clist
+
+    def automaton_entries(entries,clists):
+        """
+        Combine reads or pairs of reads with the results from the automaton
+        """
+        return [tuple(zip(entry,clist)) if isinstance(entry,tuple) else ((entry,clist[0],),)
+                for (entry,clist) in zip(entries,clists)]
+
+    def verify_matches(reads,index,k,packedKmers=False):
+        """
+        Confirm the candidates from the automaton for a list of (sequence, clist) at once in the k-mer index,
+        returns the found (pos, link, orientation) for each read and the number of compared links
+        """
+        counts = [len(clist) for (sequence,clist) in reads]
+        found = [[] for read in reads]
+        if sum(counts)==0:
+            return (found,0,)
+        complements = np.frombuffer(haplotyping.General.complements, dtype="uint8")
+        #windows for all candidates in the concatenated reads
+        offsets = np.cumsum([0]+[len(sequence)+1 for (sequence,clist) in reads[:-1]])
+        data = np.frombuffer("\n".join([sequence for (sequence,clist) in reads]).encode(), dtype="uint8")
+        candidates = np.array([(pos,forward_number,forward_startLinks,reverse_number,reverse_startLinks,)
+                               for (sequence,clist) in reads 
+                               for (pos,(forward_number,forward_startLinks),
+                                    (reverse_number,reverse_startLinks)) in clist], dtype="int64")
+        readIds = np.repeat(np.arange(len(reads)),counts)
+        positions = candidates[:,0]
+        windows = np.lib.stride_tricks.sliding_window_view(data,k)[offsets[readIds]+positions]
+        rwindows = complements[windows[:,::-1]]
+        kmers = np.ascontiguousarray(windows).view("S{}".format(k)).ravel()
+        rkmers = np.ascontiguousarray(rwindows).view("S{}".format(k)).ravel()
+        (forward_number,forward_startLinks,reverse_number,reverse_startLinks,) = candidates[:,1:5].T
+        #orientation and range of links to check, like for a single candidate
+        forward = np.where(forward_number==0, False, np.where(reverse_number==0, True, kmers<rkmers))
+        valid = ~(((forward_number==0) & (reverse_number==0)) | 
+                  ((forward_number==0) & (rkmers>kmers)) | 
+                  ((forward_number>0) & (reverse_number==0) & (rkmers<kmers)))
+        startLinks = np.where((forward_number==0) | (reverse_number==0), 
+                              np.maximum(forward_startLinks,reverse_startLinks),
+                              np.where(forward,forward_startLinks,reverse_startLinks))
+        endLinks = np.where(forward,forward_startLinks+forward_number,reverse_startLinks+reverse_number)
+        numbers = np.where(valid,np.maximum(0,endLinks-startLinks),0)
+        keyWindows = np.where(forward[:,None],windows,rwindows)
+        if packedKmers:
+            validCodes = (haplotyping.General.codes[keyWindows]!=255).all(axis=1)
+            numbers[~validCodes] = 0
+            keys = np.zeros((len(keyWindows),index.shape[1]), dtype="uint64")
+            if validCodes.any():
+                keys[validCodes] = haplotyping.General.encode_many(
+                    keyWindows[validCodes]).reshape(-1,index.shape[1])
+        else:
+            keys = np.ascontiguousarray(keyWindows).view("S{}".format(k)).ravel()
+        #gather and compare all candidate links
+        candidateIds = np.repeat(np.arange(len(candidates)),numbers)
+        links = (np.arange(len(candidateIds)) - np.repeat(np.cumsum(numbers)-numbers,numbers) 
+                 + startLinks[candidateIds])
+        if packedKmers:
+            equal = (index[links]==keys[candidateIds]).all(axis=1)
+        else:
+            equal = index[links]==keys[candidateIds]
+        (matchedIds,first) = np.unique(candidateIds[equal], return_index=True)
+        matchedLinks = links[equal][first]
+        readIds = readIds.tolist()
+        positions = positions.tolist()
+        forward = forward.tolist()
+        for (i,link) in zip(matchedIds.tolist(),matchedLinks.tolist()):
+            found[readIds[i]].append((positions[i],link,("c" if forward[i] else "r"),))
+        return (found,len(candidateIds),)
+
+    def count_queue(queue_sizes,position,number):
+        """
+        Register the number of reads added to or taken from a queue, and the total number taken
+        """
+        if not queue_sizes==None:
+            with queue_sizes.get_lock():
+                queue_sizes[position]+=number
+                if number<0:
+                    queue_sizes[position+3]-=number
+
+    def search_table(buffer,numberOfKmers,k):
+        """
+        Sorted table of 2-bit packed canonical splitting k-mers, big-endian words as bytes if k>32
+        """
+        numberOfWords = math.ceil(k/32)
+        if numberOfWords==1:
+            return np.ndarray((numberOfKmers,), dtype="uint64", buffer=buffer)
+        else:
+            return np.ndarray((numberOfKmers,), dtype="S{}".format(8*numberOfWords), buffer=buffer)
+
+    def search_table_keys(words):
+        """
+        Keys for the sorted table from 2-bit packed k-mers
+        """
+        if words.ndim==1:
+            return words
+        else:
+            return np.ascontiguousarray(words.astype(">u8")).view("S{}".format(8*words.shape[1])).ravel()
+
+    def search_matches(sequence,table,k):
+        """
+        Exact splitting k-mer positions in sequence with orientation, using a binary search in the sorted table
+        """
+        length = len(sequence)
+        if length<k or len(table)==0:
+            return ([],0)
+        data = np.frombuffer(sequence.encode(),dtype="uint8")
+        rdata = np.frombuffer(haplotyping.General.reverse_complement(sequence).encode(),dtype="uint8")
+        #only windows without other characters than the letters
+        invalid = np.concatenate(([0],np.cumsum(haplotyping.General.codes[data]==255)))
+        positions = np.flatnonzero(invalid[k:]==invalid[:-k])
+        if len(positions)==0:
+            return ([],0)
+        windows = np.lib.stride_tricks.sliding_window_view(data,k)
+        rwindows = np.lib.stride_tricks.sliding_window_view(rdata,k)
+        keys = Storage.search_table_keys(haplotyping.General.encode_many(windows[positions]))
+        rkeys = Storage.search_table_keys(haplotyping.General.encode_many(rwindows[length-k-positions]))
+        #canonical keys, palindromes are reversed like with the automaton
+        forward = keys<rkeys
+        ckeys = np.where(forward,keys,rkeys)
+        links = np.minimum(np.searchsorted(table,ckeys),len(table)-1)
+        selection = np.flatnonzero(table[links]==ckeys)
+        orientations = np.where(forward[selection],"c","r")
+        return (list(zip(positions[selection].tolist(),links[selection].tolist(),orientations.tolist())),
+                len(positions))
+
+    def ring_claim(ring,size):
+        """
+        Claim a free slot in the shared memory ring (shm, slotSize, queue_slots), None if the data doesn't fit
+        """
+        if ring==None or size>ring[1]:
+            return None
+        else:
+            return ring[2].get(block=True)
+
+    def ring_release(ring,slot):
+        """
+        Return the slot to the free slots of the ring
+        """
+        ring[2].put(slot)
+
+    def ring_put_reads(ring,batch):
+        """
+        Write a batch of reads or pairs of reads into a free slot of the ring, None if it doesn't fit
+        """
+        sequences = []
+        lengths = []
+        for entry in batch:
+            if isinstance(entry,tuple):
+                lengths.extend([len(entry[0]),len(entry[1])])
+                sequences.extend(entry)
+            else:
+                lengths.extend([len(entry),-1])
+                sequences.append(entry)
+        data = "".join(sequences).encode()
+        lengths = np.array(lengths,dtype="int64")
+        size = 16+lengths.nbytes+len(data)
+        slot = Storage.ring_claim(ring,size)
+        if not slot==None:
+            offset = slot*ring[1]
+            np.ndarray((2,),dtype="int64",buffer=ring[0].buf,offset=offset)[:] = (len(batch),len(data),)
+            np.ndarray(lengths.shape,dtype="int64",buffer=ring[0].buf,offset=offset+16)[:] = lengths
+            ring[0].buf[offset+16+lengths.nbytes:offset+size] = data
+        return slot
+
+    def ring_get_reads(ring,slot):
+        """
+        Read the batch of reads or pairs of reads from the slot, the slot is not released
+        """
+        offset = slot*ring[1]
+        (numberOfEntries,numberOfBytes) = np.ndarray((2,),dtype="int64",buffer=ring[0].buf,offset=offset).tolist()
+        lengths = np.ndarray((2*numberOfEntries,),dtype="int64",buffer=ring[0].buf,offset=offset+16).tolist()
+        offset+=16+16*numberOfEntries
+        data = bytes(ring[0].buf[offset:offset+numberOfBytes]).decode()
+        batch = []
+        position = 0
+        for i in range(0,2*numberOfEntries,2):
+            if lengths[i+1]<0:
+                batch.append(data[position:position+lengths[i]])
+                position+=lengths[i]
+            else:
+                batch.append((data[position:position+lengths[i]],
+                              data[position+lengths[i]:position+lengths[i]+lengths[i+1]],))
+                position+=lengths[i]+lengths[i+1]
+        return batch
+
+    def ring_put_matches(ring,batch):
+        """
+        Write a batch of matches as fixed-width integers (pos, link, orientation) into a free slot of the ring,
+        None if it doesn't fit
+        """
+        entries = []
+        reads = []
+        segments = []
+        matches = []
+        for entry in batch:
+            entries.append(len(entry))
+            for (matchesList,direct) in entry:
+                reads.extend([len(matchesList),int(direct)])
+                for segment in matchesList:
+                    segments.append(len(segment))
+                    for (pos,link,orientation) in segment:
+                        matches.extend([pos,link,(1 if orientation=="c" else 0)])
+        data = np.array(entries+reads+segments+matches,dtype="int64")
+        size = 32+data.nbytes
+        slot = Storage.ring_claim(ring,size)
+        if not slot==None:
+            offset = slot*ring[1]
+            np.ndarray((4,),dtype="int64",buffer=ring[0].buf,offset=offset)[:] = (
+                len(entries),len(reads),len(segments),len(matches),)
+            np.ndarray(data.shape,dtype="int64",buffer=ring[0].buf,offset=offset+32)[:] = data
+        return slot
+
+    def ring_get_matches(ring,slot):
+        """
+        Read the batch of matches from the slot, the slot is not released
+        """
+        offset = slot*ring[1]
+        header = np.ndarray((4,),dtype="int64",buffer=ring[0].buf,offset=offset).tolist()
+        data = np.ndarray((sum(header),),dtype="int64",buffer=ring[0].buf,offset=offset+32).tolist()
+        entries = data[0:header[0]]
+        reads = data[header[0]:header[0]+header[1]]
+        segments = data[header[0]+header[1]:header[0]+header[1]+header[2]]
+        matches = data[header[0]+header[1]+header[2]:]
+        batch = []
+        (readPosition,segmentPosition,matchPosition) = (0,0,0,)
+        for numberOfReads in entries:
+            entry = []
+            for i in range(numberOfReads):
+                matchesList = []
+                for j in range(reads[readPosition]):
+                    matchesList.append([(matches[m],matches[m+1],("c" if matches[m+2]==1 else "r"),)
+                                        for m in range(matchPosition,matchPosition+3*segments[segmentPosition],3)])
+                    matchPosition+=3*segments[segmentPosition]
+                    segmentPosition+=1
+                entry.append((matchesList,reads[readPosition+1]==1,))
+                readPosition+=2
+            batch.append(tuple(entry))
+        return batch
+
+    def ring_attach(ring):
+        """
+        Attach to the shared memory ring (name, slotSize, queue_slots) from a worker
+        """
+        if ring==None:
+            return None
+        else:
+            return (shared_memory.SharedMemory(ring[0]),ring[1],ring[2],)
+
     def workerAutomaton(shutdown_event,queue_start,queue_automaton,queue_index,
-                         queue_finished,k,automatonKmerSize,automatonFile):
+                         queue_finished,k,automatonKmerSize,automatonFile,numberOfWorkers=1,queue_sizes=None,
+                         ring_reads=None):
         
         logger = logging.getLogger("{}.worker.automaton".format(__name__))
-                
-        def compute_matches(sequence,automatonSplits):
-            rsequence = haplotyping.General.reverse_complement(sequence)
-            boundary = len(sequence)-k+automatonKmerSize
-            correction_reverse = boundary - 1
-            correction_forward = automatonKmerSize - 1
-            #use automaton to check reverse complement sequence
-            rdict = {(correction_reverse - end_index): (number, startLinks,)
-                     for (end_index, (number,startLinks)) in automatonSplits.iter(rsequence,0,boundary)}
-            if len(rdict)>0:
-                flist = [(end_index - correction_forward, number, startLinks,)
-                         for (end_index, (number,startLinks)) in automatonSplits.iter(sequence,0,boundary)]
-                #combine results
-                clist = [(pos, (number, startLinks,) ,rdict[pos]) 
-                         for (pos, number, startLinks) in flist 
-                         if pos in rdict.keys()]
-            else:
-                clist = []
-            return clist
         
+        processes = []
+        def terminate(signum, frame):
+            for process in processes:
+                process.terminate()
+            sys.exit()
+        
+        automatonSplits = None
         try:
             
             #wait for permission to start loading automaton
@@ -185,7 +446,42 @@ class Storage:
             logger.debug("automaton ({}): used memory {} MB".format(
                 os.getpid(),math.ceil(process.memory_info().rss/1048576)))
             
-            #finished loading automaton
+            #fork workers sharing the loaded automaton copy-on-write
+            signal.signal(signal.SIGTERM, terminate)
+            gc.freeze()
+            context = mp.get_context("fork")
+            for i in range(numberOfWorkers):
+                processes.append(context.Process(target=Storage.workerAutomatonShared, daemon=True,
+                                         args=(shutdown_event,queue_automaton,queue_index,queue_finished,
+                                               k,automatonKmerSize,automatonSplits,queue_sizes,ring_reads,)))
+                processes[-1].start()
+            logger.debug("automaton ({}): started {} workers".format(os.getpid(),numberOfWorkers))
+            for process in processes:
+                process.join()
+        except Exception as ex:
+            logger.error("automaton ({}): problem with worker: {}".format(os.getpid(),ex))
+        finally:
+            del automatonSplits
+            logger.debug("automaton ({}): fsm released".format(os.getpid()))
+            
+    def workerAutomatonShared(shutdown_event,queue_automaton,queue_index,queue_finished,
+                              k,automatonKmerSize,automatonSplits,queue_sizes=None,ring_reads=None):
+        
+        logger = logging.getLogger("{}.worker.automaton".format(__name__))
+                
+        def compute_matches(sequence,automatonSplits):
+            return Storage.automaton_matches(sequence,automatonSplits,k,automatonKmerSize)
+        
+        #termination is handled by the loading process
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        
+        #prevent garbage collecting for shared memory
+        remove_shm_from_resource_tracker()
+        ring_reads = Storage.ring_attach(ring_reads)
+        
+        try:
+            
+            #automaton is inherited from the loading process
             queue_finished.put("automaton:started")
 
             while not shutdown_event.is_set():
@@ -195,15 +491,23 @@ class Storage:
                         logger.debug("autmaton ({}): none item".format(os.getpid()))
                         queue_automaton.task_done()
                         break
-                    elif isinstance(item,tuple) and len(item)==2:
-                        queue_index.put((
-                            (item[0],compute_matches(item[0],automatonSplits),),
-                            (item[1],compute_matches(item[1],automatonSplits),),
-                        ))
-                    elif isinstance(item,str):
-                        queue_index.put((
-                            (item,compute_matches(item,automatonSplits),),
-                        ))
+                    elif isinstance(item,list) or isinstance(item,int):
+                        #batch of reads, or slot with batch of reads in shared memory
+                        entries = Storage.ring_get_reads(ring_reads,item) if isinstance(item,int) else item
+                        Storage.count_queue(queue_sizes,0,-len(entries))
+                        clists = []
+                        for entry in entries:
+                            if isinstance(entry,tuple):
+                                clists.append((compute_matches(entry[0],automatonSplits),
+                                               compute_matches(entry[1],automatonSplits),))
+                            else:
+                                clists.append((compute_matches(entry,automatonSplits),))
+                        if isinstance(item,int):
+                            #reads stay in shared memory, only the automaton results are queued
+                            queue_index.put((item,clists,))
+                        else:
+                            queue_index.put(Storage.automaton_entries(entries,clists))
+                        Storage.count_queue(queue_sizes,1,len(entries))
                     queue_automaton.task_done()
                 except Empty:
                     logger.debug("automaton ({}): empty".format(os.getpid()))
@@ -211,24 +515,28 @@ class Storage:
                     continue
         except Exception as ex:
             logger.error("automaton ({}): problem with worker: {}".format(os.getpid(),ex))
-        finally:
-            del automatonSplits
-            logger.debug("automaton ({}): fsm released".format(os.getpid()))
+        if not ring_reads==None:
+            ring_reads[0].close()
         queue_finished.put("automaton:ended")
             
                 
     
     def workerIndex(shutdown_event,queue_index,queue_matches,queue_storage,queue_finished,
-                     filenameBase,numberOfKmers,k,indexType,shm_name):
+                     filenameBase,numberOfKmers,k,indexType,shm_name,packedKmers=False,
+                     matchEngine="automaton",queue_sizes=None,ring_reads=None,ring_matches=None):
 
         #prevent garbage collecting for shared memory
         remove_shm_from_resource_tracker()
+        #interrupts are handled by the main process, also if started from a thread
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
         
         #logger = logging.getLogger("{}.worker.index".format(__name__))
         logger = logging.getLogger("haplotyping.index.worker.index")
         logger.debug("start workerIndex")
 
         shm = shared_memory.SharedMemory(shm_name)
+        ring_reads = Storage.ring_attach(ring_reads)
+        ring_matches = Storage.ring_attach(ring_matches)
         logger.debug("index ({}): shared memory of {} MB used".format(
             os.getpid(),math.ceil(shm.size/1048576)))
         
@@ -237,6 +545,14 @@ class Storage:
             os.getpid(),math.ceil(process.memory_info().rss/1048576)))
 
         
+        #k-mers from the index are compared as fixed-width strings or as 2-bit packed integers
+        if matchEngine==haplotyping.index.database.Database.SEARCHSORTED:
+            index = Storage.search_table(shm.buf,numberOfKmers,k)
+        elif packedKmers:
+            index = np.ndarray((numberOfKmers,math.ceil(k/32)), dtype="uint64", buffer=shm.buf)
+        else:
+            index = np.ndarray((numberOfKmers,), dtype="S{}".format(k), buffer=shm.buf)
+        
         problemPattern = re.compile(r"["+"".join(haplotyping.index.Database.letters)+
                                          "][^"+"".join(haplotyping.index.Database.letters)+"]+")   
         
@@ -246,7 +562,22 @@ class Storage:
                 problemStartPositions.append(m.span()[0]+1)
             return problemStartPositions
 
-        def compute_matches(sequence,clist):            
+        def verified_entries(entries):
+            """
+            Entries with the found matches and number of checks for each sequence
+            """
+            entries = [((entry,None,),) if isinstance(entry,str) 
+                       else (tuple([(sequence,None,) for sequence in entry]) if isinstance(entry[0],str) else entry) 
+                       for entry in entries]
+            reads = [read for entry in entries for read in entry]
+            verified = iter(Storage.verify_matches([read for read in reads if not read[1]==None],
+                                                   index,k,packedKmers)[0])
+            #without automaton results, search the sorted table directly
+            results = iter([Storage.search_matches(sequence,index,k) if clist==None 
+                            else (next(verified),len(clist),) for (sequence,clist) in reads])
+            return [tuple([(sequence,)+next(results) for (sequence,clist) in entry]) for entry in entries]
+
+        def compute_matches(sequence,found,totalChecks):            
             history = {}
             matchesList = []
             problems = problemStartPositions(sequence)
@@ -254,88 +585,8 @@ class Storage:
             matches = []
             previousLink = -1
             previousPos = -1
-            positions = []
-            totalChecks=len(clist)
             totalMatches = 0
-            for pos, (forward_number,forward_startLinks), (reverse_number,reverse_startLinks) in clist:
-                positions.append(pos)
-                #check if really match
-                kmer = sequence[pos:pos+k]  
-                #only possible if is reversed
-                if forward_number==0:  
-                    if reverse_number==0:
-                        continue
-                    else:
-                        rkmer = haplotyping.General.reverse_complement(kmer)
-                        if rkmer>kmer:
-                            continue
-                        else:
-                            startLinks = max(forward_startLinks,reverse_startLinks)
-                            endLinks = reverse_startLinks+reverse_number
-                            foundMatch = False
-                            for i in range(startLinks,endLinks):
-                                indexLink = i*k
-                                nkmer = shm.buf[indexLink:indexLink+k].tobytes().decode()
-                                if rkmer==nkmer:
-                                    link = i
-                                    orientation = "r"
-                                    foundMatch = True
-                                    break
-                            if not foundMatch:
-                                continue
-                else:
-                    rkmer = haplotyping.General.reverse_complement(kmer)
-                    #only possible if forward
-                    if reverse_number==0:
-                        if rkmer<kmer:
-                            continue
-                        else:
-                            startLinks = max(forward_startLinks,reverse_startLinks)
-                            endLinks = forward_startLinks+forward_number
-                            foundMatch = False
-                            for i in range(startLinks,endLinks):
-                                indexLink = i*k
-                                nkmer = shm.buf[indexLink:indexLink+k].tobytes().decode()
-                                if kmer==nkmer:
-                                    link = i
-                                    orientation = "c"
-                                    foundMatch = True
-                                    break
-                            if not foundMatch:
-                                continue
-                    else:
-                        foundMatch = False
-                        #if forward
-                        if kmer<rkmer:
-                            startLinks = forward_startLinks
-                            endLinks = forward_startLinks+forward_number
-                            for i in range(startLinks,endLinks):
-                                indexLink = i*k
-                                nkmer = shm.buf[indexLink:indexLink+k].tobytes().decode()
-                                if kmer==nkmer:
-                                    link = i
-                                    orientation = "c"
-                                    foundMatch = True
-                                    break
-                            if not foundMatch:
-                                #no match
-                                continue
-                        #if reverse
-                        else:
-                            startLinks = reverse_startLinks
-                            endLinks = reverse_startLinks+reverse_number
-                            foundMatch = False
-                            for i in range(startLinks,endLinks):
-                                indexLink = i*k
-                                nkmer = shm.buf[indexLink:indexLink+k].tobytes().decode()
-                                if rkmer==nkmer:
-                                    link = i
-                                    orientation = "r"
-                                    foundMatch = True
-                                    break
-                            if not foundMatch:
-                                continue
-
+            for pos, link, orientation in found:
                 history[link]=[orientation,pos]
                 #check if a problem did occur between last match and current
                 if relevantProblem and len(matches)>0 and pos>relevantProblem:
@@ -418,6 +669,51 @@ class Storage:
                                         "paired": tables.UInt8Col(pos=1)
                                       }, "Read size and paired")
                     
+                def process_entry(item,batch):
+                    nonlocal totalChecks,totalMatches
+                    if isinstance(item,tuple):
+                        if len(item)==1:
+                            (matches,direct,tmpTotalChecks,tmpTotalMatches,) = compute_matches(*item[0])
+                            totalChecks+=tmpTotalChecks
+                            totalMatches+=tmpTotalMatches
+                            if tmpTotalMatches<=1:
+                                pass
+                            else:
+                                batch.append(((matches, direct,),))
+                                if (not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS)
+                                    and tmpTotalMatches>2):
+                                    store_matches(matches,readData,readInfo)
+                        elif len(item)==2:
+                            (matches0,direct0,tmpTotalChecks0,tmpTotalMatches0,) = compute_matches(*item[0])
+                            (matches1,direct1,tmpTotalChecks1,tmpTotalMatches1,) = compute_matches(*item[1])
+                            totalChecks+=tmpTotalChecks0+tmpTotalChecks1
+                            totalMatches+=tmpTotalMatches0+tmpTotalMatches1
+                            if tmpTotalMatches0==0 and tmpTotalMatches1==0:
+                                pass
+                            elif tmpTotalMatches0==0:
+                                if tmpTotalMatches1>1:
+                                    batch.append(((matches1, direct1,),))
+                                    if (not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS) 
+                                        and tmpTotalMatches1>2):
+                                        store_matches(matches1,readData,readInfo)
+                            elif tmpTotalMatches1==0:
+                                if tmpTotalMatches0>1:
+                                    batch.append(((matches0, direct0,),))
+                                    if (not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS)
+                                        and tmpTotalMatches0>2):
+                                        store_matches(matches0,readData,readInfo)
+                            else:
+                                batch.append(((matches0, direct0, ),
+                                              (matches1, direct1, )))
+                                if (not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS)):
+                                    if (tmpTotalMatches0>1) and (tmpTotalMatches1>1):
+                                        store_paired_matches(matches0,matches1,readData,readInfo)
+                                    else:
+                                        if tmpTotalMatches0>1:
+                                            store_matches(matches0,readData,readInfo)
+                                        if tmpTotalMatches1>1:
+                                            store_matches(matches1,readData,readInfo)
+
                 while not shutdown_event.is_set():
                     try:
                         item = queue_index.get(block=True, timeout=1)
@@ -425,49 +721,25 @@ class Storage:
                             logger.debug("index ({}): none item".format(os.getpid()))
                             queue_index.task_done()
                             break
-                        elif isinstance(item,tuple):
-                            if len(item)==1:
-                                (matches,direct,tmpTotalChecks,tmpTotalMatches,) = compute_matches(item[0][0],item[0][1])
-                                totalChecks+=tmpTotalChecks
-                                totalMatches+=tmpTotalMatches
-                                if tmpTotalMatches<=1:
-                                    pass
-                                else:
-                                    queue_matches.put(((matches, direct,),))
-                                    if (not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS)
-                                        and tmpTotalMatches>2):
-                                        store_matches(matches,readData,readInfo)
-                            elif len(item)==2:
-                                (matches0,direct0,tmpTotalChecks0,tmpTotalMatches0,) = compute_matches(item[0][0],item[0][1])
-                                (matches1,direct1,tmpTotalChecks1,tmpTotalMatches1,) = compute_matches(item[1][0],item[1][1])
-                                totalChecks+=tmpTotalChecks0+tmpTotalChecks1
-                                totalMatches+=tmpTotalMatches0+tmpTotalMatches1
-                                if tmpTotalMatches0==0 and tmpTotalMatches1==0:
-                                    pass
-                                elif tmpTotalMatches0==0:
-                                    if tmpTotalMatches1>1:
-                                        queue_matches.put(((matches1, direct1,),))
-                                        if (not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS) 
-                                            and tmpTotalMatches1>2):
-                                            store_matches(matches1,readData,readInfo)
-                                elif tmpTotalMatches1==0:
-                                    if tmpTotalMatches0>1:
-                                        queue_matches.put(((matches0, direct0,),))
-                                        if (not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS)
-                                            and tmpTotalMatches0>2):
-                                            store_matches(matches0,readData,readInfo)
-                                else:
-                                    queue_matches.put(((matches0, direct0, ),
-                                                       (matches1, direct1, )))                                    
-                                    if (not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS)):
-                                        if (tmpTotalMatches0>1) and (tmpTotalMatches1>1):
-                                            store_paired_matches(matches0,matches1,readData,readInfo)
-                                        else:
-                                            if tmpTotalMatches0>1:
-                                                store_matches(matches0,readData,readInfo)
-                                            if tmpTotalMatches1>1:
-                                                store_matches(matches1,readData,readInfo)
-
+                        elif isinstance(item,list) or isinstance(item,int) or isinstance(item,tuple):
+                            #batch of reads, or slot with batch of reads in shared memory
+                            if isinstance(item,int):
+                                entries = Storage.ring_get_reads(ring_reads,item)
+                                Storage.ring_release(ring_reads,item)
+                            elif isinstance(item,tuple):
+                                entries = Storage.automaton_entries(
+                                    Storage.ring_get_reads(ring_reads,item[0]),item[1])
+                                Storage.ring_release(ring_reads,item[0])
+                            else:
+                                entries = item
+                            Storage.count_queue(queue_sizes,1,-len(entries))
+                            batch = []
+                            for entry in verified_entries(entries):
+                                process_entry(entry,batch)
+                            if len(batch)>0:
+                                slot = Storage.ring_put_matches(ring_matches,batch)
+                                queue_matches.put(batch if slot==None else slot)
+                                Storage.count_queue(queue_sizes,2,len(batch))
                         queue_index.task_done()
                     except Empty:
                         logger.debug("index ({}): empty".format(os.getpid()))
@@ -481,7 +753,11 @@ class Storage:
            logger.error("index  ({}): problem with worker: {}".format(os.getpid(),ex))
         
         #close shared memory
+        index = None
         shm.close()
+        for ring in [ring_reads,ring_matches]:
+            if not ring==None:
+                ring[0].close()
 
         #finish
         logger.debug("index ({}): found {} matches in {} checks".format(os.getpid(),totalMatches,totalChecks))
@@ -506,12 +782,35 @@ class Storage:
                                      for i in range(numberDirectArray)]),]
         return dtype
     
+    def worker_sparse_dtype(numberOfKmers,estimatedMaximumReadLength):
+        dtype = [("link",haplotyping.index.Database.getUint(numberOfKmers)),
+                 ("type","uint8"),
+                 ("toLink",haplotyping.index.Database.getUint(numberOfKmers)),
+                 ("distance",haplotyping.index.Database.getUint(2*estimatedMaximumReadLength))]
+        return dtype
+
+    def sparse_pending_size(sparseMaximum):
+        return max(1,sparseMaximum//8) if sparseMaximum>0 else Storage.stepSizeSparse
+    
+    def worker_sparse_memory(sparseMaximum,numberOfKmers,estimatedMaximumReadLength):
+        """
+        Estimated memory for sparse direct connections: the aggregated connections with their numbers, 
+        the pending connections and the copies while merging the pending connections
+        """
+        itemsize = np.dtype(Storage.worker_sparse_dtype(numberOfKmers,estimatedMaximumReadLength)).itemsize
+        pendingSize = Storage.sparse_pending_size(sparseMaximum)
+        return ((sparseMaximum*(itemsize+4)) + (pendingSize*itemsize) + 
+                ((sparseMaximum+pendingSize)*((2*(itemsize+4))+8)))
+    
     def workerMatches(shutdown_event,queue_matches,queue_storage,queue_finished,
                        filenameBase,numberOfKmers,maximumFrequency,estimatedMaximumReadLength,
-                       numberDirectArray,indexType,shm_name):
+                       numberDirectArray,indexType,shm_name,queue_sizes=None,ring_matches=None,
+                       directAccumulator="dense",sparseMaximum=0):
         
         #prevent garbage collecting for shared memory
         remove_shm_from_resource_tracker()
+        #interrupts are handled by the main process, also if started from a thread
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
         
         logger = logging.getLogger("{}.worker.matches".format(__name__))
 
@@ -520,6 +819,7 @@ class Storage:
             os.getpid(),math.ceil(process.memory_info().rss/1048576)))
         
         shm = shared_memory.SharedMemory(shm_name)
+        ring_matches = Storage.ring_attach(ring_matches)
         logger.debug("matches ({}): shared memory of {} MB used".format(os.getpid(),math.ceil(shm.size/1048576)))
         
         try:
@@ -542,11 +842,26 @@ class Storage:
                 #define correct maxValues based on previous results             
                 dtype = haplotyping.index.storage.Storage.worker_matches_dtype(
                     numberOfKmers,maximumFrequency,estimatedMaximumReadLength,numberDirectArray)
-                connections = np.ndarray((numberOfKmers,), dtype=dtype, order="C")
-                connections.fill(((0,0,),(0,0,),tuple((0,0,0,0,) for i in range(numberDirectArray))))
+                if directAccumulator=="sparse":
+                    #only occurring connections, aggregated in sorted arrays with their numbers
+                    connections = None
+                    sparseDtype = haplotyping.index.storage.Storage.worker_sparse_dtype(
+                        numberOfKmers,estimatedMaximumReadLength)
+                    sparseDirect = np.zeros(0, dtype=sparseDtype)
+                    sparseNumbers = np.zeros(0, dtype="uint32")
+                    #pending connections in a preallocated buffer, merged into the aggregate when full
+                    sparsePending = np.zeros(Storage.sparse_pending_size(sparseMaximum), dtype=sparseDtype)
+                    sparsePendingNumber = 0
+                    sparseRuns = 0
+                    sparseCycles = {}
+                    sparseReversals = {}
+                    logger.debug("matches ({}): use sparse storage for direct connections".format(os.getpid()))
+                else:
+                    connections = np.ndarray((numberOfKmers,), dtype=dtype, order="C")
+                    connections.fill(((0,0,),(0,0,),tuple((0,0,0,0,) for i in range(numberDirectArray))))
                 
-                logger.debug("matches ({}): created memory storage for direct connections: {} MB".format(
-                    os.getpid(), math.ceil(connections.nbytes/1048576)))
+                    logger.debug("matches ({}): created memory storage for direct connections: {} MB".format(
+                        os.getpid(), math.ceil(connections.nbytes/1048576)))
                 
                 #store paired connections for partition graph
                 tablePaired = pytablesStorageWorker.create_table(pytablesStorageWorker.root, 
@@ -662,6 +977,96 @@ class Storage:
                             dumpDirectRow["number"] = 1
                             dumpDirectRow["distance"] = distance
                         dumpDirectRow.append()
+                        
+                def store_sparse_cycle(fromLink, distance):
+                    (previousNumber,previousDistance,) = sparseCycles.get(fromLink,(0,0,))
+                    if (previousDistance==0) or (distance<previousDistance):
+                        sparseCycles[fromLink] = (previousNumber+1,distance,)
+                    else:
+                        sparseCycles[fromLink] = (previousNumber+1,previousDistance,)
+
+                def store_sparse_reversal(fromLink, distance):
+                    (previousNumber,previousDistance,) = sparseReversals.get(fromLink,(0,0,))
+                    if (previousDistance==0) or (distance<previousDistance):
+                        sparseReversals[fromLink] = (previousNumber+1,distance,)
+                    else:
+                        sparseReversals[fromLink] = (previousNumber+1,previousDistance,)
+                        
+                def store_sparse_direct(fromLink, fromDirection, toLink, toDirection, distance):
+                    nonlocal sparsePendingNumber
+                    sparsePending[sparsePendingNumber] = (fromLink,1 + fromDirection + (2*toDirection),toLink,distance,)
+                    sparsePendingNumber+=1
+                    if sparsePendingNumber==len(sparsePending):
+                        aggregate_sparse_direct()
+                        #within memory, write aggregated connections as a sorted run
+                        if sparseMaximum>0 and len(sparseDirect)>=sparseMaximum:
+                            write_sparse_run()
+                        
+                def aggregate_sparse_direct():
+                    nonlocal sparseDirect,sparseNumbers,sparsePending,sparsePendingNumber
+                    if sparsePendingNumber>0:
+                        #one stable sort of the sorted aggregate followed by the pending connections, 
+                        #and sum the numbers of equal connections
+                        entries = np.concatenate((sparseDirect,sparsePending[:sparsePendingNumber]))
+                        numbers = np.concatenate((sparseNumbers,np.ones(sparsePendingNumber, dtype="uint32")))
+                        (sparseDirect,sparseNumbers,) = (None,None,)
+                        order = np.argsort(entries, kind="stable")
+                        entries = entries[order]
+                        numbers = numbers[order]
+                        del order
+                        starts = np.flatnonzero(np.concatenate(([True],entries[1:]!=entries[:-1])))
+                        sparseDirect = entries[starts]
+                        sparseNumbers = np.add.reduceat(numbers,starts).astype("uint32")
+                        del entries, numbers, starts
+                        sparsePendingNumber = 0
+                        #without maximum, grow the buffer with the aggregate
+                        if sparseMaximum==0 and len(sparseDirect)//8>len(sparsePending):
+                            sparsePending = np.zeros(len(sparseDirect)//8, dtype=sparseDtype)
+                        
+                def write_sparse_run():
+                    nonlocal sparseDirect,sparseNumbers,sparseRuns
+                    logger.debug("matches ({}): write run with {} direct connections: {} MB".format(
+                        os.getpid(), len(sparseDirect), math.ceil((sparseDirect.nbytes+sparseNumbers.nbytes)/1048576)))
+                    #only occurring connections, sorted on link
+                    runData = np.zeros(len(sparseDirect), dtype=sparseDtype+[
+                        ("number",haplotyping.index.Database.getUint(maximumFrequency))])
+                    for field in sparseDirect.dtype.names:
+                        runData[field] = sparseDirect[field]
+                    runData["number"] = np.minimum(sparseNumbers,maximumFrequency)
+                    tableRun = pytablesStorageWorker.create_table(pytablesStorageWorker.root, 
+                        name="sparseDirect{}".format(sparseRuns), description=runData.dtype, 
+                        expectedrows=max(1,len(runData)))
+                    if len(runData)>0:
+                        tableRun.append(runData)
+                    sparseRuns+=1
+                    sparseDirect = np.zeros(0, dtype=sparseDtype)
+                    sparseNumbers = np.zeros(0, dtype="uint32")
+                        
+                def write_sparse_direct():
+                    aggregate_sparse_direct()
+                    if sparseRuns==0 or len(sparseDirect)>0:
+                        write_sparse_run()
+                    pytablesStorageWorker.root._v_attrs.sparseRuns = sparseRuns
+                    for (name,data) in [("sparseCycle",sparseCycles),("sparseReversal",sparseReversals)]:
+                        links = sorted(data.keys())
+                        tableData = np.zeros(len(links), dtype=[
+                            ("link",haplotyping.index.Database.getUint(numberOfKmers)),
+                            ("number",haplotyping.index.Database.getUint(maximumFrequency)),
+                            ("minimum",haplotyping.index.Database.getUint(2*estimatedMaximumReadLength))])
+                        if len(links)>0:
+                            values = np.array([data[link] for link in links], dtype="int64")
+                            tableData["link"] = links
+                            tableData["number"] = np.minimum(values[:,0],maximumFrequency)
+                            tableData["minimum"] = values[:,1]
+                        table = pytablesStorageWorker.create_table(pytablesStorageWorker.root, 
+                            name=name, description=tableData.dtype, expectedrows=max(1,len(tableData)))
+                        if len(tableData)>0:
+                            table.append(tableData)
+                        
+                if connections is None:
+                    store_cycle = store_sparse_cycle
+                    store_reversal = store_sparse_reversal
+                    store_direct = store_sparse_direct
 
                 def process_matches(matchesList,totalDirect,totalReversal,totalCycle,totalChecks):
                     history = {}
@@ -717,6 +1122,63 @@ class Storage:
                 kmer_properties = np.ndarray((numberOfKmers,), dtype=[("type","S1"),("number",shm_kmer_number),
                                        ("left",shm_kmer_link),("right",shm_kmer_link)], buffer=shm.buf)
         
+                def process_entry(item):
+                    nonlocal totalDirect,totalReversal,totalCycle,totalChecks
+                    if isinstance(item,tuple):
+                        if len(item)==1:
+                            matchesList = item[0][0]
+                            directConnected = item[0][1]
+                            (links,length,totalDirect,totalReversal,totalCycle,totalChecks,) = process_matches(
+                                matchesList,totalDirect,totalReversal,totalCycle,totalChecks)
+                        elif len(item)==2:
+                            matchesList0 = item[0][0]
+                            directConnected0 = item[0][1]
+                            matchesList1 = item[1][0]
+                            directConnected1 = item[1][1]
+                            (links0,length0,totalDirect,totalReversal,totalCycle,totalChecks,) = process_matches(
+                                matchesList0,totalDirect,totalReversal,totalCycle,totalChecks)
+                            (links1,length1,totalDirect,totalReversal,totalCycle,totalChecks,) = process_matches(
+                                matchesList1,totalDirect,totalReversal,totalCycle,totalChecks)
+                            #register pair data for single matches
+                            if (len(links0)==1) and (len(links1)>0):
+                                pairFrom = links0[0][0]
+                                pairTo = None
+                                minFreq = 0
+                                for link in links1:
+                                    freq = kmer_properties[link[0]][1]
+                                    #not informative
+                                    if link[0]==pairFrom:
+                                        pairFrom = None
+                                        break
+                                    #connect to first k-mer with minimum frequency
+                                    if freq==minFreq:                                            
+                                        pairTo = link[0] if (pairTo==None) else min(pairTo,link[0])
+                                    elif minFreq==0 or freq<minFreq:
+                                        minFreq = freq
+                                        pairTo = link[0]
+                                if not pairFrom is None:
+                                    if not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS):
+                                        store_paired(pairFrom,pairTo)
+                            if (len(links1)==1) and (len(links0)>0):
+                                pairFrom = links1[0][0]
+                                pairTo = None
+                                minFreq = 0
+                                for link in links0:
+                                    freq = kmer_properties[link[0]][1]
+                                    #not informative
+                                    if link[0]==pairTo:
+                                        pairTo = None
+                                        break
+                                    #connect to first k-mer with minimum frequency
+                                    if freq==minFreq:
+                                        pairTo = link[0] if (pairTo==None) else min(pairTo,link[0])
+                                    elif minFreq==0 or freq<minFreq:
+                                        minFreq = freq
+                                        pairTo = link[0]
+                                if not pairTo is None:
+                                    if not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS):
+                                        store_paired(pairFrom,pairTo)
+
                 while not shutdown_event.is_set():
                     try:
                         item = queue_matches.get(block=True, timeout=1)
@@ -724,65 +1186,23 @@ class Storage:
                             logger.debug("matches ({}): none item".format(os.getpid()))
                             queue_matches.task_done()
                             break
-                        elif isinstance(item,tuple):
-                            if len(item)==1:
-                                matchesList = item[0][0]
-                                directConnected = item[0][1]
-                                (links,length,totalDirect,totalReversal,totalCycle,totalChecks,) = process_matches(
-                                    matchesList,totalDirect,totalReversal,totalCycle,totalChecks)
-                            elif len(item)==2:
-                                matchesList0 = item[0][0]
-                                directConnected0 = item[0][1]
-                                matchesList1 = item[1][0]
-                                directConnected1 = item[1][1]
-                                (links0,length0,totalDirect,totalReversal,totalCycle,totalChecks,) = process_matches(
-                                    matchesList0,totalDirect,totalReversal,totalCycle,totalChecks)
-                                (links1,length1,totalDirect,totalReversal,totalCycle,totalChecks,) = process_matches(
-                                    matchesList1,totalDirect,totalReversal,totalCycle,totalChecks)
-                                #register pair data for single matches
-                                if (len(links0)==1) and (len(links1)>0):
-                                    pairFrom = links0[0][0]
-                                    pairTo = None
-                                    minFreq = 0
-                                    for link in links1:
-                                        freq = kmer_properties[link[0]][1]
-                                        #not informative
-                                        if link[0]==pairFrom:
-                                            pairFrom = None
-                                            break
-                                        #connect to first k-mer with minimum frequency
-                                        if freq==minFreq:                                            
-                                            pairTo = link[0] if (pairTo==None) else min(pairTo,link[0])
-                                        elif minFreq==0 or freq<minFreq:
-                                            minFreq = freq
-                                            pairTo = link[0]
-                                    if not pairFrom is None:
-                                        if not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS):
-                                            store_paired(pairFrom,pairTo)
-                                if (len(links1)==1) and (len(links0)>0):
-                                    pairFrom = links1[0][0]
-                                    pairTo = None
-                                    minFreq = 0
-                                    for link in links0:
-                                        freq = kmer_properties[link[0]][1]
-                                        #not informative
-                                        if link[0]==pairTo:
-                                            pairTo = None
-                                            break
-                                        #connect to first k-mer with minimum frequency
-                                        if freq==minFreq:
-                                            pairTo = link[0] if (pairTo==None) else min(pairTo,link[0])
-                                        elif minFreq==0 or freq<minFreq:
-                                            minFreq = freq
-                                            pairTo = link[0]
-                                    if not pairTo is None:
-                                        if not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS):
-                                            store_paired(pairFrom,pairTo)
+                        elif isinstance(item,list) or isinstance(item,int):
+                            #batch of matches, or slot with batch of matches in shared memory
+                            if isinstance(item,int):
+                                entries = Storage.ring_get_matches(ring_matches,item)
+                                Storage.ring_release(ring_matches,item)
+                            else:
+                                entries = item
+                            Storage.count_queue(queue_sizes,2,-len(entries))
+                            for entry in entries:
+                                process_entry(entry)
                         queue_matches.task_done()
                     except Empty:
                         logger.debug("matches ({}): empty".format(os.getpid()))
                         time.sleep(5)
                         continue   
+                if connections is None:
+                    write_sparse_direct()
                 pytablesStorageWorker.flush()
                 logger.debug("matches ({}): create indices temporary tables".format(os.getpid()))
                 tableDirectOther.cols.fromLink.create_csindex()
@@ -790,8 +1210,9 @@ class Storage:
                 if not (indexType==haplotyping.index.database.Database.ONLYDIRECTCONNECTIONS):
                     tablePaired.cols.fromLink.create_csindex()
                     pytablesStorageWorker.flush()
-                pytablesStorageWorker.create_table(pytablesStorageWorker.root, 
-                                              name="direct", obj=connections, expectedrows=numberOfKmers)
+                if not connections is None:
+                    pytablesStorageWorker.create_table(pytablesStorageWorker.root, 
+                                                  name="direct", obj=connections, expectedrows=numberOfKmers)
                 logger.debug("matches ({}): found {} direct, {} cycle and {} reversal in {} matches".format(
                     os.getpid(), totalDirect,totalCycle,totalReversal,totalChecks))
                 pytablesStorageWorker.flush()
@@ -803,6 +1224,8 @@ class Storage:
 
         #close shared memory
         shm.close()
+        if not ring_matches==None:
+            ring_matches[0].close()
         queue_finished.put("matches:ended")
             
                 
@@ -829,19 +1252,24 @@ class Storage:
                     storageHandlers = [{"handler": stack.enter_context(tables.open_file(fname, mode="r"))} 
                                                for fname in storageDirectFiles]
                     
-                    #get and position sorted iterators for other entries
+                    #sparse worker files only contain occurring connections, as runs sorted on link
+                    for i in range(len(storageHandlers)):
+                        root = storageHandlers[i]["handler"].root
+                        if "sparseRuns" in root._v_attrs:
+                            storageHandlers[i]["sparseRuns"] = [(table,table.col("link"),) for table in 
+                                [root._f_get_child("sparseDirect{}".format(r)) for r in range(root._v_attrs.sparseRuns)]]
+                            storageHandlers[i]["sparseCycles"] = (root.sparseCycle,root.sparseCycle.col("link"),)
+                            storageHandlers[i]["sparseReversals"] = (root.sparseReversal,
+                                                                     root.sparseReversal.col("link"),)
+                        else:
+                            storageHandlers[i]["sparseRuns"] = None
+                    #sorted links of the other entries, to read the range in the order of the index
                     for i in range(len(storageHandlers)):
-                        storageHandlers[i]["otherRow"] = None
                         if storageHandlers[i]["handler"].root.directOther.shape[0]>0:
-                            storageHandlers[i]["otherIterator"] = storageHandlers[i]["handler"].root.directOther.itersorted(
-                                "fromLink",checkCSI=True)
-                            for row in storageHandlers[i]["otherIterator"]:
-                                if row["fromLink"]>=mergeStart:
-                                    if row["fromLink"]<=mergeEnd:
-                                        storageHandlers[i]["otherRow"] = row
-                                    break
+                            storageHandlers[i]["otherLinks"] = storageHandlers[i]["handler"].root.directOther.read_sorted(
+                                "fromLink",checkCSI=True,field="fromLink")
                         else:
-                            storageHandlers[i]["otherIterator"] = None
+                            storageHandlers[i]["otherLinks"] = None
                     #get and position sorted iterators for paired entries
                     for i in range(len(storageHandlers)):
                         storageHandlers[i]["pairedRow"] = None
@@ -856,392 +1284,286 @@ class Storage:
                         else:
                             storageHandlers[i]["pairedIterator"] = None
                     
-                    #direct connections
-                    def add_directData(directDataEntry,fromDirection,toLink,toDirection,distance,number):
-                        if not fromDirection in directDataEntry.keys():
-                            directDataEntry[fromDirection] = {}
-                        if not distance in directDataEntry[fromDirection].keys():
-                            directDataEntry[fromDirection][distance] = {}
-                        if not toLink in directDataEntry[fromDirection][distance].keys():
-                            directDataEntry[fromDirection][distance][toLink] = {}
-                        if not toDirection in directDataEntry[fromDirection][distance][toLink].keys():
-                            props = kmer_properties[toLink]                                            
-                            splitDirection = props[0].tobytes().decode()
-                            reverseBase = None
-                            forwardBase = None
-                            if toDirection==0:
-                                #from the left
-                                if splitDirection in ["l","b"]:
-                                    reverseBase = props[2]
-                                    direction = "r" if splitDirection=="l" else "b"
-                                if splitDirection in ["r","b"]:
-                                    forwardBase = props[3]
-                                    direction = "f" if splitDirection=="r" else "b"
-                            elif toDirection==1:
-                                #from the right
-                                if splitDirection in ["r","b"]:
-                                    reverseBase = props[3]
-                                    direction = "r" if splitDirection=="r" else "b"
-                                if splitDirection in ["l","b"]:
-                                    forwardBase = props[2]
-                                    direction = "f" if splitDirection=="l" else "b"
-                            directDataEntry[fromDirection][distance][toLink][toDirection] = {"number": np.uint(number), 
-                                         "direction": direction, "forwardBase": forwardBase, 
-                                         "reverseBase": reverseBase, "problematic": 0}
-                        else:
-                            directDataEntry[fromDirection][distance][toLink][toDirection]["number"] = (
-                                min(maximumFrequency,
-                                    directDataEntry[fromDirection][distance][toLink][toDirection]["number"]+number))
-                        return directDataEntry
+                    entryDtype = [("fromLink","int64"),("fromDirection","int64"),("toLink","int64"),
+                                  ("toDirection","int64"),("distance","int64"),("number","int64")]
+                    
+                    #rows of a table sorted on link, with links in the range
+                    def read_sparse(table, links, start, end):
+                        (first,last,) = np.searchsorted(links,[start,end])
+                        return table[first:last]
+                    
+                    #direct connections, cycles and reversals from a sparse worker file
+                    def read_sparse_entries(storageHandler, start, end):
+                        runData = np.concatenate([read_sparse(table,links,start,end) 
+                                                  for (table,links,) in storageHandler["sparseRuns"]])
+                        types = runData["type"].astype("int64")
+                        entries = np.zeros(len(runData), dtype=entryDtype)
+                        entries["fromLink"] = runData["link"]
+                        entries["fromDirection"] = (types - 1) & 1
+                        entries["toLink"] = runData["toLink"]
+                        entries["toDirection"] = ((types - 1) & 2)//2
+                        entries["distance"] = runData["distance"]
+                        entries["number"] = runData["number"]
+                        #runs follow each other for the same link
+                        entries = entries[np.argsort(entries["fromLink"], kind="stable")]
+                        cycles = read_sparse(*storageHandler["sparseCycles"],start,end)
+                        reversals = read_sparse(*storageHandler["sparseReversals"],start,end)
+                        return (entries,
+                                (cycles["link"],cycles["number"],cycles["minimum"],),
+                                (reversals["link"],reversals["number"],reversals["minimum"],))
+                    
+                    #direct connections, cycles and reversals from a worker file
+                    def read_direct_entries(storageHandler, start, end):
+                        if not storageHandler["sparseRuns"] is None:
+                            return read_sparse_entries(storageHandler, start, end)
+                        rowData = storageHandler["handler"].root.direct[start:end]
+                        slots = [rowData["direct"][name] for name in rowData.dtype["direct"].names]
+                        types = np.stack([slot["type"] for slot in slots], axis=1).astype("int64")
+                        #entries after the first empty position are ignored
+                        (rows,positions,) = np.nonzero(np.cumprod(types>0, axis=1))
+                        entries = np.zeros(len(rows), dtype=entryDtype)
+                        entries["fromLink"] = start + rows
+                        entries["fromDirection"] = (types[rows,positions] - 1) & 1
+                        entries["toDirection"] = ((types[rows,positions] - 1) & 2)//2
+                        for (field,name,) in [("toLink","link"),("distance","distance"),("number","number")]:
+                            entries[field] = np.stack([slot[name] for slot in slots], axis=1)[rows,positions]
+                        #other entries follow the regular entries for the same link
+                        if not storageHandler["otherLinks"] is None:
+                            (otherStart,otherEnd,) = np.searchsorted(storageHandler["otherLinks"],[start,end])
+                            if otherEnd>otherStart:
+                                otherData = storageHandler["handler"].root.directOther.read_sorted(
+                                    "fromLink",checkCSI=True,start=otherStart,stop=otherEnd)
+                                otherEntries = np.zeros(len(otherData), dtype=entryDtype)
+                                for field in otherEntries.dtype.names:
+                                    otherEntries[field] = otherData[field]
+                                entries = np.concatenate((entries,otherEntries))
+                                entries = entries[np.argsort(entries["fromLink"], kind="stable")]
+                        cycles = np.flatnonzero(rowData["cycle"]["minimum"]>0)
+                        reversals = np.flatnonzero(rowData["reversal"]["minimum"]>0)
+                        return (entries, 
+                                (start+cycles,rowData["cycle"]["number"][cycles],rowData["cycle"]["minimum"][cycles],),
+                                (start+reversals,rowData["reversal"]["number"][reversals],
+                                 rowData["reversal"]["minimum"][reversals],))
                     
-                    #delete probably wrong direct connections
-                    def reduceDistances(fromLink,fromDirection,distanceData):
+                    #first occurrence for each group of entries with equal fields
+                    def first_occurrence(entries, fields, occurrence):
+                        (groups,inverse,) = np.unique(np.stack([entries[field] for field in fields], axis=1), 
+                                                      axis=0, return_inverse=True)
+                        inverse = inverse.ravel()
+                        minimum = np.full(len(groups), np.iinfo("int64").max, dtype="int64")
+                        np.minimum.at(minimum,inverse,occurrence)
+                        return minimum[inverse]
+                    
+                    #combine equal connections, ordered by first occurrence within link, direction and distance
+                    def aggregate_direct_entries(entries):
+                        occurrence = np.arange(len(entries))
+                        order = np.lexsort((occurrence,entries["distance"],entries["toDirection"],
+                                            entries["toLink"],entries["fromDirection"],entries["fromLink"]))
+                        sortedEntries = entries[order]
+                        fields = ["fromLink","fromDirection","toLink","toDirection","distance"]
+                        changes = np.zeros(len(sortedEntries), dtype=bool)
+                        changes[0] = True
+                        for field in fields:
+                            changes[1:] |= sortedEntries[field][1:]!=sortedEntries[field][:-1]
+                        starts = np.flatnonzero(changes)
+                        counts = np.diff(np.append(starts,len(sortedEntries)))
+                        totals = np.add.reduceat(sortedEntries["number"],starts)
+                        aggregated = sortedEntries[starts]
+                        #a single number is taken as is, combined numbers are limited
+                        aggregated["number"] = np.where(counts==1,aggregated["number"],
+                                                        np.minimum(totals,maximumFrequency))
+                        first = order[starts]
+                        order = np.lexsort((first,
+                            first_occurrence(aggregated,["fromLink","fromDirection","distance","toLink"],first),
+                            first_occurrence(aggregated,["fromLink","fromDirection","distance"],first),
+                            first_occurrence(aggregated,["fromLink","fromDirection"],first),
+                            aggregated["fromLink"]))
+                        return aggregated[order]
+                    
+                    #combine cycles or reversals, ordered on link independent of the workers
+                    def aggregate_cycles(cycles):
+                        links = np.concatenate([item[0] for item in cycles]).astype("int64")
+                        numbers = np.concatenate([item[1] for item in cycles]).astype("int64")
+                        minimums = np.concatenate([item[2] for item in cycles]).astype("int64")
+                        if len(links)==0:
+                            return (links,numbers,minimums,)
+                        order = np.argsort(links, kind="stable")
+                        starts = np.flatnonzero(np.append(True,links[order][1:]!=links[order][:-1]))
+                        numbers = np.add.reduceat(numbers[order],starts)
+                        minimums = np.minimum.reduceat(minimums[order],starts)
+                        return (links[order][starts],numbers,minimums,)
+                    
+                    #delete probably wrong direct connections, for each link and direction
+                    def reduce_direct_entries(entries):
+                        toLinks = entries["toLink"]
+                        numbers = entries["number"]
+                        relevant = numbers>=minimumFrequency
+                        #splitting bases of the connected k-mers
+                        splitDirection = kmer_properties["type"][toLinks]
+                        fromLeft = entries["toDirection"]==0
+                        withLeft = (splitDirection==b"l") | (splitDirection==b"b")
+                        withRight = (splitDirection==b"r") | (splitDirection==b"b")
+                        leftBase = kmer_properties["left"][toLinks].astype("int64")
+                        rightBase = kmer_properties["right"][toLinks].astype("int64")
+                        reverseBases = np.where(fromLeft,np.where(withLeft,leftBase,-1),np.where(withRight,rightBase,-1))
+                        forwardBases = np.where(fromLeft,np.where(withRight,rightBase,-1),np.where(withLeft,leftBase,-1))
+                        #groups for link and direction, and for distance within these
+                        groupChanges = np.zeros(len(entries), dtype=bool)
+                        groupChanges[0] = True
+                        groupChanges[1:] = ((entries["fromLink"][1:]!=entries["fromLink"][:-1]) | 
+                                            (entries["fromDirection"][1:]!=entries["fromDirection"][:-1]))
+                        distanceChanges = groupChanges.copy()
+                        distanceChanges[1:] |= entries["distance"][1:]!=entries["distance"][:-1]
+                        groups = np.cumsum(groupChanges)-1
+                        distanceGroups = np.cumsum(distanceChanges)-1
+                        numberOfGroups = groups[-1]+1
+                        numberOfDistanceGroups = distanceGroups[-1]+1
+                        distanceGroup = groups[np.flatnonzero(distanceChanges)]
+                        alive = np.ones(len(entries), dtype=bool)
+                        problematic = np.zeros(len(entries), dtype="uint8")
                         
-                        def delete_connection(fromLink,fromDirection,toLink,toDirection):
-                            #first
-                            tableDeleteDirectRow = tableDeleteDirect.row
-                            tableDeleteDirectRow["fromLink"] = fromLink
-                            tableDeleteDirectRow["fromDirection"] = fromDirection
-                            tableDeleteDirectRow["toLink"] = toLink
-                            tableDeleteDirectRow["toDirection"] = toDirection
-                            tableDeleteDirectRow.append()
-                            #second
-                            tableDeleteDirectRow = tableDeleteDirect.row
-                            tableDeleteDirectRow["fromLink"] = toLink
-                            tableDeleteDirectRow["fromDirection"] = toDirection
-                            tableDeleteDirectRow["toLink"] = fromLink
-                            tableDeleteDirectRow["toDirection"] = fromDirection
-                            tableDeleteDirectRow.append()
+                        def group_sum(ids,values,number):
+                            return np.bincount(ids, weights=values, minlength=number).astype("int64")
                         
-                        #compute incorrect distances
-                        incorrectDistances = []
-                        for distance in distanceData.keys():
-                            distanceNumber = 0
-                            dataEntry = distanceData[distance] 
-                            for toLink in dataEntry.keys():
-                                for toDirection in dataEntry[toLink].keys():
-                                    number = dataEntry[toLink][toDirection]["number"]
-                                    if number>=minimumFrequency:
-                                        distanceNumber+=number
-                                    
-                            if distanceNumber==0:
-                                incorrectDistances.append(distance)
-                        #remove incorrect distances
-                        if len(incorrectDistances)<len(distanceData.keys()):
-                            newValues = {}
-                            for distance in distanceData.keys():
-                                if distance in incorrectDistances:
-                                    dataEntry = distanceData[distance] 
-                                    for toLink in dataEntry.keys():
-                                        for toDirection in dataEntry[toLink].keys():
-                                            delete_connection(toLink,"l" if toDirection==0 else "r",
-                                                  fromLink,"l" if fromDirection==0 else "r")                                   
-                                else:
-                                    newValues[distance] = distanceData[distance]
-                            distanceData = newValues
-                            
-                        #compute possible splitting bases
-                        reverseBases = {}
-                        forwardBases = {}
-                        relevantConnectionNumber = 0
-                        distances = {}
-                        for distance in distanceData.keys():
-                            dataEntry = distanceData[distance] 
-                            for toLink in dataEntry.keys():
-                                for toDirection in dataEntry[toLink].keys():
-                                    number = dataEntry[toLink][toDirection]["number"]
-                                    if number>=minimumFrequency:
-                                        distances[distance] = distances.get(distance,0) + number
-                                        relevantConnectionNumber+=number
-                                        direction = dataEntry[toLink][toDirection]["direction"]
-                                        if direction in ["f","b"]:
-                                            forwardBase = dataEntry[toLink][toDirection]["forwardBase"]
-                                            forwardBases[forwardBase] = forwardBases.get(forwardBase,0) + number
-                                        if direction in ["r","b"]:
-                                            reverseBase = dataEntry[toLink][toDirection]["reverseBase"]
-                                            reverseBases[reverseBase] = reverseBases.get(reverseBase,0) + number
-                        possibleReverseBases = [base for base in reverseBases.keys() 
-                                                if reverseBases[base]==relevantConnectionNumber]
-                        possibleForwardBases = [base for base in forwardBases.keys() 
-                                                if forwardBases[base]==relevantConnectionNumber]
+                        def group_maximum(values):
+                            maximum = np.zeros(numberOfGroups, dtype="int64")
+                            np.maximum.at(maximum,distanceGroup,values)
+                            return maximum
                         
-                        def set_problematic(distanceData,value):
-                            for distance in distanceData.keys():
-                                for toLink in distanceData[distance].keys():
-                                    for toDirection in distanceData[distance][toLink].keys():
-                                        distanceData[distance][toLink][toDirection]["problematic"] = value
-                            return distanceData
-                                                
-                        if relevantConnectionNumber>0:
-                            
-                            #try fixing multiple distances if this is potential problematic
-                            if len(possibleReverseBases)+len(possibleForwardBases)==0:
-                                if len(distances)>1:
-                                    maximumDistanceFrequency = max(max(distances.values()),minimumFrequency)
-                                    boundary = math.floor(math.sqrt(maximumDistanceFrequency/minimumFrequency))
-                                    incorrectDistances = [d for d in distances.keys() if distances[d]<=boundary]
-                                    if len(incorrectDistances)>0:
-                                        #remove incorrect distances
-                                        newValues = {}
-                                        for distance in distanceData.keys():
-                                            if distance in incorrectDistances:
-                                                dataEntry = distanceData[distance] 
-                                                for toLink in dataEntry.keys():
-                                                    for toDirection in dataEntry[toLink].keys():
-                                                        delete_connection(toLink,"l" if toDirection==0 else "r",
-                                                              fromLink,"l" if fromDirection==0 else "r")
-                                            else:
-                                                newValues[distance] = distanceData[distance]
-                                        distanceData = newValues
-                                        #recompute possible splitting bases
-                                        reverseBases = {}
-                                        forwardBases = {}
-                                        relevantConnectionNumber = 0
-                                        distances = {}
-                                        for distance in distanceData.keys():
-                                            dataEntry = distanceData[distance] 
-                                            for toLink in dataEntry.keys():
-                                                for toDirection in dataEntry[toLink].keys():
-                                                    number = dataEntry[toLink][toDirection]["number"]
-                                                    if number>=minimumFrequency:
-                                                        distances[distance] = distances.get(distance,0) + number
-                                                        relevantConnectionNumber+=number
-                                                        direction = dataEntry[toLink][toDirection]["direction"]
-                                                        if direction in ["f","b"]:
-                                                            forwardBase = dataEntry[toLink][toDirection]["forwardBase"]
-                                                            forwardBases[forwardBase] = (forwardBases.get(forwardBase,0) 
-                                                                                         + number)
-                                                        if direction in ["r","b"]:
-                                                            reverseBase = dataEntry[toLink][toDirection]["reverseBase"]
-                                                            reverseBases[reverseBase] = (reverseBases.get(reverseBase,0) 
-                                                                                         + number)
-                                        possibleReverseBases = [base for base in reverseBases.keys() 
-                                                                if reverseBases[base]==relevantConnectionNumber]
-                                        possibleForwardBases = [base for base in forwardBases.keys() 
-                                                                if forwardBases[base]==relevantConnectionNumber]
-                                                                                
-                            
-                            #no single base covering everything
-                            if len(possibleReverseBases)+len(possibleForwardBases)==0:
-                                distanceData = set_problematic(distanceData,2)                                
-                            #found forward solution    
-                            elif len(possibleForwardBases)>0:
-                                forwardBase = possibleForwardBases[0]  
-                                #try to reduce distances
-                                if len(distances)>1:
-                                    maximumDistanceFrequency = max(max(distances.values()),maximumFrequency)
-                                    boundary = math.floor(math.sqrt(maximumDistanceFrequency/minimumFrequency))
-                                    incorrectDistances = [d for d in distances.keys() if distances[d]<=boundary]
-                                else:
-                                    incorrectDistances = []
-                                #reduce (if necessary) to single distance and forwardBase
-                                if (len(distances) - len(incorrectDistances)) == 1:
-                                    newValues = {}
-                                    for distance in distanceData.keys():
-                                        if distance in incorrectDistances:
-                                            dataEntry = distanceData[distance] 
-                                            for toLink in dataEntry.keys():
-                                                for toDirection in dataEntry[toLink].keys():
-                                                    delete_connection(toLink,"l" if toDirection==0 else "r",
-                                                          fromLink,"l" if fromDirection==0 else "r")                           
-                                        else:
-                                            distanceDataEntry = {}
-                                            dataEntry = distanceData[distance] 
-                                            for toLink in dataEntry.keys():
-                                                for toDirection in dataEntry[toLink].keys():
-                                                    direction = dataEntry[toLink][toDirection]["direction"]
-                                                    if ((direction in ["f","b"]) and 
-                                                        (dataEntry[toLink][toDirection]["forwardBase"] == forwardBase)):
-                                                        distanceDataEntry[toLink] = distanceDataEntry.get(toLink,{})
-                                                        distanceDataEntry[toLink][toDirection] = dataEntry[toLink].get(
-                                                            toDirection)
-                                                    else:
-                                                        delete_connection(toLink,"l" if toDirection==0 else "r",
-                                                          fromLink,"l" if fromDirection==0 else "r")  
-                                            assert len(distanceDataEntry)>0
-                                            newValues[distance] = distanceDataEntry
-                                    distanceData = newValues
-                                else:
-                                    #can't solve this, too many distances
-                                    distanceData = set_problematic(distanceData,3) 
-                            #found reverse solution    
-                            elif len(possibleReverseBases)>0:
-                                reverseBase = possibleReverseBases[0]  
-                                #try to reduce distances
-                                if len(distances)>1:
-                                    maximumDistanceFrequency = max(distances.values())
-                                    boundary = math.floor(math.sqrt(maximumDistanceFrequency/minimumFrequency))
-                                    incorrectDistances = [d for d in distances.keys() if distances[d]<=boundary]
-                                else:
-                                    incorrectDistances = []
-                                #reduce (if necessary) to single distance and reverseBase
-                                if (len(distances) - len(incorrectDistances)) == 1:
-                                    newValues = {}
-                                    numberOfConnections = 0
-                                    for distance in distanceData.keys():
-                                        if distance in incorrectDistances:
-                                            dataEntry = distanceData[distance] 
-                                            for toLink in dataEntry.keys():
-                                                for toDirection in dataEntry[toLink].keys():
-                                                    delete_connection(toLink,"l" if toDirection==0 else "r",
-                                                          fromLink,"l" if fromDirection==0 else "r")                           
-                                        else:
-                                            distanceDataEntry = {}
-                                            dataEntry = distanceData[distance] 
-                                            for toLink in dataEntry.keys():
-                                                for toDirection in dataEntry[toLink].keys():
-                                                    direction = dataEntry[toLink][toDirection]["direction"]
-                                                    number = dataEntry[toLink][toDirection]["number"]
-                                                    #expect single connection, therefore also restriction number
-                                                    if ((direction in ["r","b"]) and 
-                                                        (dataEntry[toLink][toDirection]["reverseBase"] == reverseBase) and
-                                                        number>=minimumFrequency):
-                                                        distanceDataEntry[toLink] = distanceDataEntry.get(toLink,{})
-                                                        distanceDataEntry[toLink][toDirection] = dataEntry[toLink].get(
-                                                            toDirection)
-                                                        numberOfConnections+=1
-                                                    else:
-                                                        delete_connection(toLink,"l" if toDirection==0 else "r",
-                                                          fromLink,"l" if fromDirection==0 else "r")
-                                            assert len(distanceDataEntry)>0
-                                            newValues[distance] = distanceDataEntry
-                                    distanceData = newValues  
-                                    #expect only single connection
-                                    if numberOfConnections>1:
-                                        distanceData = set_problematic(distanceData,5)
-                                else:
-                                    #can't solve this, too many distances
-                                    distanceData = set_problematic(distanceData,4)
-                            else:
-                                raise Exception("this should not happen")
-                        else:
-                            #not enough relevant connections
-                            distanceData = set_problematic(distanceData,1)
-                        #return
-                        return distanceData
+                        def possible_bases(bases,selection,total):
+                            possible = np.full(numberOfGroups, -1, dtype="int64")
+                            selection = np.flatnonzero(selection & (bases>=0))
+                            if len(selection)>0:
+                                (pairs,inverse,) = np.unique(np.stack((groups[selection],bases[selection]), axis=1), 
+                                                             axis=0, return_inverse=True)
+                                pairTotals = group_sum(inverse.ravel(),numbers[selection],len(pairs))
+                                found = pairTotals==total[pairs[:,0]]
+                                possible[pairs[found,0]] = pairs[found,1]
+                            return possible
+                        
+                        def compute_relevant():
+                            selection = relevant & alive
+                            distances = group_sum(distanceGroups,numbers*selection,numberOfDistanceGroups)
+                            withDistance = group_sum(distanceGroups,selection,numberOfDistanceGroups)>0
+                            total = group_sum(groups,numbers*selection,numberOfGroups)
+                            return (distances,withDistance,total,
+                                    possible_bases(forwardBases,selection,total),
+                                    possible_bases(reverseBases,selection,total),)
+                        
+                        #remove distances without relevant connections, if others are available
+                        (distances,withDistance,total,forwardBase,reverseBase,) = compute_relevant()
+                        incorrect = ~withDistance
+                        remove = group_sum(distanceGroup,incorrect,numberOfGroups)<group_sum(distanceGroup,
+                                                                       np.ones(numberOfDistanceGroups),numberOfGroups)
+                        alive &= ~(incorrect & remove[distanceGroup])[distanceGroups]
+                        (distances,withDistance,total,forwardBase,reverseBase,) = compute_relevant()
+                        relevantTotal = total
+                        numberOfDistances = group_sum(distanceGroup,withDistance,numberOfGroups)
+                        
+                        #try fixing multiple distances if this is potential problematic
+                        boundary = np.floor(np.sqrt(np.maximum(group_maximum(distances),minimumFrequency)
+                                                    /minimumFrequency))
+                        incorrect = (withDistance & (distances<=boundary[distanceGroup]) &
+                                     ((relevantTotal>0) & (forwardBase<0) & (reverseBase<0) & 
+                                      (numberOfDistances>1))[distanceGroup])
+                        if incorrect.any():
+                            alive &= ~incorrect[distanceGroups]
+                            (distances,withDistance,total,forwardBase,reverseBase,) = compute_relevant()
+                            numberOfDistances = group_sum(distanceGroup,withDistance,numberOfGroups)
+                        
+                        #not enough relevant connections
+                        problematic[(relevantTotal==0)[groups]] = 1
+                        #no single base covering everything
+                        problematic[((relevantTotal>0) & (forwardBase<0) & (reverseBase<0))[groups] & alive] = 2
+                        
+                        #found forward solution, reduce (if necessary) to single distance and forwardBase
+                        forwardGroups = (relevantTotal>0) & (forwardBase>=0)
+                        boundary = np.floor(np.sqrt(np.maximum(group_maximum(distances),maximumFrequency)
+                                                    /minimumFrequency))
+                        incorrect = (withDistance & (distances<=boundary[distanceGroup]) & 
+                                     (numberOfDistances>1)[distanceGroup])
+                        solved = forwardGroups & (numberOfDistances-group_sum(distanceGroup,incorrect,
+                                                                                numberOfGroups)==1)
+                        alive &= ~(solved[groups] & (incorrect[distanceGroups] | 
+                                                     ~(forwardBases==forwardBase[groups])))
+                        problematic[(forwardGroups & ~solved)[groups] & alive] = 3
+                        
+                        #found reverse solution, reduce (if necessary) to single distance and reverseBase
+                        reverseGroups = (relevantTotal>0) & (forwardBase<0) & (reverseBase>=0)
+                        boundary = np.floor(np.sqrt(group_maximum(distances)/minimumFrequency))
+                        incorrect = (withDistance & (distances<=boundary[distanceGroup]) & 
+                                     (numberOfDistances>1)[distanceGroup])
+                        solved = reverseGroups & (numberOfDistances-group_sum(distanceGroup,incorrect,
+                                                                                numberOfGroups)==1)
+                        alive &= ~(solved[groups] & (incorrect[distanceGroups] | 
+                                                     ~((reverseBases==reverseBase[groups]) & relevant)))
+                        problematic[(reverseGroups & ~solved)[groups] & alive] = 4
+                        #expect only single connection
+                        multiple = solved & (group_sum(groups,alive,numberOfGroups)>1)
+                        problematic[multiple[groups] & alive] = 5
+                        
+                        #check for multiple distances (inconsistent)
+                        remainingDistances = group_sum(distanceGroup,
+                            group_sum(distanceGroups,alive,numberOfDistanceGroups)>0,numberOfGroups)
+                        problematic = (remainingDistances!=1)[groups] + (problematic<<1)
+                        directions = np.where(reverseBases>=0,np.where(forwardBases>=0,b"b",b"r"),b"f")
+                        return (alive,problematic,directions,np.maximum(reverseBases,0),np.maximum(forwardBases,0),)
                     
                     for i in range(mergeStart,mergeEnd+1,Storage.stepSizeStorage):
-                        #initialise
-                        cycleEntries = {}
-                        reversalEntries = {}
-                        directData = [{} for j in range(min(mergeEnd+1-i,Storage.stepSizeStorage,(numberOfKmers-i)))]
+                        end = min(mergeEnd+1,i+Storage.stepSizeStorage,numberOfKmers)
+                        directData = []
+                        cycleData = []
+                        reversalData = []
                         for storageHandler in storageHandlers:
-                            rowData = storageHandler["handler"].root.direct[i:min(mergeEnd+1,i+Storage.stepSizeStorage)]
-                            for index, item in enumerate(rowData):
-                                fromLink = i + index
-                                #get and process regular data
-                                for k in range(len(item[2])):
-                                    if item[2][k][0]==0:
-                                        break
-                                    else:
-                                        fromDirection = (item[2][k][0] - 1) & 1
-                                        toDirection = int(((item[2][k][0] - 1) & 2)/2)
-                                        toLink = item[2][k][1]
-                                        number = int(item[2][k][3])
-                                        distance = item[2][k][2]
-                                        directData[index] = add_directData(directData[index],
-                                                                       fromDirection,toLink,toDirection,distance,number)
-                                        
-                                #now check other data
-                                if storageHandler["otherRow"]:
-                                    if storageHandler["otherRow"]["fromLink"]<fromLink:
-                                        storageHandler["otherRow"] = None
-                                        for row in storageHandler["otherIterator"]:
-                                            if row["fromLink"]>=fromLink:
-                                                if row["fromLink"]<=mergeEnd:
-                                                    storageHandler["otherRow"] = row
-                                                break
-                                    if storageHandler["otherRow"] and storageHandler["otherRow"]["fromLink"]==fromLink:
-                                        fromDirection = storageHandler["otherRow"]["fromDirection"]
-                                        toDirection = storageHandler["otherRow"]["toDirection"]
-                                        toLink = storageHandler["otherRow"]["toLink"]
-                                        number = int(storageHandler["otherRow"]["number"])
-                                        distance = storageHandler["otherRow"]["distance"]
-                                        directData[index] = add_directData(directData[index],
-                                                                       fromDirection,toLink,toDirection,distance,number)
-                                        for row in storageHandler["otherIterator"]:
-                                            if row["fromLink"]==fromLink:
-                                                storageHandler["otherRow"] = row
-                                                fromDirection = storageHandler["otherRow"]["fromDirection"]
-                                                toDirection = storageHandler["otherRow"]["toDirection"]
-                                                toLink = storageHandler["otherRow"]["toLink"]
-                                                number = int(storageHandler["otherRow"]["number"])
-                                                distance = storageHandler["otherRow"]["distance"]
-                                                directData[index] = add_directData(directData[index],
-                                                               fromDirection,toLink,toDirection,distance,number)
-                                                
-                                            elif row["fromLink"]<=mergeEnd:
-                                                storageHandler["otherRow"] = row
-                                                break
-                                            else:
-                                                storageHandler["otherRow"] = None
-                                                break
-                                
-                            for index, item in enumerate(rowData):
-                                if item[0][1]>0:
-                                    if index in cycleEntries.keys():
-                                        cycleEntries[index] = (cycleEntries[index][0]+int(item[0][0]),
-                                                               min(cycleEntries[index][1],item[0][1]),)
-                                    else:
-                                        cycleEntries[index] = (int(item[0][0]),item[0][1],)
-                            for index, item in enumerate(rowData):
-                                if item[1][1]>0:
-                                    if index in reversalEntries.keys():
-                                        reversalEntries[index] = (reversalEntries[index][0]+int(item[1][0]),
-                                                               min(reversalEntries[index][1],item[1][1]),)
-                                    else:
-                                        reversalEntries[index] = (int(item[1][0]),item[1][1],)
-                        for ce in cycleEntries.keys():
-                            tableCycleRow = tableCycle.row
-                            tableCycleRow["ckmerLink"] = i+ce
-                            tableCycleRow["number"] = min(maximumFrequency,cycleEntries[ce][0])
-                            tableCycleRow["minimumLength"] = cycleEntries[ce][1]
-                            tableCycleRow.append()
-                        for ce in reversalEntries.keys():
-                            tableReversalRow = tableReversal.row
-                            tableReversalRow["ckmerLink"] = i+ce
-                            tableReversalRow["number"] = min(maximumFrequency,reversalEntries[ce][0])
-                            tableReversalRow["minimumLength"] = reversalEntries[ce][1]
-                            tableReversalRow.append()
+                            (entries,cycles,reversals,) = read_direct_entries(storageHandler,i,end)
+                            directData.append(entries)
+                            cycleData.append(cycles)
+                            reversalData.append(reversals)
+                        #entries for each link in the order of the worker files
+                        directData = np.concatenate(directData)
+                        directData = directData[np.argsort(directData["fromLink"], kind="stable")]
                         
-                        unlinkedEntries = []
-                        for j in range(len(directData)):
-                            fromLink = i + j
-                            if len(directData[j])==0:
-                                unlinkedEntries.append(fromLink)
-                            else:
-                                for fromDirection in directData[j].keys():
-                                    directData[j][fromDirection] = reduceDistances(fromLink,fromDirection, 
-                                                                                  directData[j][fromDirection])
-                                    #check for multiple distances (inconsistent)
-                                    multipleDistances = 1 if not len(directData[j][fromDirection])==1 else 0
-                                    for distance in directData[j][fromDirection].keys():
-                                        dataEntry = directData[j][fromDirection][distance]
-                                        for toLink in dataEntry.keys():
-                                            for toDirection in dataEntry[toLink].keys():
-                                                number = dataEntry[toLink][toDirection]["number"]
-                                                problematic = dataEntry[toLink][toDirection]["problematic"]
-                                                direction = dataEntry[toLink][toDirection]["direction"]
-                                                if direction in ["r","b"]:
-                                                    reverseBase = dataEntry[toLink][toDirection]["reverseBase"]
-                                                else:
-                                                    reverseBase = 0
-                                                if direction in ["f","b"]:
-                                                    forwardBase = dataEntry[toLink][toDirection]["forwardBase"]
-                                                else:
-                                                    forwardBase = 0
-                                                tableDirectRow = tableDirect.row
-                                                tableDirectRow["fromLink"] = fromLink
-                                                tableDirectRow["fromDirection"] = "l" if fromDirection==0 else "r"
-                                                tableDirectRow["toLink"] = toLink
-                                                tableDirectRow["toDirection"] = "l" if toDirection==0 else "r"
-                                                tableDirectRow["number"] = min(maximumFrequency,number)
-                                                tableDirectRow["distance"] = distance
-                                                tableDirectRow["splitDirection"] = direction
-                                                tableDirectRow["reverseBase"] = reverseBase
-                                                tableDirectRow["forwardBase"] = forwardBase
-                                                tableDirectRow["problematic"] = multipleDistances + (problematic<<1)
-                                                tableDirectRow.append()
+                        for (table,data,) in [(tableCycle,cycleData),(tableReversal,reversalData)]:
+                            (links,numbers,minimums,) = aggregate_cycles(data)
+                            if len(links)>0:
+                                tableData = np.zeros(len(links), dtype=table.dtype)
+                                tableData["ckmerLink"] = links
+                                tableData["number"] = np.minimum(numbers,maximumFrequency)
+                                tableData["minimumLength"] = minimums
+                                table.append(tableData)
+                        
+                        unlinkedEntries = np.setdiff1d(np.arange(i,end),directData["fromLink"]).tolist()
+                        if len(directData)>0:
+                            directData = aggregate_direct_entries(directData)
+                            (alive,problematic,directions,reverseBases,forwardBases,) = reduce_direct_entries(directData)
+                            sides = np.array([b"l",b"r"])
+                            #register deleted connections in both directions
+                            deleted = directData[~alive]
+                            if len(deleted)>0:
+                                deleteData = np.zeros(2*len(deleted), dtype=tableDeleteDirect.dtype)
+                                deleteData["fromLink"][0::2] = deleted["toLink"]
+                                deleteData["fromDirection"][0::2] = sides[deleted["toDirection"]]
+                                deleteData["toLink"][0::2] = deleted["fromLink"]
+                                deleteData["toDirection"][0::2] = sides[deleted["fromDirection"]]
+                                deleteData["fromLink"][1::2] = deleted["fromLink"]
+                                deleteData["fromDirection"][1::2] = sides[deleted["fromDirection"]]
+                                deleteData["toLink"][1::2] = deleted["toLink"]
+                                deleteData["toDirection"][1::2] = sides[deleted["toDirection"]]
+                                tableDeleteDirect.append(deleteData)
+                            remaining = directData[alive]
+                            if len(remaining)>0:
+                                tableData = np.zeros(len(remaining), dtype=tableDirect.dtype)
+                                tableData["fromLink"] = remaining["fromLink"]
+                                tableData["fromDirection"] = sides[remaining["fromDirection"]]
+                                tableData["toLink"] = remaining["toLink"]
+                                tableData["toDirection"] = sides[remaining["toDirection"]]
+                                tableData["number"] = np.minimum(remaining["number"],maximumFrequency)
+                                tableData["distance"] = remaining["distance"]
+                                tableData["splitDirection"] = directions[alive]
+                                tableData["reverseBase"] = np.where(directions[alive]==b"f",0,reverseBases[alive])
+                                tableData["forwardBase"] = np.where(directions[alive]==b"r",0,forwardBases[alive])
+                                tableData["problematic"] = problematic[alive]
+                                tableDirect.append(tableData)
 
                         #store paired data for not directly connected entries
                         if (len(unlinkedEntries)>0):
@@ -1320,46 +1642,10 @@ class Storage:
         shm.close()
             
             
-    def workerProcessReads(shutdown_event,queue_rawReads,queue_filteredReads,queue_finished,filenameBase,numberOfKmers,
-                     numberOfPartitions,numberOfDirect,maximumFrequency,maximumReadLength,shm_kmer_name,shm_direct_name):
-
-        #prevent garbage collecting for shared memory
-        remove_shm_from_resource_tracker()
-        
-        logger = logging.getLogger("{}.worker.index".format(__name__))
-
-        shm_kmer = shared_memory.SharedMemory(shm_kmer_name)
-        shm_direct = shared_memory.SharedMemory(shm_direct_name)
-        
-        shm_kmer_partition = np.dtype(haplotyping.index.Database.getUint(numberOfPartitions)).type
-        shm_kmer_number = np.dtype(haplotyping.index.Database.getUint(maximumFrequency)).type
-        shm_kmer_reference = np.dtype(haplotyping.index.Database.getUint(numberOfDirect)).type
-        shm_kmer_numberLeftRight = np.dtype("uint8").type
-
-        shm_direct_kmer = np.dtype(haplotyping.index.Database.getUint(numberOfKmers)).type
-        shm_direct_info = np.dtype("uint8").type
-        kmer_properties = np.ndarray((numberOfKmers,), 
-                                     dtype=[("partition",shm_kmer_partition),
-                                            ("number",shm_kmer_number),
-                                            ("reference",shm_kmer_reference),
-                                            ("numberLeftRight",shm_kmer_numberLeftRight)], 
-                                     buffer=shm_kmer.buf)
-        direct_properties = np.ndarray((numberOfDirect,), 
-                                     dtype=[("ckmer",shm_direct_kmer),("info",shm_direct_info)], 
-                                     buffer=shm_direct.buf)
-
-        def getRead(counters, structureIterator, stepData,pytablesStorageWorker):
-            row = next(structureIterator)
-            counters[0]=counters[1]
-            counters[1]+=row[0]
-            rowData = stepData[counters[0]-counters[2]:counters[1]-counters[2]]
-            if counters[1]>counters[3]:
-                counters[2] = counters[3]
-                counters[3] += counters[4]
-                stepData = pytablesStorageWorker.root.readRawData[counters[2]:counters[3]]
-                rowData = np.append(rowData,stepData[0:counters[1]-counters[2]])
-            return row, rowData, counters, structureIterator, stepData
-
+    def read_filters(kmer_properties,direct_properties):
+        """
+        Filter functions for single reads and batches of reads, given the k-mer properties and direct connections
+        """
         def _getNeighbours(nodeId):
             neighbours = direct_properties[kmer_properties[nodeId][2]:
                                       kmer_properties[nodeId][2]+kmer_properties[nodeId][3]]
@@ -1490,6 +1776,142 @@ class Storage:
                 filtered = _filterByType(newRow,newTypes,filtered)
             return (filtered,repairs,breaks)
 
+        def filterReadBatch(rawData, lengths):
+            """
+            Filter a batch of reads at once, reads with a possible repair are filtered one by one
+            """
+            filtered = [[] for i in range(len(lengths))]
+            repairs = 0
+            breaks = 0
+            numberOfNodes = len(rawData)
+            if numberOfNodes==0:
+                return (filtered,repairs,breaks)
+            data = rawData.astype("int64")
+            offsets = np.concatenate(([0],np.cumsum(lengths)))
+            reads = np.repeat(np.arange(len(lengths)),lengths)
+            starts = np.zeros(numberOfNodes, dtype=bool)
+            starts[offsets[:-1][lengths>0]] = True
+            #neighbours for all nodes
+            numbers = kmer_properties["numberLeftRight"][data].astype("int64")
+            positions = np.repeat(np.arange(numberOfNodes),numbers)
+            entries = (np.repeat(kmer_properties["reference"][data].astype("int64")-np.cumsum(numbers)+numbers,numbers)
+                       + np.arange(len(positions)))
+            neighbours = direct_properties["ckmer"][entries].astype("int64")
+            info = direct_properties["info"][entries]
+            right = (info&1)==1
+            flagged = (info&2)==2
+            numberLeft = np.bincount(positions[~right], minlength=numberOfNodes)
+            numberRight = np.bincount(positions[right], minlength=numberOfNodes)
+            #next node is neighbour (forward) and previous node is neighbour (backward)
+            following = np.append(~starts[1:],False)
+            nextMatch = following[positions] & (neighbours==data[np.minimum(positions+1,numberOfNodes-1)])
+            previousMatch = (~starts[positions]) & (neighbours==data[np.maximum(positions-1,0)])
+            def matched(selection):
+                return np.bincount(positions[selection], minlength=numberOfNodes)>0
+            forwardLeft = (matched(nextMatch & ~right & flagged)*1) | (matched(nextMatch & ~right & ~flagged)*2)
+            forwardRight = (matched(nextMatch & right & flagged)*1) | (matched(nextMatch & right & ~flagged)*2)
+            backward = (matched(previousMatch & ~right)*8) | (matched(previousMatch & right)*4)
+            del positions, entries, neighbours, info, right, flagged, nextMatch, previousMatch
+            #pairs of nodes, given the outgoing direction of the first node
+            pairs = np.flatnonzero(~starts)
+            def connect(direction):
+                forwardLeftPairs = np.where((direction==0) | ((direction&1)==1), forwardLeft[pairs-1], 0)
+                forwardRightPairs = np.where((direction==0) | ((direction&2)==2), forwardRight[pairs-1], 0)
+                nodeDirection = direction | ((forwardLeftPairs>0)*4) | ((forwardRightPairs>0)*8)
+                newNodeDirection = forwardLeftPairs | forwardRightPairs | backward[pairs]
+                return ((nodeDirection>0) & (newNodeDirection>0),nodeDirection,newNodeDirection)
+            #the direction depends on the connection of the previous pair: 
+            #resolve with the last pair not depending on the previous one and the number of negations since
+            first = starts[pairs-1]
+            previousDirection = backward[pairs-1]>>2
+            (connected0,_,_) = connect(np.zeros(len(pairs), dtype="int64"))
+            (connected1,_,_) = connect(previousDirection)
+            constant = first | (connected0==connected1)
+            negations = np.cumsum(~constant & connected0)
+            lastConstant = np.maximum.accumulate(np.where(constant,np.arange(len(pairs)),0))
+            connected = connected0[lastConstant] ^ (((negations-negations[lastConstant])&1)==1)
+            previousConnected = np.concatenate(([False],connected[:-1])) & ~first
+            direction = np.where(previousConnected,previousDirection,0)
+            (connected,nodeDirection,newNodeDirection) = connect(direction)
+            #no direct connection with known direction: possible repair
+            slow = np.zeros(len(lengths), dtype=bool)
+            slow[reads[pairs[~connected & (direction>0)]]] = True
+            fast = ~slow[reads]
+            breaks += np.count_nonzero(~connected & fast[pairs])
+            #types: 0 - single connected, 1 - splitting to the left, 2 - splitting to the right , 3 - both
+            backwardNumber = (numberLeft[pairs-1]*((nodeDirection&4)==4)) + (numberRight[pairs-1]*((nodeDirection&8)==8))
+            forwardNumber = (numberLeft[pairs]*((newNodeDirection&1)==1)) + (numberRight[pairs]*((newNodeDirection&2)==2))
+            types = np.zeros(numberOfNodes, dtype="uint8")
+            types[pairs[connected & (backwardNumber>1)]] = 1
+            types[pairs[connected & (forwardNumber>1)]-1] |= 2
+            #segments between breaks, filter by type (see _filterByType)
+            segmentStarts = starts.copy()
+            segmentStarts[pairs[~connected]] = True
+            segments = np.cumsum(segmentStarts)-1
+            segmentStarts = np.flatnonzero(segmentStarts)
+            segmentSums = np.add.reduceat(data,segmentStarts)
+            reduced = np.flatnonzero((types>0) & fast)
+            reducedSegments = segments[reduced]
+            reducedTypes = types[reduced]
+            reducedFirst = np.concatenate(([True],reducedSegments[1:]!=reducedSegments[:-1]))
+            reducedLast = np.concatenate((reducedSegments[1:]!=reducedSegments[:-1],[True]))
+            reducedFiltering = ((reducedFirst & ((reducedTypes&2)==2)) | (reducedLast & ((reducedTypes&1)==1)))
+            reducedPairs = np.flatnonzero(~reducedFirst[1:] & ((reducedTypes[:-1]&2)==2) & ((reducedTypes[1:]&1)==1))
+            reducedFiltering[reducedPairs] = True
+            reducedFiltering[reducedPairs+1] = True
+            numberOfSegments = len(segmentStarts)
+            reducedNumber = np.bincount(reducedSegments, minlength=numberOfSegments)
+            filteringNumber = np.bincount(reducedSegments[reducedFiltering], minlength=numberOfSegments)
+            filteringIndex = np.flatnonzero(reducedFiltering)
+            filteringFirst = np.full(numberOfSegments, len(reduced), dtype="int64")
+            filteringLast = np.full(numberOfSegments, -1, dtype="int64")
+            np.minimum.at(filteringFirst,reducedSegments[filteringIndex],filteringIndex)
+            np.maximum.at(filteringLast,reducedSegments[filteringIndex],filteringIndex)
+            keep = ((segmentSums>2) & (reducedNumber>2) & 
+                    ((filteringNumber>2) | ((filteringNumber==2) & (filteringLast-filteringFirst+1>2))))
+            selection = reducedFiltering & keep[reducedSegments]
+            keptSegments = np.flatnonzero(keep)
+            entries = np.split(rawData[reduced[selection]],np.cumsum(filteringNumber[keptSegments])[:-1])
+            for (read,entry) in zip(reads[segmentStarts[keptSegments]],entries):
+                filtered[read].append(entry)
+            #reads with a possible repair
+            for read in np.flatnonzero(slow):
+                (filtered[read],repairs,breaks) = filterReadData(rawData[offsets[read]:offsets[read+1]],repairs,breaks)
+            return (filtered,repairs,breaks)
+
+        return (filterReadData,filterReadBatch,)
+
+
+    def workerProcessReads(shutdown_event,queue_rawReads,queue_filteredReads,queue_finished,filenameBase,numberOfKmers,
+                     numberOfPartitions,numberOfDirect,maximumFrequency,maximumReadLength,shm_kmer_name,shm_direct_name):
+
+        #prevent garbage collecting for shared memory
+        remove_shm_from_resource_tracker()
+        
+        logger = logging.getLogger("{}.worker.index".format(__name__))
+
+        shm_kmer = shared_memory.SharedMemory(shm_kmer_name)
+        shm_direct = shared_memory.SharedMemory(shm_direct_name)
+        
+        shm_kmer_partition = np.dtype(haplotyping.index.Database.getUint(numberOfPartitions)).type
+        shm_kmer_number = np.dtype(haplotyping.index.Database.getUint(maximumFrequency)).type
+        shm_kmer_reference = np.dtype(haplotyping.index.Database.getUint(numberOfDirect)).type
+        shm_kmer_numberLeftRight = np.dtype("uint8").type
+
+        shm_direct_kmer = np.dtype(haplotyping.index.Database.getUint(numberOfKmers)).type
+        shm_direct_info = np.dtype("uint8").type
+        kmer_properties = np.ndarray((numberOfKmers,), 
+                                     dtype=[("partition",shm_kmer_partition),
+                                            ("number",shm_kmer_number),
+                                            ("reference",shm_kmer_reference),
+                                            ("numberLeftRight",shm_kmer_numberLeftRight)], 
+                                     buffer=shm_kmer.buf)
+        direct_properties = np.ndarray((numberOfDirect,), 
+                                     dtype=[("ckmer",shm_direct_kmer),("info",shm_direct_info)], 
+                                     buffer=shm_direct.buf)
+
+        (filterReadData,filterReadBatch,) = Storage.read_filters(kmer_properties,direct_properties)
+
         while not shutdown_event.is_set():
             try:
                 item = queue_rawReads.get(block=True, timeout=1)
@@ -1518,7 +1940,6 @@ class Storage:
                         readPartitionInfo = pytablesStorageWorkerFiltered.root.readPartitionInfo
                         readPaired = pytablesStorageWorkerFiltered.root.readPaired
                         #compute and store read partition
-                        counters = [0,0,0,Storage.stepSizeStorage,Storage.stepSizeStorage] #n0,n1,m0,m1,stepSize
                         #buffer
                         computedPartitionData = []
                         computedPartitionInfo = []
@@ -1528,60 +1949,64 @@ class Storage:
                         totalRepairs = 0
                         totalBreaks = 0
                         try:
-                            structureIterator = pytablesStorageWorkerRaw.root.readRawInfo.iterrows()
-                            stepData = pytablesStorageWorkerRaw.root.readRawData[counters[2]:counters[3]]
-                            while True:
-                                row, rowData, counters, structureIterator, stepData = getRead(
-                                    counters, structureIterator, stepData, pytablesStorageWorkerRaw)
-                                assert row[0]==len(rowData)
+                            readRawInfo = pytablesStorageWorkerRaw.root.readRawInfo
+                            readRawData = pytablesStorageWorkerRaw.root.readRawData
+                            dataStart = 0
+                            for i in range(0,readRawInfo.shape[0],Storage.stepSizeReads):
+                                infoData = readRawInfo.read(i,i+Storage.stepSizeReads)
+                                lengths = infoData["length"].astype("int64")
+                                rawData = readRawData[dataStart:dataStart+int(lengths.sum())]
+                                dataStart+=len(rawData)
+                                assert len(rawData)==lengths.sum()
                                 #filter
-                                filteredRowData,totalRepairs,totalBreaks = filterReadData(rowData,totalRepairs,totalBreaks)
-                                #only if filtered set non-empty
-                                if len(filteredRowData)>0:   
-                                    rowNodes = []
-                                    for filteredEntry in filteredRowData:
-                                        rowNodes.extend(filteredEntry)
-                                        partitions = [kmer_properties[nodeId][0] for nodeId in filteredEntry]
-                                        #store filtered read data
-                                        computedPartitionData.extend(filteredEntry)
-                                        readPartitions = multimode(partitions)
-                                        if len(readPartitions)==1:
-                                            computedPartitionInfo.append((len(filteredEntry),readPartitions[0],))
+                                filteredData,batchRepairs,batchBreaks = filterReadBatch(rawData,lengths)
+                                totalRepairs+=batchRepairs
+                                totalBreaks+=batchBreaks
+                                for row,filteredRowData in zip(infoData,filteredData):
+                                    #only if filtered set non-empty
+                                    if len(filteredRowData)>0:   
+                                        rowNodes = []
+                                        for filteredEntry in filteredRowData:
+                                            rowNodes.extend(filteredEntry)
+                                            partitions = [kmer_properties[nodeId][0] for nodeId in filteredEntry]
+                                            #store filtered read data
+                                            computedPartitionData.extend(filteredEntry)
+                                            readPartitions = multimode(partitions)
+                                            if len(readPartitions)==1:
+                                                computedPartitionInfo.append((len(filteredEntry),readPartitions[0],))
+                                            else:
+                                                sizes = [kmer_properties[nodeId][1] for nodeId in filteredEntry]
+                                                readPartitionSizes = {}
+                                                for p in readPartitions:
+                                                    selection = np.where(partitions==p)[0]
+                                                    readPartitionSizes[p] = max(np.array(sizes)[selection])
+                                                computedPartitionInfo.append((
+                                                    len(filteredEntry),min(readPartitionSizes, key=readPartitionSizes.get),))
+                                        #handle paired data
+                                        #TODO: additional filter direct connected???
+                                        if row[1]==1:
+                                            previousRead = [(nodeId,kmer_properties[nodeId][1]) for nodeId in rowNodes]
+                                            previousPaired = min(previousRead,key=lambda x:(x[1],x[0]))[0]
+                                        elif row[1]==2 and not previousPaired==None:
+                                            currentRead = [(nodeId,kmer_properties[nodeId][1]) for nodeId in rowNodes]
+                                            currentPaired = min(currentRead,key=lambda x:(x[1],x[0]))[0]
+                                            if not (previousPaired==currentPaired or previousPaired in rowNodes):
+                                                computedPaired.append((previousPaired,currentPaired,))
+                                                computedPaired.append((currentPaired,previousPaired,))
                                         else:
-                                            sizes = [kmer_properties[nodeId][1] for nodeId in filteredEntry]
-                                            readPartitionSizes = {}
-                                            for p in readPartitions:
-                                                selection = np.where(partitions==p)[0]
-                                                readPartitionSizes[p] = max(np.array(sizes)[selection])
-                                            computedPartitionInfo.append((
-                                                len(filteredEntry),min(readPartitionSizes, key=readPartitionSizes.get),))
-                                    #handle paired data
-                                    #TODO: additional filter direct connected???
-                                    if row[1]==1:
-                                        previousRead = [(nodeId,kmer_properties[nodeId][1]) for nodeId in rowNodes]
-                                        previousPaired = min(previousRead,key=lambda x:(x[1],x[0]))[0]
-                                    elif row[1]==2 and not previousPaired==None:
-                                        currentRead = [(nodeId,kmer_properties[nodeId][1]) for nodeId in rowNodes]
-                                        currentPaired = min(currentRead,key=lambda x:(x[1],x[0]))[0]
-                                        if not (previousPaired==currentPaired or previousPaired in rowNodes):
-                                            computedPaired.append((previousPaired,currentPaired,))
-                                            computedPaired.append((currentPaired,previousPaired,))
+                                            previousPaired = None
                                     else:
                                         previousPaired = None
-                                else:
-                                    previousPaired = None
-                                #update to storage
-                                if len(computedPartitionData)>Storage.stepSizeStorage:
-                                    readPartitionData.append(tuple(computedPartitionData))
-                                    readPartitionInfo.append(computedPartitionInfo)
-                                    computedPartitionData = []
-                                    computedPartitionInfo = []
-                                    if len(computedPaired)>0:
-                                        computedPaired = sorted(computedPaired,key=lambda x:(x[0],x[1]))
-                                        readPaired.append(computedPaired)
-                                        computedPaired = []
-                        except StopIteration:
-                            pass
+                                    #update to storage
+                                    if len(computedPartitionData)>Storage.stepSizeStorage:
+                                        readPartitionData.append(tuple(computedPartitionData))
+                                        readPartitionInfo.append(computedPartitionInfo)
+                                        computedPartitionData = []
+                                        computedPartitionInfo = []
+                                        if len(computedPaired)>0:
+                                            computedPaired = sorted(computedPaired,key=lambda x:(x[0],x[1]))
+                                            readPaired.append(computedPaired)
+                                            computedPaired = []
                         finally:                                
                             #update last entries to storage
                             if len(computedPartitionData)>0:
@@ -2013,9 +2438,10 @@ class Storage:
                          ("minimumLength",haplotyping.index.Database.getUint(maximumLength)),
                          ("number",haplotyping.index.Database.getUint(maximumNumber))]
         dtCycle=np.dtype(dtypeCycleList)
+        optionsCycle=haplotyping.index.Database.getStorageOptions(h5file,(numberOfCycles,),dtCycle)
         dsCycle=h5file["/relations/"].create_dataset("cycle",(numberOfCycles,), 
-                                                     dtype=dtCycle, chunks=None, 
-                                                     compression="gzip", compression_opts=9)
+                                                     dtype=dtCycle, 
+                                                     **optionsCycle)
         maximumCycleLength = 0
         maximumCycleNumber = 0
         for i in range(0,numberOfCycles,Storage.stepSizeStorage):
@@ -2039,9 +2465,10 @@ class Storage:
                          ("minimumLength",haplotyping.index.Database.getUint(maximumLength)),
                          ("number",haplotyping.index.Database.getUint(maximumNumber))]
         dtReversal=np.dtype(dtypeReversalList)
+        optionsReversal=haplotyping.index.Database.getStorageOptions(h5file,(numberOfReversals,),dtReversal)
         dsReversal=h5file["/relations/"].create_dataset("reversal",(numberOfReversals,), 
-                                                        dtype=dtReversal, chunks=None, 
-                                                        compression="gzip", compression_opts=9)
+                                                        dtype=dtReversal, 
+                                                        **optionsReversal)
         maximumReversalLength = 0
         maximumReversalNumber = 0
         for i in range(0,numberOfReversals,Storage.stepSizeStorage):
@@ -2069,9 +2496,10 @@ class Storage:
                          ("distance",haplotyping.index.Database.getUint(maximumDistance)),
                          ("problematic","uint8")]
         dtDirect=np.dtype(dtypeDirectList)
+        optionsDirect=haplotyping.index.Database.getStorageOptions(h5file,(numberOfDirectRelations,),dtDirect)
         dsDirect=h5file["/relations/"].create_dataset("direct",(numberOfDirectRelations,), 
-                                                      dtype=dtDirect, chunks=None, 
-                                                      compression="gzip", compression_opts=9)
+                                                      dtype=dtDirect, 
+                                                      **optionsDirect)
         #process direct relations
         directCounter = 0
         previousStepData = []
@@ -2089,6 +2517,8 @@ class Storage:
                 stepData = np.delete(stepData, np.where(stepData["fromLink"] == lastFromLink))
             else:
                 previousStepData = [] 
+            #fixed order for the connections of each splitting k-mer, independent of the workers
+            stepData = np.sort(stepData, order=["fromLink","fromDirection","toLink","toDirection","distance"])
             #get relevant ckmer data
             firstFromLink = stepData[0]["fromLink"]
             lastFromLink = stepData[-1]["fromLink"]
@@ -2156,9 +2586,11 @@ class Storage:
                         ("distance",haplotyping.index.Database.getUint(maximumDistance)),
                         ("number",haplotyping.index.Database.getUint(maximumNumber)),]
             dtFrequencyHistogramDistance=np.dtype(dtypeFrequencyHistogramDistanceList)
+            optionsFrequencyHistogramDistance=haplotyping.index.Database.getStorageOptions(
+                h5file,(len(frequencyHistogram["distance"]),),dtFrequencyHistogramDistance)
             dsFrequencyHistogramDistance=h5file["/histogram/"].create_dataset("distance",
-                  (len(frequencyHistogram["distance"]),), dtype=dtFrequencyHistogramDistance, chunks=None, 
-                  compression="gzip", compression_opts=9)
+                  (len(frequencyHistogram["distance"]),), dtype=dtFrequencyHistogramDistance, 
+                  **optionsFrequencyHistogramDistance)
             logger.info("store {} entries direct distances histogram".format(
                 len(frequencyHistogram["distance"])))
             #store histogram
@@ -2174,9 +2606,10 @@ class Storage:
         dtypePairedList=[("fromLink",haplotyping.index.Database.getUint(numberOfKmers)),
                          ("toLink",haplotyping.index.Database.getUint(numberOfKmers))]
         dtPaired=np.dtype(dtypePairedList)
+        optionsPaired=haplotyping.index.Database.getStorageOptions(h5file,(numberOfPaired,),dtPaired)
         dsPaired=h5file["/relations/"].create_dataset("paired",(numberOfPaired,), 
-                                                      dtype=dtPaired, chunks=None, 
-                                                      compression="gzip", compression_opts=9)
+                                                      dtype=dtPaired, 
+                                                      **optionsPaired)
         for i in range(0,numberOfPaired,Storage.stepSizeStorage):
             stepData = pytablesStorage.root.readPaired[i:i+Storage.stepSizeStorage]
             for j in range(len(stepData)):
@@ -2221,9 +2654,12 @@ class Storage:
             totalUnfilteredReads,totalUnfilteredNodes,totalFilteredReads,totalFilteredNodes))
         logger.debug("{} repairs and {} breaks in these processed reads".format(totalReadRepairs,totalReadBreaks))
         
+        dtReadData=haplotyping.index.Database.getUint(numberOfKmers)
+        optionsReadData=haplotyping.index.Database.getStorageOptions(
+            h5file,(numberOfReadPartitionData,),dtReadData)
         dsReadData=h5file["/relations/"].create_dataset("readData",(numberOfReadPartitionData,), 
-                                                      dtype=haplotyping.index.Database.getUint(numberOfKmers), 
-                                                      chunks=None, compression="gzip", compression_opts=9)
+                                                      dtype=dtReadData, 
+                                                      **optionsReadData)
         for i in range(0,numberOfReadPartitionData,Storage.stepSizeStorage):
             stepData = pytablesStorage.root.readPartitionData[i:i+Storage.stepSizeStorage]
             dsReadData[i:i+len(stepData)] = stepData
@@ -2231,9 +2667,11 @@ class Storage:
         dtypeReadInfoList=[("length",haplotyping.index.Database.getUint(maxReadLength)),
                            ("number",haplotyping.index.Database.getUint(maxReadNumber))]
         dtReadInfo=np.dtype(dtypeReadInfoList)
+        optionsReadInfo=haplotyping.index.Database.getStorageOptions(
+            h5file,(numberOfReadPartitionInfo,),dtReadInfo)
         dsReadInfo=h5file["/relations/"].create_dataset("readInfo",(numberOfReadPartitionInfo,), 
-                                                      dtype=dtReadInfo, chunks=None, 
-                                                      compression="gzip", compression_opts=9)
+                                                      dtype=dtReadInfo, 
+                                                      **optionsReadInfo)
         for i in range(0,numberOfReadPartitionInfo,Storage.stepSizeStorage):
             stepData = pytablesStorage.root.readPartitionInfo[i:i+Storage.stepSizeStorage]
             dsReadInfo[i:i+len(stepData)] = stepData
@@ -2245,9 +2683,11 @@ class Storage:
                                     ("link",haplotyping.index.Database.getUint(numberOfReadPartitionInfo)),
                                     ("number",haplotyping.index.Database.getUint(maxTotalReadNumber))])]
         dtReadPartition=np.dtype(dtypeReadPartitionList)
+        optionsReadPartition=haplotyping.index.Database.getStorageOptions(
+            h5file,(numberOfReadPartition,),dtReadPartition)
         dsReadPartition=h5file["/relations/"].create_dataset("readPartition",(numberOfReadPartition,), 
-                                                      dtype=dtReadPartition, chunks=None, 
-                                                      compression="gzip", compression_opts=9)
+                                                      dtype=dtReadPartition, 
+                                                      **optionsReadPartition)
         for i in range(0,numberOfReadPartition,Storage.stepSizeStorage):
             stepData = pytablesStorage.root.readPartition[i:i+Storage.stepSizeStorage]
             dsReadPartition[i:i+len(stepData)] = [((item[0],item[1]),(item[2],item[3])) for item in stepData]
@@ -2258,158 +2698,232 @@ class Storage:
     """
     Partition k-mers
     """    
-    def partitionKmers(h5file,pytablesStorage,maxNumberOfPartitions):
+    def unique_links(fromLinks,toLinks,numberOfKmers):
+        """
+        Links without duplicates, sorted on the first node and in order of first occurrence
+        """
+        keys = (fromLinks.astype("int64")*numberOfKmers) + toLinks
+        (keys,positions) = np.unique(keys, return_index=True)
+        keys = keys[np.lexsort((positions,keys//numberOfKmers))]
+        return ((keys//numberOfKmers).astype(fromLinks.dtype),(keys%numberOfKmers).astype(toLinks.dtype))
+
+    def csr_graph(fromLinks,toLinks,numberOfKmers):
+        """
+        Adjacency in compressed sparse row format (indptr, indices) from links,
+        duplicates are removed and the order of first occurrence is kept
+        """
+        (fromLinks,indices) = Storage.unique_links(fromLinks,toLinks,numberOfKmers)
+        indptr = np.zeros(numberOfKmers+1, dtype="int64")
+        np.cumsum(np.bincount(fromLinks, minlength=numberOfKmers), out=indptr[1:])
+        return (indptr,indices)
+
+    def partition_graph(indptr,indices,numberOfPartitions,partitioner="metis"):
+        """
+        Partition the symmetric graph in compressed sparse row format, returns the partition for each node
+        """
+        numberOfNodes = len(indptr)-1
+        if numberOfPartitions<=1:
+            return np.zeros(numberOfNodes, dtype="int64")
+        elif partitioner=="metis":
+            idx = np.dtype(metis.idx_t)
+            xadj = np.ascontiguousarray(indptr, dtype=idx)
+            adjncy = np.ascontiguousarray(indices, dtype=idx)
+            graph = metis.METIS_Graph(metis.idx_t(numberOfNodes), metis.idx_t(1), 
+                                      np.ctypeslib.as_ctypes(xadj), np.ctypeslib.as_ctypes(adjncy), 
+                                      None, None, None)
+            (objval,partitions) = metis.part_graph(graph,numberOfPartitions)
+            return np.array(partitions, dtype="int64")
+        elif partitioner=="networkit":
+            nodes = np.repeat(np.arange(numberOfNodes, dtype="int64"),np.diff(indptr))
+            selection = nodes<indices
+            g = nk.GraphFromCoo((nodes[selection],indices[selection].astype("int64")), n=numberOfNodes)
+            del nodes, selection
+            sp = nk.community.SpectralPartitioner(g, numberOfPartitions, balanced=True)
+            sp.run()
+            return np.array(sp.getPartition().getVector(), dtype="int64")
+        else:
+            raise Exception("unknown partitioner '{}'".format(partitioner))
+
+    def partitionKmers(h5file,pytablesStorage,maxNumberOfPartitions,partitioner="metis"):
         #initialize
         logger = logging.getLogger(__name__)  
-        edges = []
         
         #compute edges for partition graph
         numberOfKmers = h5file["split"]["ckmer"].shape[0]
         numberOfBases = h5file["split"]["base"].shape[0]
         numberOfDirect = h5file["relations"]["direct"].shape[0]
-        maxNumberOfPartitions = int(numberOfKmers ** (2/3))
-        previousVertex = 0
-        previousNeighbours = []
+        if not maxNumberOfPartitions>0:
+            maxNumberOfPartitions = int(numberOfKmers ** (2/3))
+        linkType = haplotyping.index.Database.getUint(numberOfKmers)
         logger.debug("create graph for partitioning")
+        fromLinks = []
+        toLinks = []
+        remainder = None
         for i in range(0,numberOfDirect,Storage.stepSizeStorage):
             block = h5file["relations"]["direct"][i:i+Storage.stepSizeStorage]
             logger.debug("add edges: {}-{} of {} ({}%)".format(
                 i,i+len(block),numberOfDirect,int(100*(i+len(block))/numberOfDirect)))
-            for j in range(len(block)):
-                while block[j][0][0]>previousVertex:
-                    edges.append(tuple(previousNeighbours))
-                    previousVertex+=1
-                    previousNeighbours = []
-                if not block[j][1][0] in previousNeighbours:
-                    previousNeighbours.append(block[j][1][0])
-        while numberOfKmers>previousVertex:
-            edges.append(tuple(previousNeighbours))
-            previousVertex+=1
-            previousNeighbours = []
+            links = np.stack((block["from"]["ckmerLink"],block["to"]["ckmerLink"]),axis=1).astype(linkType)
+            if not remainder is None:
+                links = np.concatenate((remainder,links))
+            #keep the last node for the next block, so duplicates are removed within a block
+            position = (np.searchsorted(links[:,0],links[-1,0],side="left") 
+                        if i+Storage.stepSizeStorage<numberOfDirect else len(links))
+            uniqueLinks = Storage.unique_links(links[:position,0],links[:position,1],numberOfKmers)
+            fromLinks.append(uniqueLinks[0])
+            toLinks.append(uniqueLinks[1])
+            remainder = links[position:]
+        fromLinks = np.concatenate(fromLinks) if len(fromLinks)>0 else np.zeros(0, dtype=linkType)
+        toLinks = np.concatenate(toLinks) if len(toLinks)>0 else np.zeros(0, dtype=linkType)
+        (indptr,indices) = Storage.csr_graph(fromLinks,toLinks,numberOfKmers)
+        degrees = np.diff(indptr)
 
         #check symmetry graph
-        n_self = 0
-        n_asymmetric = 0
-        for i in range(len(edges)):
-            if i in edges[i]:
-                n_self+=1
-            for j in edges[i]:
-                if not i in edges[j]:
-                    n_asymmetric+=1
+        keys = np.sort((fromLinks.astype("int64")*numberOfKmers) + toLinks)
+        reversedKeys = (toLinks.astype("int64")*numberOfKmers) + fromLinks
+        n_self = np.count_nonzero(fromLinks==toLinks)
+        positions = np.minimum(np.searchsorted(keys,reversedKeys),max(0,len(keys)-1))
+        n_asymmetric = np.count_nonzero(keys[positions]!=reversedKeys) if len(keys)>0 else 0
+        del keys, reversedKeys
         logger.debug("detected {} self connected nodes and {} asymmetric connections".format(
             n_self,n_asymmetric))
             
         #update disconnected or only self connected
-        disconnected = [i for i in range(len(edges)) if len(edges[i])==0]
-        selfconnected = [i for i in range(len(edges)) if len(edges[i])==1 and i in edges[i]]
+        disconnected = np.flatnonzero(degrees==0)
+        selfconnected = np.flatnonzero(degrees==1)
+        selfconnected = selfconnected[indices[indptr[selfconnected]]==selfconnected]
         logger.debug("connect {} disconnected and {} only self-connected nodes to base connections".format(
             len(disconnected),len(selfconnected)))
 
         #combine
-        disconnected = disconnected + selfconnected
-        disconnected.sort()
+        disconnected = np.sort(np.concatenate((disconnected,selfconnected)))
 
-        #create memory for links with bases
+        #bases for the disconnected k-mers
         bases = h5file["split/base"]
         ckmers = h5file["split/ckmer"]
-        disconnectedRows = ckmers[disconnected]
-        for ckmerId,ckmerRow in zip(disconnected,disconnectedRows):
-            if ckmerRow[1]==b"l":
-                baseIds = [ckmerRow[3][0]]
-            elif ckmerRow[1]==b"r":
-                baseIds = [ckmerRow[3][1]]
-            elif ckmerRow[1]==b"b":
-                baseIds = [ckmerRow[3][0],ckmerRow[3][1]]
-            else:
-                baseIds = []
-            ckmerLinks = set()
-            for baseId in baseIds:
-                ckmerLinks.update([baseEntry[1] for baseEntry in bases[baseId][2] if baseEntry[0]>0])
-                ckmerLinks.remove(ckmerId) 
-                #keep it symmetric
-                for ckmerLink in ckmerLinks:
-                    if not ckmerLink in edges[ckmerId]:
-                        edges[ckmerId] = edges[ckmerId] + (ckmerLink,)
-                    if not ckmerId in edges[ckmerLink]:
-                        edges[ckmerLink] = edges[ckmerLink] + (ckmerId,)
+        baseNodes = []
+        baseIds = []
+        for i in range(0,numberOfKmers,Storage.stepSizeStorage):
+            selection = disconnected[np.searchsorted(disconnected,i):
+                                     np.searchsorted(disconnected,i+Storage.stepSizeStorage)]
+            if len(selection)>0:
+                rows = ckmers[i:i+Storage.stepSizeStorage][selection-i]
+                for side,types in [("leftSplit",[b"l",b"b"],),("rightSplit",[b"r",b"b"],)]:
+                    sideSelection = np.isin(rows["type"],types)
+                    baseNodes.append(selection[sideSelection])
+                    baseIds.append(rows["rightSplitBaseLink"][side][sideSelection].astype("int64"))
+        if len(baseNodes)>0:
+            baseNodes = np.concatenate(baseNodes)
+            baseIds = np.concatenate(baseIds)
+            #links from the bases
+            letters = haplotyping.index.Database.letters
+            uniqueBaseIds = np.unique(baseIds)
+            baseLinks = np.zeros((len(uniqueBaseIds),len(letters)), dtype="int64")
+            baseNumbers = np.zeros((len(uniqueBaseIds),len(letters)), dtype="int64")
+            for i in range(0,numberOfBases,Storage.stepSizeStorage):
+                start = np.searchsorted(uniqueBaseIds,i)
+                end = np.searchsorted(uniqueBaseIds,i+Storage.stepSizeStorage)
+                if end>start:
+                    rows = bases[i:i+Storage.stepSizeStorage][uniqueBaseIds[start:end]-i]
+                    for j in range(len(letters)):
+                        baseLinks[start:end,j] = rows["branches"][letters[j]]["ckmerLink"]
+                        baseNumbers[start:end,j] = rows["branches"][letters[j]]["number"]
+            positions = np.searchsorted(uniqueBaseIds,baseIds)
+            addedFrom = np.repeat(baseNodes,len(letters))
+            addedTo = baseLinks[positions].ravel()
+            selection = (baseNumbers[positions].ravel()>0) & (addedTo!=addedFrom)
+            addedFrom = addedFrom[selection]
+            addedTo = addedTo[selection]
+            #keep it symmetric, added after the existing connections
+            nodes = np.concatenate((np.repeat(np.arange(numberOfKmers),degrees),addedFrom,addedTo))
+            neighbours = np.concatenate((indices,addedTo,addedFrom))
+            order = np.argsort(nodes, kind="stable")
+            (indptr,indices) = Storage.csr_graph(nodes[order],neighbours[order].astype(linkType),numberOfKmers)
+            degrees = np.diff(indptr)
+            del nodes, neighbours, order
+        del fromLinks, toLinks
 
         #connected components
-        g = nk.graph.Graph(weighted=False)
-        g.addNodes(len(edges))
-        for i in range(len(edges)):
-            for j in edges[i]:
-                g.addEdge(i,j)
+        nodes = np.repeat(np.arange(numberOfKmers, dtype="int64"),degrees)
+        selection = nodes<indices
+        g = nk.GraphFromCoo((nodes[selection],indices[selection].astype("int64")), n=numberOfKmers)
+        del selection
         cc = nk.components.ConnectedComponents(g)
         cc.run()
-        ccList = cc.getComponents()
-        logger.debug("found {} connected components".format(len(ccList)))
+        components = np.array(cc.getPartition().getVector(), dtype="int64")
+        del g, cc
+        (componentIds,components) = np.unique(components, return_inverse=True)
+        componentSizes = np.bincount(components)
+        logger.debug("found {} connected components".format(len(componentSizes)))
 
         #analyse connected components
-        nc_trivial = 0
-        nc_small = 0
-        trivialPartitions = []
-        smallPartitions = []
-        selectedNodes = []
-        partitionSize = int(len(edges)/maxNumberOfPartitions)
-        for component in ccList:
-            if len(component)<=2:
-                nc_trivial+=1
-                if (len(trivialPartitions)==0) or len(trivialPartitions[-1])>=partitionSize:
-                    trivialPartitions.append([])
-                trivialPartitions[-1].extend(component)
-            elif len(component)<=partitionSize:
-                nc_small+=1
-                smallPartitions.append(component)
-            else:
-                selectedNodes.extend(component)
+        partitionSize = max(1,int(numberOfKmers/maxNumberOfPartitions))
+        trivial = np.flatnonzero(componentSizes<=2)
+        small = np.flatnonzero((componentSizes>2) & (componentSizes<=partitionSize))
+        selected = componentSizes>max(2,partitionSize)
+        #trivial components fill partitions until the size is reached
+        componentPartitions = np.full(len(componentSizes), -1, dtype="int64")
+        cumulativeSizes = np.cumsum(componentSizes[trivial])
+        counts = []
+        start = 0
+        while start<len(trivial):
+            end = min(len(trivial),np.searchsorted(cumulativeSizes,
+                                       (cumulativeSizes[start-1] if start>0 else 0)+partitionSize,side="left")+1)
+            componentPartitions[trivial[start:end]] = len(counts)
+            counts.append(int(cumulativeSizes[end-1]-(cumulativeSizes[start-1] if start>0 else 0)))
+            start = end
         logger.debug("distribute {} trivial components with at most 2 nodes over {} partitions".format(
-            nc_trivial,len(trivialPartitions)))
+            len(trivial),len(counts)))
         logger.debug("assign {} small components with at most {} nodes to separate partitions".format(
-            nc_small,partitionSize))
+            len(small),partitionSize))
         
         #compute final partitions
-        partitions = [-1] * len(edges)
-        counts = []
-        for partition in trivialPartitions:
-            for node in partition:
-                partitions[node] = len(counts)
-            counts.append(len(partition))
-        for partition in smallPartitions:
-            for node in partition:
-                partitions[node] = len(counts)
-            counts.append(len(partition))
+        componentPartitions[small] = np.arange(len(counts),len(counts)+len(small))
+        counts.extend(componentSizes[small].tolist())
+        partitions = componentPartitions[components]
         numberOfPartitions = len(counts)
 
         #compute normal partitions
+        selectedNodes = np.flatnonzero(selected[components])
         if len(selectedNodes)>0:
             #recompute number of partitions
             newMaxNumberOfPartitions = int(len(selectedNodes)/partitionSize)
-            logger.debug("compute metis graph partitioning with at most {} partitions".format(
-                newMaxNumberOfPartitions))
-            #compute selected graph edges
-            selectedNodes.sort()
-            selectedMap = {selectedNodes[i]: i for i in range(len(selectedNodes))}
-            selectedEdges = [tuple([selectedMap[j] for j in edges[selectedNodes[i]]]) 
-                             for i in range(len(selectedNodes))]
-
-            m = metis.adjlist_to_metis(selectedEdges)
-            del selectedEdges
-            (objval,selectedPartitions) = metis.part_graph(m,newMaxNumberOfPartitions)
+            logger.debug("compute {} graph partitioning with at most {} partitions".format(
+                partitioner,newMaxNumberOfPartitions))
+            #compute selected graph edges, without self connections
+            selectedMap = np.full(numberOfKmers, -1, dtype="int64")
+            selectedMap[selectedNodes] = np.arange(len(selectedNodes))
+            selection = selected[components[nodes]] & (nodes!=indices)
+            selectedIndptr = np.zeros(len(selectedNodes)+1, dtype="int64")
+            np.cumsum(np.bincount(selectedMap[nodes[selection]], minlength=len(selectedNodes)), 
+                      out=selectedIndptr[1:])
+            selectedIndices = selectedMap[indices[selection]]
+            del selection, selectedMap
+
+            selectedPartitions = Storage.partition_graph(selectedIndptr,selectedIndices,
+                                                         newMaxNumberOfPartitions,partitioner)
+            del selectedIndptr, selectedIndices
             (selectedValues, selectedPartitions, selectedCounts) = np.unique(selectedPartitions, 
                                                  return_inverse=True, return_counts=True) 
             numberOfSelectedPartitions = len(selectedCounts)
             logger.debug("computed {} regular partitions".format(numberOfSelectedPartitions))
             #update final partitions
-            for i in range(len(selectedPartitions)):
-                partitions[selectedNodes[i]] = selectedPartitions[i] + numberOfPartitions
-            counts = counts + ([0] * numberOfSelectedPartitions)
-            for i in range(len(selectedCounts)):
-                counts[i + numberOfPartitions] = selectedCounts[i]
+            partitions[selectedNodes] = selectedPartitions + numberOfPartitions
+            counts.extend(selectedCounts.tolist())
             numberOfPartitions = len(counts)
             
         #some checks
-        assert len([p for p in partitions if p<0])==0
-        assert sum(counts) == len(edges)
+        assert np.count_nonzero(partitions<0)==0
+        assert sum(counts) == numberOfKmers
+
+        #edge-cut, connections between partitions
+        selection = (partitions[nodes]!=partitions[indices]) & (nodes<indices)
+        cuts = (np.bincount(partitions[nodes[selection]], minlength=numberOfPartitions) + 
+                np.bincount(partitions[indices[selection]], minlength=numberOfPartitions))
+        edgeCut = np.count_nonzero(selection)
+        logger.info("partitioned {} k-mers into {} partitions with edge-cut {} of {} connections".format(
+            numberOfKmers,numberOfPartitions,edgeCut,np.count_nonzero(nodes<indices)))
+        del nodes, selection
 
         #store partition in ckmer properties
         dsCkmer = h5file["/split/ckmer"]
@@ -2421,16 +2935,184 @@ class Storage:
         
         #store partition size
         h5file["/config/"].attrs["numberPartitions"]=numberOfPartitions  
-        dtypePartitionList=[("ckmer",haplotyping.index.Database.getUint(numberOfKmers))]
+        h5file["/config/"].attrs["partitionEdgeCut"]=edgeCut
+        dtypePartitionList=[("ckmer",haplotyping.index.Database.getUint(numberOfKmers)),
+                            ("cut",haplotyping.index.Database.getUint(int(cuts.max()) if len(cuts)>0 else 0))]
         dtPartition=np.dtype(dtypePartitionList)
+        optionsPartition=haplotyping.index.Database.getStorageOptions(
+            h5file,(numberOfPartitions,),dtPartition)
         dsPartition=h5file["/histogram/"].create_dataset("partition",(numberOfPartitions,), 
-                                                        dtype=dtPartition, chunks=None, 
-                                                        compression="gzip", compression_opts=9)
-        dsPartition[0:numberOfPartitions] = counts
-        
-        return numberOfPartitions 
-        
+                                                        dtype=dtPartition, 
+                                                        **optionsPartition)
+        partitionData = np.zeros(numberOfPartitions, dtype=dtPartition)
+        partitionData["ckmer"] = counts
+        partitionData["cut"] = cuts
+        dsPartition[0:numberOfPartitions] = partitionData
         
+        return numberOfPartitions
 
+    def storePartitionStatistics(h5file):
+        """
+        Add the reads and the estimated bytes loaded per query to the partition histogram
+        """
+        logger = logging.getLogger(__name__)
+        partitionData = h5file["/histogram/partition"][:]
+        readPartition = h5file["/relations/readPartition"][:]
+        numberOfPartitions = len(partitionData)
+        assert len(readPartition)==numberOfPartitions
+        #a query loads the read data and read info of the partition
+        reads = readPartition["readInfo"]["number"].astype("uint64")
+        partitionBytes = ((readPartition["readData"]["number"].astype("uint64")*h5file["/relations/readData"].dtype.itemsize) + 
+                 (reads*h5file["/relations/readInfo"].dtype.itemsize))
+        dtypePartitionList=[(name,partitionData.dtype[name]) for name in partitionData.dtype.names]
+        dtypePartitionList.append(("reads",haplotyping.index.Database.getUint(int(reads.max()) if numberOfPartitions>0 else 0)))
+        dtypePartitionList.append(("bytes",haplotyping.index.Database.getUint(int(partitionBytes.max()) if numberOfPartitions>0 else 0)))
+        dtPartition=np.dtype(dtypePartitionList)
+        newPartitionData = np.zeros(numberOfPartitions, dtype=dtPartition)
+        for name in partitionData.dtype.names:
+            newPartitionData[name] = partitionData[name]
+        newPartitionData["reads"] = reads
+        newPartitionData["bytes"] = partitionBytes
+        del h5file["/histogram/partition"]
+        optionsPartition=haplotyping.index.Database.getStorageOptions(
+            h5file,(numberOfPartitions,),dtPartition)
+        dsPartition=h5file["/histogram/"].create_dataset("partition",(numberOfPartitions,), 
+                                                        dtype=dtPartition, 
+                                                        **optionsPartition)
+        dsPartition[0:numberOfPartitions] = newPartitionData
+        #summary, queries for a random splitting k-mer
+        if numberOfPartitions>0:
+            ckmers = partitionData["ckmer"].astype("float64")
+            h5file["/config/"].attrs["partitionReadsMinimum"]=int(reads.min())
+            h5file["/config/"].attrs["partitionReadsMedian"]=float(np.median(reads))
+            h5file["/config/"].attrs["partitionReadsMaximum"]=int(reads.max())
+            h5file["/config/"].attrs["partitionQueryBytes"]=int(round(np.sum(ckmers*partitionBytes)/max(1,np.sum(ckmers))))
+            h5file["/config/"].attrs["partitionQueryBytesMaximum"]=int(partitionBytes.max())
+            logger.info("reads per partition {}/{}/{} (min/median/max), estimated {} bytes per query".format(
+                int(reads.min()),float(np.median(reads)),int(reads.max()),
+                h5file["/config/"].attrs["partitionQueryBytes"]))
 
 
+class Scratch:
+    
+    """
+    Internal use, temporary tables of fixed-width records in raw memory-mapped files, 
+    replacement for a temporary pytables file with the same (limited) table interface
+    """
+    
+    def __init__(self, directory: str, name: str, keepTemporaryFiles=False):
+        self._logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.name = name
+        self.keepTemporaryFiles = keepTemporaryFiles
+        self.root = type("ScratchRoot", (), {})()
+        self.tables = []
+        #statistics
+        self.ioTime = 0
+        self.bytesWritten = 0
+        self.bytesRead = 0
+        self.maximumSize = 0
+        os.makedirs(directory, exist_ok=True)
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
+    def create_table(self, where, name, description, title="", expectedrows=None):
+        if isinstance(description, dict):
+            dtype = tables.Description(description)._v_dtype
+        else:
+            dtype = np.dtype(description)
+        filename = os.path.join(self.directory,"{}_{}.scratch".format(self.name,name))
+        table = ScratchTable(self, name, filename, dtype)
+        setattr(self.root, name, table)
+        self.tables.append(table)
+        return table
+    
+    def size(self):
+        return sum([table.nrows*table.dtype.itemsize for table in self.tables])
+    
+    def flush(self):
+        pass
+    
+    def report(self, phase: str):
+        """
+        Log and reset the temporary I/O of the finished phase
+        """
+        self._logger.info("temporary storage {}: {} MB written, {} MB read, {} MB maximum, {} s I/O".format(
+            phase,round(self.bytesWritten/1048576,1),round(self.bytesRead/1048576,1),
+            round(self.maximumSize/1048576,1),round(self.ioTime,2)))
+        self.ioTime = 0
+        self.bytesWritten = 0
+        self.bytesRead = 0
+        self.maximumSize = self.size()
+            
+    def close(self):
+        for table in self.tables:
+            if not self.keepTemporaryFiles and os.path.exists(table.filename):
+                os.remove(table.filename)
+        self.tables = []
+        
+class ScratchTable:
+    
+    """
+    Internal use, single temporary table of a scratch storage
+    """
+    
+    def __init__(self, scratch: Scratch, name: str, filename: str, dtype):
+        self.scratch = scratch
+        self.name = name
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        #numpy integer, like the number of rows of a pytables table
+        self.nrows = np.int64(0)
+        open(filename, "wb").close()
+        
+    @property
+    def shape(self):
+        return (self.nrows,)
+    
+    def _memmap(self, mode="r"):
+        return np.memmap(self.filename, dtype=self.dtype, mode=mode, shape=(self.nrows,))
+        
+    def append(self, rows):
+        startTime = time.time()
+        data = np.ascontiguousarray(rows, dtype=self.dtype)
+        with open(self.filename, "ab") as f:
+            data.tofile(f)
+        self.nrows+=len(data)
+        self.scratch.ioTime+=time.time()-startTime
+        self.scratch.bytesWritten+=data.nbytes
+        self.scratch.maximumSize = max(self.scratch.maximumSize,self.scratch.size())
+        
+    def flush(self):
+        pass
+        
+    def read(self, start=None, stop=None):
+        if self.nrows==0:
+            return np.zeros(0, dtype=self.dtype)
+        startTime = time.time()
+        data = np.array(self._memmap()[start:stop])
+        self.scratch.ioTime+=time.time()-startTime
+        self.scratch.bytesRead+=data.nbytes
+        return data
+    
+    def modify_columns(self, columns, names):
+        """
+        Set the (nested) columns, like pytables a 2-dimensional array provides a row per record
+        """
+        if self.nrows==0:
+            return
+        startTime = time.time()
+        data = self._memmap("r+")
+        for i in range(len(names)):
+            field = data
+            for part in names[i].split("/"):
+                field = field[part]
+            field[:] = columns[:,i] if isinstance(columns,np.ndarray) else columns[i]
+        data.flush()
+        del data
+        self.scratch.ioTime+=time.time()-startTime
+        self.scratch.bytesWritten+=self.nrows*self.dtype.itemsize
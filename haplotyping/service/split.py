@@ -1,13 +1,43 @@
 import h5py, haplotyping, numpy as np
+try:
+    #register filters for databases with storage profile blosc-zstd
+    import hdf5plugin
+except ImportError:
+    pass
 
 class Split:
     
     #---
     
+    def _itemKey(value):
+        #k-mers are stored as fixed-width strings or as 2-bit packed words
+        if isinstance(value,bytes):
+            return value
+        elif np.ndim(value)==0:
+            return int(value)
+        else:
+            key = 0
+            for word in value.tolist():
+                key = (key<<64) | word
+            return key
+    
+    def _itemString(value, h5file: h5py.File, base=False):
+        if isinstance(value,bytes):
+            return value.decode("ascii")
+        else:
+            k = int(h5file.get("/config").attrs["k"])
+            return haplotyping.General.decode(Split._itemKey(value),k-1 if base else k)
+    
     def _findItem(item,table,start=0,number=None, cache={}):
         if number==None:
             number=table.shape[0]
-        itemBinary = bytearray(item,"utf8")
+        if table.dtype[0].kind=="S":
+            itemBinary = bytearray(item,"utf8")
+        else:
+            try:
+                itemBinary = haplotyping.General.encode(item)
+            except:
+                return (None,start,cache,)
         newCache={}
         minRowId = start
         maxRowId = number-1
@@ -27,7 +57,7 @@ class Split:
             if start>=number:
                 return (None,currentRowId,newCache,)
             currentRow = table[currentRowId]
-            currentItem = currentRow[0]        
+            currentItem = Split._itemKey(currentRow[0])
             if currentItem==itemBinary:
                 newCache[currentItem] = currentRowId
                 return (currentRow,currentRowId,newCache,)
@@ -110,7 +140,7 @@ class Split:
     def _base_result(row, h5file: h5py.File, expandCkmer=True):
         if row:
             response = {
-                "base": row[0].decode("ascii"),
+                "base": Split._itemString(row[0],h5file,True),
                 "number": int(row[1])
             }
             branches = row.dtype[2].names
@@ -139,7 +169,7 @@ class Split:
     def _kmer_result(row, h5file: h5py.File, expandBase=True):
         if row:
             response = {
-                "ckmer": row[0].decode("ascii"),
+                "ckmer": Split._itemString(row[0],h5file),
                 "split": Split._translate_type(row[1].decode("ascii")),
                 "number": int(row[2]),
                 "rightSplitBase": {
@@ -163,13 +193,13 @@ class Split:
                 if expandBase:
                     response["rightSplitBase"]["left"] = Split._base_result(baseRow,h5file,False)
                 else:
-                    response["rightSplitBase"]["left"] = baseRow[0].decode("ascii")
+                    response["rightSplitBase"]["left"] = Split._itemString(baseRow[0],h5file,True)
             if response["split"] in ["right","both"]:
                 baseRow=baseTable[row[3][1]]
                 if expandBase:
                     response["rightSplitBase"]["right"] = Split._base_result(baseRow,h5file,False)
                 else:
-                    response["rightSplitBase"]["right"] = baseRow[0].decode("ascii")            
+                    response["rightSplitBase"]["right"] = Split._itemString(baseRow[0],h5file,True)            
         else:
             response = None
         return response
@@ -177,7 +207,7 @@ class Split:
     def _kmer_direct_result(ckmerRow, directRows, h5file: h5py.File, expandBase=True):
         if (not ckmerRow==None) or (len(directRows)==0):
             response = {
-                "ckmer": ckmerRow[0].decode("ascii"),
+                "ckmer": Split._itemString(ckmerRow[0],h5file),
                 "split": Split._translate_type(ckmerRow[1].decode("ascii")),
                 "number": int(ckmerRow[2]),
                 "direct": {
@@ -197,7 +227,7 @@ class Split:
                         "number": int(directRow[2]),
                         "problem": int(directRow[4])
                     },
-                    "ckmer": ckmerRow[0].decode("ascii"),
+                    "ckmer": Split._itemString(ckmerRow[0],h5file),
                     "split": Split._translate_type(ckmerRow[1].decode("ascii")),
                     "number": int(ckmerRow[2]),
                     "rightSplitBase": {
@@ -221,7 +251,7 @@ class Split:
         if not kmerId in kmerDict:
             ckmerTable = h5file.get("/split/ckmer")
             entry = ckmerTable[kmerId]
-            return (entry[0].decode("ascii"),Split._translate_type(entry[1].decode("ascii")),
+            return (Split._itemString(entry[0],h5file),Split._translate_type(entry[1].decode("ascii")),
                                 int(entry[2]),int(entry[4][0]),int(entry[4][1][0]+entry[4][2][0]))
         return kmerDict[kmerId]
     
@@ -455,7 +485,7 @@ class Split:
             for item in pairedList:
                 if item[0]==kmerId:
                     if not item[1] in kmerDict:
-                        kmerDict[item[1]] = ckmerTable[item[1]][0].decode("ascii")
+                        kmerDict[item[1]] = Split._itemString(ckmerTable[item[1]][0],h5file)
                     response.append(kmerDict[item[1]])
         else:
             response = []
@@ -530,9 +560,7 @@ class Split:
         return Split._kmer_result(ckmerRow,h5file)
     
     def _kmers_info(h5file: h5py.File, kmers: list):
-        ckmerList = set()
-        for kmer in kmers:
-            ckmerList.add(haplotyping.General.canonical(kmer))
+        ckmerList = set(haplotyping.General.canonical_many(kmers))
         ckmerList = list(ckmerList)
         ckmerList.sort()
         response = []
@@ -562,9 +590,7 @@ class Split:
             return None
     
     def _kmers_direct(h5file: h5py.File, kmers: list):
-        ckmerList = set()
-        for kmer in kmers:
-            ckmerList.add(haplotyping.General.canonical(kmer))
+        ckmerList = set(haplotyping.General.canonical_many(kmers))
         ckmerList = list(ckmerList)
         ckmerList.sort()
         response = []
@@ -604,12 +630,9 @@ class Split:
         
     def _kmers_read(h5file: h5py.File, kmers: list, additional: list):
         ckmerList = set()
-        ckmerSet = set()
-        for kmer in kmers:
-            ckmerSet.add(haplotyping.General.canonical(kmer))
+        ckmerSet = set(haplotyping.General.canonical_many(kmers))
         ckmerList.update(ckmerSet)
-        for kmer in additional:
-            ckmerList.add(haplotyping.General.canonical(kmer))
+        ckmerList.update(haplotyping.General.canonical_many(additional))
         ckmerList = list(ckmerList)
         ckmerList.sort()
         ckmerTable = h5file.get("/split/ckmer")
@@ -652,7 +675,7 @@ class Split:
         pairedTable = h5file.get("/relations/paired")
         (ckmerRow,id,cache) = Split._findItem(ckmer,ckmerTable)
         if ckmerRow:
-            kmerDict = {id: ckmerRow[0].decode("ascii")}
+            kmerDict = {id: Split._itemString(ckmerRow[0],h5file)}
             pairedList = pairedTable[ckmerRow[8][0]:ckmerRow[8][0]+ckmerRow[8][1]]
             paired,kmerDict = Split._kmer_paired_result(id,pairedList,h5file,kmerDict)
         else:
@@ -660,9 +683,7 @@ class Split:
         return paired
         
     def _kmers_paired(h5file: h5py.File, kmers: list):
-        ckmerList = set()
-        for kmer in kmers:
-            ckmerList.add(haplotyping.General.canonical(kmer))
+        ckmerList = set(haplotyping.General.canonical_many(kmers))
         ckmerList = list(ckmerList)
         ckmerList.sort()
         ckmerTable = h5file.get("/split/ckmer")
@@ -677,7 +698,7 @@ class Split:
             ckmer = ckmerList[i]
             (ckmerRow,id,cache) = Split._findItem(ckmerList[i],ckmerTable,start,number,cache)
             if ckmerRow:
-                kmerDict[id] = ckmerRow[0].decode("ascii")
+                kmerDict[id] = Split._itemString(ckmerRow[0],h5file)
                 if ckmerRow[8][1]>0:
                     pairedList = pairedTable[ckmerRow[8][0]:ckmerRow[8][0]+ckmerRow[8][1]]
                     response[kmerDict[id]],kmerDict = Split._kmer_paired_result(id,pairedList,h5file,kmerDict)
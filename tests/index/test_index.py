@@ -1,9 +1,16 @@
 import os, sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
-import unittest, tempfile, logging, h5py, gzip, csv, shutil, pytest
+import unittest, tempfile, logging, h5py, tables, gzip, zlib, struct, csv, shutil, threading, pickle, pytest
+import ahocorasick
 import numpy as np
 from haplotyping.index.database import *
+import haplotyping.index.connections
+import haplotyping.index.fastq
+import haplotyping.index.kmc
+import haplotyping.index.splits
+import haplotyping.index.storage
+import haplotyping.service.split
 
 class IndexTestCase(unittest.TestCase):
     
@@ -12,6 +19,8 @@ class IndexTestCase(unittest.TestCase):
         
         logging.basicConfig(format="%(asctime)s | %(name)s |  %(levelname)s: %(message)s", datefmt="%m-%d-%y %H:%M:%S")
         logging.getLogger("haplotyping.index.database").setLevel(logging.ERROR)
+        #databases constructed with other options, shared by the tests
+        self.databases = {}
         
         try:
             self.serviceDataLocation = os.path.join(os.path.abspath(os.path.dirname(__file__)), "../data/testdata/")
@@ -273,7 +282,570 @@ class IndexTestCase(unittest.TestCase):
                         readFound = True
                         break
             self.assertTrue(readFound,"read not found")
-         
+
+    def test_fastq(self):
+        for filename in self.unpairedReadFiles:
+            with gzip.open(filename, "rb") as f:
+                data = f.read()
+            sequences = [line.decode().rstrip() for line in data.split(b"\n")[1::4]]
+            #same file as BGZF blocks
+            bgzfFilename = os.path.join(self.tmpDirectory.name,"reads.fastq.bgz")
+            with open(bgzfFilename, "wb") as f:
+                for i in range(0,len(data),65280):
+                    block = data[i:i+65280]
+                    compressor = zlib.compressobj(6,zlib.DEFLATED,-15)
+                    deflated = compressor.compress(block)+compressor.flush()
+                    f.write(b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"+
+                            struct.pack("<H",len(deflated)+25)+deflated+
+                            struct.pack("<II",zlib.crc32(block),len(block)))
+            for readFile in [filename,bgzfFilename]:
+                with haplotyping.index.fastq.Fastq(readFile) as reader:
+                    self.assertEqual([sequence for block in reader.sequences() for sequence in block],
+                                     sequences,"unexpected sequences from fastq reader")
+                    self.assertIsNone(reader.invalidLine,"unexpected invalid fastq-file")
+        with h5py.File(self.tmpIndexLocation,"r") as h5file:
+            for row in h5file["/config/unpairedReads"]:
+                self.assertTrue(row["throughput"]>0,"no reader throughput")
+
+    def test_searchsorted(self):
+        #exact matches from the sorted table and from the automaton with verification in the index
+        with h5py.File(self.tmpIndexLocation,"r") as h5file:
+            kmers = h5file["/split/ckmer"].fields("ckmer")[()]
+        automatonKmerSize = 12
+        filenameBase = os.path.join(self.tmpDirectory.name,"kmer.searchsorted")
+        with h5py.File(self.tmpIndexLocation,"r") as h5file:
+            (automatonMemory,indexFile,automatonFile) = haplotyping.index.splits.Splits.createAutomatonWithIndex(
+                h5file, filenameBase, automatonKmerSize)
+        automatonSplits = ahocorasick.load(automatonFile,pickle.loads)
+        words = haplotyping.General.encode_many(kmers)
+        table = haplotyping.index.storage.Storage.search_table_keys(words)
+        sequences = []
+        with gzip.open(self.unpairedReadFiles[0], "rt") as f:
+            for i, line in enumerate(f):
+                if i%4==1:
+                    sequences.append(line.strip())
+                if len(sequences)>=1000:
+                    break
+        #reverse complements and other characters
+        sequences.extend([haplotyping.General.reverse_complement(sequence) for sequence in sequences[:100]])
+        sequences.extend([sequence[:len(sequence)//2]+"N"+sequence[len(sequence)//2+1:] for sequence in sequences[:100]])
+        reads = [(sequence,haplotyping.index.storage.Storage.automaton_matches(
+                     sequence,automatonSplits,self.k,automatonKmerSize),) for sequence in sequences]
+        (found,checks) = haplotyping.index.storage.Storage.verify_matches(reads,kmers,self.k)
+        (foundPacked,checksPacked) = haplotyping.index.storage.Storage.verify_matches(
+            reads,words.reshape(len(words),-1),self.k,packedKmers=True)
+        self.assertTrue(sum([len(matches) for matches in found])>0,"no matches")
+        self.assertEqual(found,foundPacked,"unexpected matches with packed k-mers")
+        for (sequence,matches) in zip(sequences,found):
+            (searchMatches,positions) = haplotyping.index.storage.Storage.search_matches(sequence,table,self.k)
+            self.assertEqual(sorted(searchMatches),sorted(matches),"unexpected matches from sorted table")
+        #end-to-end
+        self.buildPartitionSizeDatabase()
+        self.compareDatabase("partitions.size",datasets=["/relations/direct","/relations/cycle","/relations/reversal"],
+                             partitioned=False)
+        
+    def test_packed(self):
+        self.buildStorageDatabase()
+        self.compareDatabase("storage",datasets=["/relations/direct","/relations/cycle","/relations/reversal"])
+        with h5py.File(self.tmpIndexLocation,"r") as h5fileDefault:
+            with h5py.File(os.path.join(self.tmpDirectory.name,"kmer.storage.h5"),"r") as h5file:
+                for (dataset,length) in [("/split/ckmer",self.k),("/split/base",self.k-1)]:
+                    dataDefault = h5fileDefault[dataset][()]
+                    data = h5file[dataset][()]
+                    self.assertEqual(data.dtype[0].kind,"u","{} not packed".format(dataset))
+                    self.assertTrue(np.array_equal(dataDefault[dataDefault.dtype.names[0]],
+                                    haplotyping.General.decode_many(data[data.dtype.names[0]],length)),
+                                    "packed {} differs".format(dataset))
+                    for field in dataDefault.dtype.names[1:]:
+                        self.assertTrue(np.array_equal(dataDefault[field],data[field]),
+                                        "field {} of packed {} differs".format(field,dataset))
+                    #lookup and decoding by the service
+                    table = h5file[dataset]
+                    for i in range(0,len(dataDefault),max(1,len(dataDefault)//100)):
+                        item = dataDefault[i][0].decode()
+                        (row,id,cache) = haplotyping.service.split.Split._findItem(item,table)
+                        self.assertEqual(id,i,"{} not found in packed {}".format(item,dataset))
+                        self.assertEqual(haplotyping.service.split.Split._itemString(row[0],h5file,length<self.k),
+                                         item,"unexpected {} from packed {}".format(item,dataset))
+                    (row,id,cache) = haplotyping.service.split.Split._findItem("N"*length,table)
+                    self.assertIsNone(row,"invalid k-mer found in packed {}".format(dataset))
+        
+    def test_storage(self):
+        self.buildStorageDatabase()
+        with h5py.File(self.tmpIndexLocation,"r") as h5fileDefault:
+            with h5py.File(os.path.join(self.tmpDirectory.name,"kmer.storage.h5"),"r") as h5file:
+                self.assertEqual(h5file["/config"].attrs["storageProfile"],haplotyping.index.Database.QUERY,
+                                 "unexpected storage profile")
+                for dataset in ["/split/ckmer","/split/base","/relations/direct","/relations/readData"]:
+                    self.assertEqual(h5fileDefault[dataset].compression,"gzip",
+                                     "unexpected compression {} by default".format(dataset))
+                    self.assertIsNone(h5file[dataset].compression,"unexpected compression {}".format(dataset))
+                    self.assertIsNone(h5file[dataset].chunks,"unexpected chunks {}".format(dataset))
+        
+    def test_cache(self):
+        artifactCache = os.path.join(self.tmpDirectory.name,"cache")
+        filenameBase = os.path.join(self.tmpDirectory.name,"kmer.cache")
+        def cachedKeys():
+            return sorted(set([filename.split(".")[0] for filename in os.listdir(artifactCache)]))
+        #the content hash is stored in the configuration
+        shutil.copyfile(self.tmpIndexLocation,filenameBase+".h5")
+        with h5py.File(filenameBase+".h5","a") as h5file:
+            Splits = haplotyping.index.splits.Splits
+            (automatonMemory,indexFile,automatonFile) = Splits.createAutomatonWithIndex(
+                h5file, filenameBase, 10, artifactCache)
+            keys = cachedKeys()
+            self.assertEqual(keys,[Splits.ckmerHash(h5file)+"_10"],"unexpected artifacts in cache")
+            self.assertEqual(os.path.dirname(indexFile),artifactCache,"index not in cache")
+            #reuse artifacts for identical splitting k-mers
+            with self.assertLogs("haplotyping.index.splits",level="DEBUG") as logs:
+                self.assertEqual(Splits.createAutomatonWithIndex(h5file, filenameBase, 10, artifactCache),
+                                 (automatonMemory,indexFile,automatonFile),"unexpected artifacts from cache")
+            self.assertTrue(any(["detected previously generated" in line for line in logs.output]),
+                            "artifacts from cache not reused")
+            self.assertEqual(cachedKeys(),keys,"unexpected artifacts in cache after reuse")
+            #evict artifacts for another k' exceeding the cache size
+            Splits.createAutomatonWithIndex(h5file, filenameBase, 12, artifactCache)
+            Splits.createAutomatonWithIndex(h5file, filenameBase, 12, artifactCache, 1)
+            self.assertEqual(cachedKeys(),[keys[0].rsplit("_",1)[0]+"_12"],"artifacts not evicted from cache")
+        
+    def test_ring(self):
+        (filename,logs) = self.buildWorkersDatabase()
+        self.assertTrue(any(["created shared memory rings" in line for line in logs]),"no shared memory rings")
+        self.compareDatabase("workers")
+        
+    def test_readers(self):
+        self.buildWorkersDatabase()
+        with h5py.File(self.tmpIndexLocation,"r") as h5fileDefault:
+            with h5py.File(os.path.join(self.tmpDirectory.name,"kmer.workers.h5"),"r") as h5file:
+                for dataset in ["/config/unpairedReads","/config/pairedReads"]:
+                    for field in ["readLength","readNumber","totalReadLength"]:
+                        self.assertTrue(np.array_equal(h5fileDefault[dataset][field],h5file[dataset][field]),
+                                        "{} in {} differs with reader processes".format(field,dataset))
+        
+    def test_scheduler(self):
+        (filename,logs) = self.buildWorkersDatabase()
+        self.assertTrue(any(["scheduler: move worker from matches to index" in line for line in logs]),
+                        "no logged scheduler decision")
+        
+    def test_sparse(self):
+        self.buildStorageDatabase()
+        self.compareDatabase("storage",datasets=["/relations/direct","/relations/cycle","/relations/reversal"])
+        #connections exceeding the memory of the workers are written as multiple runs
+        scratchDirectory = os.path.join(self.tmpDirectory.name,"scratch")
+        numberOfRuns = 0
+        for filename in os.listdir(scratchDirectory):
+            if filename.startswith("kmer.storage_tmp_direct_"):
+                with tables.open_file(os.path.join(scratchDirectory,filename),"r") as pytablesWorker:
+                    if "sparseRuns" in pytablesWorker.root._v_attrs:
+                        numberOfRuns = max(numberOfRuns,pytablesWorker.root._v_attrs.sparseRuns)
+        self.assertTrue(numberOfRuns>1,"no multiple runs of direct connections")
+        
+    def test_sparse_memory(self):
+        Connections = haplotyping.index.connections.Connections
+        for numberOfKmers in [10**6,10**7,5*10**8]:
+            (denseMemory,denseMaximum,) = Connections._workerMatchesMemory(
+                numberOfKmers,65535,300,8,haplotyping.index.Database.DENSE)
+            (sparseMemory,sparseMaximum,) = Connections._workerMatchesMemory(
+                numberOfKmers,65535,300,8,haplotyping.index.Database.SPARSE)
+            self.assertEqual(denseMaximum,0,"unexpected maximum for dense direct connections")
+            self.assertTrue(0<sparseMaximum<numberOfKmers,"unexpected maximum for sparse direct connections")
+            self.assertTrue(4*sparseMemory<denseMemory,"sparse memory estimate not below dense")
+            #same memory limit, only two dense matches workers fit
+            workerSharedMemory = numberOfKmers*10
+            maximumMemory = workerSharedMemory + 2*denseMemory
+            distribution = {}
+            for (directAccumulator,workerMatchesMemory,) in [("dense",denseMemory),("sparse",sparseMemory)]:
+                distribution[directAccumulator] = Connections._distributeWorkers(
+                    11,haplotyping.index.Database.AUTOMATON,maximumMemory,workerSharedMemory,0,workerMatchesMemory,0)
+                self.assertTrue(distribution[directAccumulator][3]<=maximumMemory,"estimated memory exceeds limit")
+            self.assertEqual(distribution["dense"][1],2,"unexpected number of dense matches workers")
+            self.assertTrue(distribution["sparse"][1]>distribution["dense"][1],
+                            "no more matches workers for sparse direct connections")
+        
+    def test_merge(self):
+        #direct connections from multiple matches workers
+        (filename,logs) = self.buildWorkersDatabase()
+        numbers = [int(line.split("merge ")[1].split(" ")[0]) for line in logs 
+                   if "files with direct connections" in line]
+        self.assertTrue(len(numbers)>0 and numbers[0]>1,"no multiple files with direct connections merged")
+        self.compareDatabase("workers",datasets=["/split/ckmer","/relations/direct","/relations/cycle",
+                                                 "/relations/reversal"])
+        
+    def test_scratch(self):
+        #temporary tables like pytables
+        scratchDirectory = os.path.join(self.tmpDirectory.name,"scratch.tables")
+        description = {"ckmer": tables.StringCol(itemsize=self.k,pos=0),
+                       "number": tables.UInt16Col(pos=1),
+                       "direct": {"left": tables.UInt8Col(pos=0), "right": tables.UInt8Col(pos=1)}}
+        rng = np.random.default_rng(0)
+        with tables.open_file(os.path.join(self.tmpDirectory.name,"kmer.scratch.tables.h5"),"w") as pytablesStorage, \
+             haplotyping.index.storage.Scratch(scratchDirectory,"kmer.scratch") as scratchStorage:
+            for storage in [pytablesStorage,scratchStorage]:
+                storage.create_table(storage.root,"test",description)
+            data = np.zeros(1000, dtype=pytablesStorage.root.test.dtype)
+            data["ckmer"] = [("".join(rng.choice(list("ACGT"),self.k))).encode() for i in range(len(data))]
+            data["number"] = rng.integers(0,1000,len(data))
+            data["direct"]["left"] = rng.integers(0,4,len(data))
+            for storage in [pytablesStorage,scratchStorage]:
+                self.assertEqual(storage.root.test.read().dtype,pytablesStorage.root.test.dtype,"unexpected dtype")
+                storage.root.test.append(data[:600])
+                storage.root.test.append(data[600:])
+                storage.root.test.modify_columns(columns=np.array([data["direct"]["left"][::-1],data["direct"]["left"]]).T,
+                                                 names=["direct/left","direct/right"])
+            self.assertEqual(scratchStorage.root.test.nrows,pytablesStorage.root.test.nrows,"unexpected number of rows")
+            self.assertEqual(scratchStorage.root.test.shape,pytablesStorage.root.test.shape,"unexpected shape")
+            for (start,stop) in [(None,None),(0,10),(500,700),(990,2000)]:
+                self.assertTrue(np.array_equal(scratchStorage.root.test.read(start,stop),
+                                               pytablesStorage.root.test.read(start,stop)),
+                                "unexpected rows from scratch storage")
+            self.assertEqual(scratchStorage.size(),len(data)*data.dtype.itemsize,"unexpected size")
+            with self.assertLogs("haplotyping.index.storage",level="INFO") as logs:
+                scratchStorage.report("test")
+            self.assertTrue(any(["temporary storage test" in line for line in logs.output]),
+                            "no temporary storage reported")
+            self.assertTrue(os.path.exists(scratchStorage.root.test.filename),"no scratch file")
+        self.assertFalse(os.path.exists(scratchStorage.root.test.filename),"scratch file not removed")
+        #end-to-end
+        (filename,logs) = self.buildStorageDatabase()
+        scratchDirectory = os.path.join(self.tmpDirectory.name,"scratch")
+        self.assertTrue(any(["temporary storage" in line for line in logs]),"no temporary storage reported")
+        self.assertTrue(any([filename.startswith("kmer.storage_tmp") for filename in os.listdir(scratchDirectory)]),
+                        "no temporary files in scratch directory")
+        self.assertFalse(any([filename.startswith("kmer.storage_tmp") 
+                              for filename in os.listdir(self.tmpDirectory.name)]),
+                         "temporary files outside scratch directory")
+        
+    def test_partitioner(self):
+        #two cliques connected by a single edge
+        fromLinks = np.array([i for c in range(2) for i in range(10*c,10*c+10) 
+                              for j in range(10*c,10*c+10) if not i==j]+[9,10], dtype="int64")
+        toLinks = np.array([j for c in range(2) for i in range(10*c,10*c+10) 
+                            for j in range(10*c,10*c+10) if not i==j]+[10,9], dtype="int64")
+        (indptr,indices) = haplotyping.index.storage.Storage.csr_graph(fromLinks,toLinks,20)
+        for partitioner in [haplotyping.index.Database.METIS,haplotyping.index.Database.NETWORKIT]:
+            partitions = haplotyping.index.storage.Storage.partition_graph(indptr,indices,2,partitioner)
+            self.assertEqual(len(partitions),20,"unexpected number of nodes with {}".format(partitioner))
+            self.assertEqual(len(set(partitions[:10])),1,"clique split with {}".format(partitioner))
+            self.assertEqual(len(set(partitions[10:])),1,"clique split with {}".format(partitioner))
+            self.assertNotEqual(partitions[0],partitions[10],"cliques not separated with {}".format(partitioner))
+            self.assertTrue(np.array_equal(haplotyping.index.storage.Storage.partition_graph(indptr,indices,1,partitioner),
+                                           np.zeros(20)),"unexpected single partition with {}".format(partitioner))
+        self.assertRaises(Exception,haplotyping.index.storage.Storage.partition_graph,indptr,indices,2,"unknown")
+        
+    def test_partitions(self):
+        datasets = ["/relations/direct","/relations/cycle","/relations/reversal"]
+        with h5py.File(self.tmpIndexLocation,"r") as h5fileDefault:
+            numberOfKmers = h5fileDefault["/split/ckmer"].shape[0]
+            defaultNumberOfPartitions = h5fileDefault["/config"].attrs["numberPartitions"]
+        #a maximum number of partitions, or the equivalent partition size
+        self.buildPartitionMaximumDatabase()
+        self.buildPartitionSizeDatabase()
+        self.compareDatabase("partitions.maximum",datasets=datasets,partitioned=False)
+        with h5py.File(os.path.join(self.tmpDirectory.name,"kmer.partitions.maximum.h5"),"r") as h5file:
+            numberOfPartitions = h5file["/config"].attrs["numberPartitions"]
+            self.assertTrue(1<numberOfPartitions<defaultNumberOfPartitions,"number of partitions not reduced")
+            #partition quality report
+            partitionData = h5file["/histogram/partition"][()]
+            readPartition = h5file["/relations/readPartition"][()]
+            self.assertEqual(len(partitionData),numberOfPartitions,"unexpected partition histogram")
+            self.assertEqual(partitionData["ckmer"].sum(),numberOfKmers,
+                             "unexpected number of k-mers in partition histogram")
+            self.assertTrue(np.array_equal(partitionData["reads"],readPartition["readInfo"]["number"]),
+                            "unexpected number of reads in partition histogram")
+            self.assertTrue(np.array_equal(partitionData["bytes"]>0,partitionData["reads"]>0),
+                            "unexpected estimated bytes in partition histogram")
+            self.assertEqual(partitionData["cut"].sum(),2*h5file["/config"].attrs["partitionEdgeCut"],
+                             "unexpected edge cut")
+            self.assertEqual(h5file["/config"].attrs["partitionReadsMinimum"],partitionData["reads"].min(),
+                             "unexpected minimum reads per partition")
+            self.assertEqual(h5file["/config"].attrs["partitionReadsMaximum"],partitionData["reads"].max(),
+                             "unexpected maximum reads per partition")
+            self.assertTrue(h5file["/config"].attrs["partitionQueryBytes"]<=
+                            h5file["/config"].attrs["partitionQueryBytesMaximum"],"unexpected bytes per query")
+            with h5py.File(os.path.join(self.tmpDirectory.name,"kmer.partitions.size.h5"),"r") as h5fileSize:
+                self.assertTrue(np.array_equal(h5file["/split/ckmer"].fields("partition")[()],
+                                               h5fileSize["/split/ckmer"].fields("partition")[()]),
+                                "partitions differ for equivalent partition size")
+        
+    def test_filter(self):
+        self.buildStorageDatabase()
+        scratchDirectory = os.path.join(self.tmpDirectory.name,"scratch")
+        #k-mer properties and direct connections as provided to the workers
+        with h5py.File(os.path.join(self.tmpDirectory.name,"kmer.storage.h5"),"r") as h5file:
+            ckmers = h5file["/split/ckmer"][()]
+            direct = h5file["/relations/direct"][()]
+        kmer_properties = np.zeros(len(ckmers), dtype=[("partition","uint64"),("number","uint64"),
+                                                       ("reference","uint64"),("numberLeftRight","uint8")])
+        kmer_properties["partition"] = ckmers["partition"]
+        kmer_properties["number"] = ckmers["number"]
+        kmer_properties["reference"] = ckmers["direct"]["link"]
+        kmer_properties["numberLeftRight"] = ckmers["direct"]["left"]["distinct"]+ckmers["direct"]["right"]["distinct"]
+        direct_properties = np.zeros(len(direct), dtype=[("ckmer","uint64"),("info","uint8")])
+        direct_properties["ckmer"] = direct["to"]["ckmerLink"]
+        direct_properties["info"] = ((direct["from"]["direction"]==b"r")+2*(direct["to"]["direction"]==b"r")+
+                                     4*(direct["problematic"]>0))
+        (filterReadData,filterReadBatch,) = haplotyping.index.storage.Storage.read_filters(kmer_properties,direct_properties)
+        #raw reads from the workers
+        lengths = []
+        paired = []
+        rawData = []
+        for filename in sorted(os.listdir(scratchDirectory)):
+            if filename.startswith("kmer.storage_tmp_reads_"):
+                with tables.open_file(os.path.join(scratchDirectory,filename),"r") as pytablesWorker:
+                    lengths.extend(pytablesWorker.root.readRawInfo.col("length"))
+                    paired.extend(pytablesWorker.root.readRawInfo.col("paired"))
+                    rawData.extend(pytablesWorker.root.readRawData[()])
+        self.assertTrue(any([value>0 for value in paired]),"no paired reads")
+        #introduce unknown k-mers (repairs) and replace k-mers (breaks)
+        rng = np.random.default_rng(0)
+        reads = []
+        offset = 0
+        for (i,length) in enumerate(lengths):
+            read = list(rawData[offset:offset+length])
+            offset+=length
+            if length>4 and i%3==1:
+                read.insert(length//2,rng.integers(len(ckmers)))
+            elif length>4 and i%3==2:
+                read[length//2] = rng.integers(len(ckmers))
+            reads.append(read)
+        lengths = np.array([len(read) for read in reads], dtype="int64")
+        rawData = np.array(sum(reads,[]), dtype="uint64")
+        #compare batches with single reads
+        (filteredBatch,repairsBatch,breaksBatch,) = filterReadBatch(rawData,lengths)
+        repairs = 0
+        breaks = 0
+        for (read,filteredRead) in zip(reads,filteredBatch):
+            (filtered,repairs,breaks,) = filterReadData(np.array(read,dtype=rawData.dtype),repairs,breaks)
+            self.assertEqual([[int(nodeId) for nodeId in entry] for entry in filteredRead],
+                             [[int(nodeId) for nodeId in entry] for entry in filtered],"unexpected filtered read")
+        self.assertTrue(any([len(filteredRead)>0 for filteredRead in filteredBatch]),"no filtered reads")
+        self.assertTrue(repairs>0,"no repairs")
+        self.assertTrue(breaks>0,"no breaks")
+        self.assertEqual(repairsBatch,repairs,"unexpected number of repairs")
+        self.assertEqual(breaksBatch,breaks,"unexpected number of breaks")
+
+    def buildDatabase(self, name, **options):
+        """
+        Construct the database with other options once, shared by the tests, returns the location and the logs
+        """
+        if not name in self.databases:
+            filenameBase = os.path.join(self.tmpDirectory.name,"kmer."+name)
+            with self.assertLogs("haplotyping.index",level="DEBUG") as logs:
+                haplotyping.index.Database(self.k, self.name, filenameBase, self.sortedListLocation, 
+                                           self.unpairedReadFiles, self.pairedReadFiles,
+                                           minimumFrequency=self.minimumFrequency, **options)
+            self.databases[name] = (filenameBase+".h5",logs.output,)
+        return self.databases[name]
+    
+    def buildWorkersDatabase(self):
+        """
+        Database with reads passed in shared memory, multiple readers and adaptive workers, 
+        any index backlog moves a worker with frequent decisions
+        """
+        Connections = haplotyping.index.connections.Connections
+        settings = (Connections.schedulerInterval,Connections.schedulerBacklog,Connections.schedulerCooldown)
+        try:
+            (Connections.schedulerInterval,Connections.schedulerBacklog,Connections.schedulerCooldown) = (0.1,-1,0)
+            return self.buildDatabase("workers",readTransport=haplotyping.index.Database.SHAREDMEMORY,
+                                      readBatchSize=100,readerProcesses=2,adaptiveWorkers=True,maximumProcesses=8)
+        finally:
+            (Connections.schedulerInterval,Connections.schedulerBacklog,Connections.schedulerCooldown) = settings
+    
+    def buildStorageDatabase(self):
+        """
+        Database with packed k-mers, the query storage profile, sparse direct connections in multiple runs
+        and temporary files kept in a scratch directory
+        """
+        Connections = haplotyping.index.connections.Connections
+        sparseDirectFraction = Connections.sparseDirectFraction
+        try:
+            Connections.sparseDirectFraction = 0.05
+            return self.buildDatabase("storage",packedKmers=True,storageProfile=haplotyping.index.Database.QUERY,
+                                      directAccumulator=haplotyping.index.Database.SPARSE,
+                                      scratchDirectory=os.path.join(self.tmpDirectory.name,"scratch"),
+                                      keepTemporaryFiles=True)
+        finally:
+            Connections.sparseDirectFraction = sparseDirectFraction
+    
+    def buildPartitionMaximumDatabase(self):
+        """
+        Database with a maximum number of partitions and a calibrated automaton
+        """
+        return self.buildDatabase("partitions.maximum",maximumPartitions=10,calibrateAutomaton=True)
+    
+    def buildPartitionSizeDatabase(self):
+        """
+        Database with a partition size equivalent to the maximum number of partitions, matched with the sorted table
+        """
+        with h5py.File(self.tmpIndexLocation,"r") as h5fileDefault:
+            numberOfKmers = h5fileDefault["/split/ckmer"].shape[0]
+        return self.buildDatabase("partitions.size",partitionSize=numberOfKmers//10,
+                                  matchEngine=haplotyping.index.Database.SEARCHSORTED)
+        
+    def compareDatabase(self, name, datasets=["/split/ckmer","/relations/direct"], partitioned=True):
+        """
+        Compare datasets and reads for each partition, or otherwise the distinct reads, 
+        with the database constructed with default options
+        """
+        filenameBase = os.path.join(self.tmpDirectory.name,"kmer."+name)
+        def partitionReads(h5file):
+            readData = h5file["/relations/readData"][()]
+            readInfo = h5file["/relations/readInfo"][()]
+            partitions = []
+            for row in h5file["/relations/readPartition"]:
+                position = row[0][0]
+                reads = []
+                for infoRow in readInfo[row[1][0]:row[1][0]+row[1][1]]:
+                    reads.append(tuple(readData[position:position+infoRow[0]]))
+                    position+=infoRow[0]
+                partitions.append(sorted(reads))
+            return partitions
+        with h5py.File(self.tmpIndexLocation,"r") as h5fileDefault:
+            with h5py.File(filenameBase+".h5","r") as h5file:
+                for dataset in datasets:
+                    self.assertTrue(np.array_equal(h5fileDefault[dataset][()],h5file[dataset][()]),
+                                    "{} differs with {}".format(dataset,name))
+                if partitioned:
+                    self.assertEqual(partitionReads(h5fileDefault),partitionReads(h5file),
+                                     "reads in partitions differ with {}".format(name))
+                else:
+                    self.assertEqual(sorted(set(sum(partitionReads(h5fileDefault),[]))),
+                                     sorted(set(sum(partitionReads(h5file),[]))),
+                                     "reads differ with {}".format(name))
+        
+    def createKmcDatabase(location, kmers, numbers, k, prefixLength=3, signatureLength=5, numberOfBins=4):
+        """
+        Write k-mers as a canonical KMC 2 database, bins are assigned randomly as KMC does with signatures
+        """
+        codes = np.searchsorted(np.frombuffer(b"ACGT",dtype="uint8"),
+                                np.frombuffer(b"".join(kmers),dtype="uint8").reshape(-1,k)).astype("uint8")
+        order = np.lexsort(tuple(codes[:,i] for i in range(k-1,-1,-1)))
+        codes = codes[order]
+        numbers = np.asarray(numbers,dtype="<u4")[order]
+        bins = np.random.default_rng(0).integers(0,numberOfBins,len(codes))
+        order = np.argsort(bins, kind="stable")
+        codes = codes[order]
+        numbers = numbers[order]
+        prefixes = np.zeros(len(codes), dtype="int64")
+        for i in range(prefixLength):
+            prefixes = (prefixes<<2) | codes[:,i]
+        lookupTable = np.searchsorted(bins[order]*(4**prefixLength)+prefixes,
+                                      np.arange(numberOfBins*(4**prefixLength)))
+        suffixes = codes[:,prefixLength:].reshape(len(codes),-1,4)
+        suffixes = (suffixes[:,:,0]<<6) | (suffixes[:,:,1]<<4) | (suffixes[:,:,2]<<2) | suffixes[:,:,3]
+        header = (struct.pack("<7IQI",k,0,4,prefixLength,signatureLength,1,2**32-1,len(codes),0)
+                  + bytes(24) + struct.pack("<I",0x200))
+        with open(location+".kmc_pre","wb") as f:
+            f.write(b"KMCP")
+            f.write(lookupTable.astype("<u8").tobytes())
+            f.write(struct.pack("<Q",len(codes)))
+            f.write(np.zeros((4**signatureLength)+1,dtype="<u4").tobytes())
+            f.write(header)
+            f.write(struct.pack("<I4s",len(header),b"KMCP"))
+        with open(location+".kmc_suf","wb") as f:
+            f.write(b"KMCS")
+            f.write(np.concatenate((suffixes,numbers.view("uint8").reshape(-1,4)),axis=1).tobytes())
+            f.write(b"KMCS")
+        
+    def test_kmc(self):
+        with gzip.open(self.sortedListLocation, "rt") as f: 
+            sortedList = [(line[0].encode(),int(line[1]),) for line in csv.reader(f, delimiter="\t")]
+        canonicalList = [(kmer,number,) for kmer,number in sortedList 
+                         if kmer.decode()==haplotyping.General.canonical(kmer.decode())]
+        kmcLocation = os.path.join(self.tmpDirectory.name,"kmer.test")
+        IndexTestCase.createKmcDatabase(kmcLocation,[item[0] for item in canonicalList],
+                                        [item[1] for item in canonicalList],self.k)
+        #header and lookup tables
+        Kmc = haplotyping.index.kmc.Kmc
+        kmc = Kmc(kmcLocation+".kmc_suf")
+        self.assertEqual(kmc.k,self.k,"unexpected k-mer size KMC database")
+        self.assertTrue(kmc.canonical,"KMC database should be canonical")
+        self.assertEqual(kmc.numberOfKmers,len(canonicalList),"unexpected number of k-mers KMC database")
+        self.assertEqual(kmc.numberOfBins,4,"unexpected number of bins KMC database")
+        #sorted blocks over multiple buckets, including reverse complements
+        stepSizes = (Kmc.stepSizeRead,Kmc.stepSizeBucket,Kmc.stepSizeBlock)
+        try:
+            (Kmc.stepSizeRead,Kmc.stepSizeBucket,Kmc.stepSizeBlock) = (10000,20000,5000)
+            kmcList = []
+            previousBase = None
+            for kmers,numbers in kmc.kmers(self.tmpDirectory.name):
+                self.assertNotEqual(kmers[0][:-1],previousBase,"k-mers with the same base in multiple blocks")
+                previousBase = kmers[-1][:-1]
+                kmcList.extend(zip(kmers.tolist(),numbers.tolist()))
+        finally:
+            (Kmc.stepSizeRead,Kmc.stepSizeBucket,Kmc.stepSizeBlock) = stepSizes
+        self.assertEqual(kmcList,sorted(sortedList),"k-mers from KMC database differ from sorted list")
+        #splitting k-mers from KMC database and sorted list
+        self.compareSplits(kmcLocation,"kmc")
+        
+    def test_stream(self):
+        #uncompressed list
+        listLocation = os.path.join(self.tmpDirectory.name,"kmer.list.sorted")
+        with gzip.open(self.sortedListLocation,"rb") as f, open(listLocation,"wb") as g:
+            shutil.copyfileobj(f,g)
+        self.compareSplits(listLocation,"uncompressed")
+        #named pipe, written by another thread, in multiple blocks, and again from the same named pipe
+        streamLocation = os.path.join(self.tmpDirectory.name,"kmer.list.stream")
+        os.mkfifo(streamLocation)
+        def writeStream():
+            with open(listLocation,"rb") as f, open(streamLocation,"wb") as g:
+                shutil.copyfileobj(f,g)
+        stepSizeList = haplotyping.index.splits.Splits.stepSizeList
+        for name in ["stream","stream.repeated"]:
+            thread = threading.Thread(target=writeStream, daemon=True)
+            thread.start()
+            try:
+                haplotyping.index.splits.Splits.stepSizeList = 65536
+                self.compareSplits(streamLocation,name)
+            finally:
+                haplotyping.index.splits.Splits.stepSizeList = stepSizeList
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive(),"stream not completely read")
+        
+    def compareSplits(self, sortedIndexFile, name, **options):
+        """
+        Compare splitting k-mers from another sorted index or with other options 
+        with splitting k-mers from the sorted list
+        """
+        for (name,sortedIndexFile,options) in [("list",self.sortedListLocation,{}),(name,sortedIndexFile,options)]:
+            filenameBase = os.path.join(self.tmpDirectory.name,"split."+name)
+            if not os.path.exists(filenameBase+".h5"):
+                #detect the k-mer size from the sorted index
+                haplotyping.index.Database(None, self.name, filenameBase, sortedIndexFile, 
+                                           minimumFrequency=self.minimumFrequency,
+                                           indexType=haplotyping.index.Database.ONLYSPLITTINGKMERS, **options)
+        with h5py.File(os.path.join(self.tmpDirectory.name,"split.list.h5"),"r") as h5fileList:
+            with h5py.File(filenameBase+".h5","r") as h5file:
+                self.assertEqual(h5file["/config"].attrs["k"],self.k,"unexpected k-mer size from "+name)
+                for dataset in ["/split/ckmer","/split/base"]:
+                    self.assertTrue(dataset in h5file,"no {} from {}".format(dataset,name))
+                    self.assertTrue(np.array_equal(h5fileList[dataset][()],h5file[dataset][()]),
+                                    "{} from {} differs from sorted list".format(dataset,name))
+        
+    def test_sort(self):
+        #sorted runs spilled to disk and merged
+        stepSizeStorage = haplotyping.index.splits.Splits.stepSizeStorage
+        try:
+            haplotyping.index.splits.Splits.stepSizeStorage = 1000
+            with self.assertLogs("haplotyping.index.splits",level="DEBUG") as logs:
+                self.compareSplits(self.sortedListLocation,"spill",maximumMemory=2000000)
+        finally:
+            haplotyping.index.splits.Splits.stepSizeStorage = stepSizeStorage
+        self.assertTrue(any(["sorted runs" in line for line in logs.output]),"no sorted runs spilled to disk")
+        
+    def test_calibration(self):
+        (filename,logs) = self.buildPartitionMaximumDatabase()
+        with h5py.File(self.tmpIndexLocation,"r") as h5fileDefault:
+            self.assertFalse("automatonCalibration" in h5fileDefault["/config"],"unexpected calibration by default")
+            with h5py.File(filename,"r") as h5file:
+                self.assertTrue("automatonCalibration" in h5file["/config"],"no automaton calibration")
+                calibration = h5file["/config/automatonCalibration"][()]
+                self.assertTrue(h5file["/config"].attrs["automatonKmerSizeCalibrated"] 
+                                in calibration["automatonKmerSize"],"selected k' not calibrated")
+                self.assertEqual(h5file["/config"].attrs["automatonKmerSize"],0,"calibrated k' stored as fixed")
+                self.assertEqual(h5fileDefault["/relations/direct"].shape,h5file["/relations/direct"].shape,
+                                 "number of direct relations differs with calibration")
+        
     @classmethod
     def tearDownClass(self):
         if self.tmpDirectory:            
@@ -2,6 +2,7 @@ import os, sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 import unittest
+import numpy as np
 from haplotyping.general import *
 
 class GeneralTestCase(unittest.TestCase):
@@ -27,6 +28,34 @@ class GeneralTestCase(unittest.TestCase):
                          self.canonicalExampleKmer,"incorrect canonical")
         self.assertRaises(Exception,General.canonical, self.exampleInvalidKmer)
         
+    def test_many(self):
+        kmers = [self.exampleKmer, self.reverseComplementExampleKmer]
+        self.assertEqual(General.reverse_complement_many(kmers),
+                         [self.reverseComplementExampleKmer, self.exampleKmer],"incorrect reverse complement")
+        self.assertEqual(General.canonical_many(kmers),
+                         [self.canonicalExampleKmer, self.canonicalExampleKmer],"incorrect canonical")
+        self.assertEqual(list(General.canonical_many(np.array(kmers, dtype="S"))),
+                         [self.canonicalExampleKmer.encode(), self.canonicalExampleKmer.encode()],
+                         "incorrect canonical")
+        self.assertRaises(Exception,General.reverse_complement_many, [self.exampleKmer, self.exampleInvalidKmer])
+        self.assertRaises(Exception,General.canonical_many, [self.exampleKmer, self.exampleInvalidKmer])
+        
+    def test_encode(self):
+        self.assertEqual(General.encode(self.exampleKmer),0b00000000010101101011,"incorrect encoding")
+        self.assertEqual(General.decode(General.encode(self.exampleKmer),len(self.exampleKmer)),
+                         self.exampleKmer,"incorrect decoding")
+        self.assertRaises(Exception,General.encode, self.exampleInvalidKmer)
+        longKmers = sorted([self.exampleKmer*4, self.reverseComplementExampleKmer*4, "T"*40])
+        for kmers in [[self.exampleKmer,self.reverseComplementExampleKmer],longKmers]:
+            values = General.encode_many(kmers)
+            self.assertEqual([kmer.decode() for kmer in General.decode_many(values,len(kmers[0]))],
+                             kmers,"incorrect decoding")
+            self.assertEqual([General.decode(value,len(kmers[0])) for value in values],
+                             kmers,"incorrect decoding")
+            self.assertEqual([General.encode(kmer) for kmer in kmers],
+                             sorted([General.encode(kmer) for kmer in kmers]),"incorrect order")
+        self.assertRaises(Exception,General.encode_many, [self.exampleInvalidKmer])
+        
     def tearDown(self):
         pass
     